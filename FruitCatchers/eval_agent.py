@@ -1,39 +1,102 @@
 # eval_agent.py
+import json
+import os
+import random
 import sys
 import time
 import pygame
-from stable_baselines3 import PPO, A2C
 from fruit_env_full import FruitCatchFullEnv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rl_common.inference_server import load_model
+from rl_common.policies import BACKENDS
+from rl_common.registry import RunRegistry, model_file
+
+
+class EpisodeTracker:
+    """Per-episode metrics for headless evaluation (see rl_common.tournament)."""
+
+    def __init__(self):
+        self.ep_reward = 0.0
+        self.steps = 0
+
+    def step(self, action, reward, info):
+        self.ep_reward += reward
+        self.steps += 1
+
+    def finish(self, done, trunc, info, score=0):
+        return {
+            "reward": float(self.ep_reward),
+            "score": int(score),
+            "steps": self.steps,
+            "crashed": int(done),
+            "truncated": int(trunc),
+        }
+
+
+def run_episode(model, max_steps=5000, seed=None, action_repeat=1, fast_forward=False):
+    # The game draws from the global `random` module, so that is what gets seeded.
+    # Power-up timing uses the wall clock unless fast_forward is on, so only then is an episode repeatable.
+    if seed is not None:
+        random.seed(seed)
+    env = FruitCatchFullEnv(render_mode=False, action_repeat=action_repeat, fast_forward=fast_forward)
+    obs, info = env.reset()
+    done = trunc = False
+    tracker = EpisodeTracker()
+
+    while not (done or trunc):
+        action, _ = model.predict(obs, deterministic=True)
+        obs, r, done, trunc, info = env.step(action)
+        tracker.step(action, r, info)
+        trunc = trunc or (not done and tracker.steps >= max_steps)
+
+    return tracker.finish(done, trunc, info, score=env.score)
+
+
 def main():
     # Command-line argument handling
-    if len(sys.argv) < 2:
-        print("Usage: python eval_agent.py [ppo_10 | a2c | ppo_lr5e5]")
+    args = sys.argv[1:]
+    server = None
+    if "--server" in args:
+        # Get actions from a running rl_common.inference_server instead of loading the model
+        i = args.index("--server")
+        server = args[i + 1] if i + 1 < len(args) else "default"
+        del args[i:i + 2]
+    backend = "sb3"
+    if "--backend" in args:
+        # Inference backend the model is loaded with (see rl_common.policies)
+        i = args.index("--backend")
+        backend = args[i + 1] if i + 1 < len(args) else ""
+        del args[i:i + 2]
+        if backend not in BACKENDS:
+            print(f"Unknown backend '{backend}', choose one of: {', '.join(BACKENDS)}")
+            return
+    if not args:
+        print("Usage: python eval_agent.py [ppo_10 | a2c | ppo_lr5e5 | <registry query>] [--server ADDRESS] "
+              "[--backend NAME]")
         return
 
-    model_name = sys.argv[1].lower()
-
-    # Map argument to model file paths
-    model_paths = {
-        "ppo_10": "models/ppo_fruit_10.zip",   # my best PPO model
-        "a2c": "models/a2c_fruit.zip",
-        "ppo_lr5e5": "models/ppo_fruit_lr5e5.zip"
-    }
+    # A bare model name or any registry query, e.g. "algo=PPO best=train_ep_rew_mean"
+    model_name = " ".join(args)
 
-    if model_name not in model_paths:
-        print(f"Unknown model '{model_name}'. Choose one of: {list(model_paths.keys())}")
+    registry = RunRegistry()
+    try:
+        run = registry.resolve_run(f"game=FruitCatchers {model_name}")
+    except LookupError as e:
+        names = [r["name"] for r in registry.find(["game=FruitCatchers"], has_model=True)]
+        print(f"{e}. Choose one of: {names}")
         return
+    finally:
+        registry.close()
 
-    model_path = model_paths[model_name]
+    model_path = model_file(run)
 
-    # Load the correct model (PPO or A2C)
-    if "a2c" in model_name:
-        model = A2C.load(model_path)
-    else:
-        model = PPO.load(model_path)
+    # The sb3 backend loads PPO or A2C, whichever saved the model
+    model = load_model(model_path[:-len(".zip")], server, backend)
 
-    # Create the environment 
-    env = FruitCatchFullEnv(render_mode=True)
+    # Create the environment, repeating actions for as many frames as in training
+    action_repeat = json.loads(run["config"] or "{}").get("action_repeat", 1)
+    env = FruitCatchFullEnv(render_mode=True, action_repeat=action_repeat)
     obs, _ = env.reset()
     score = 0
 
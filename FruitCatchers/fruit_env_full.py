@@ -10,9 +10,18 @@ import time
 from main import (
     Fruit, Bomb,
     screen_w, screen_h,
-    draw_background, draw_basket, display_score, display_powerup_status,
+    SKY_BLUE, GRASS_GREEN, BLACK, BLUE,
     basket_w, basket_h, base_gravity, basket_speed
 )
+import main  # Bomb.update reads main's global gravity
+
+
+def _accumulate(start, steps, n):
+    """The n values `start += step` goes through, step by step; np.cumsum adds in the same order."""
+    values = np.empty(n + 1)
+    values[0] = start
+    values[1:] = steps
+    return np.cumsum(values)[1:]
 
 
 class FruitCatchFullEnv(gym.Env):
@@ -20,16 +29,27 @@ class FruitCatchFullEnv(gym.Env):
     Full RL environment that mirrors the playable Fruit Catchers game.
     Controls:
       0 = left, 1 = right, 2 = up, 3 = down, 4 = power-up
+
+    With fast_forward=True time is counted in frames (60 a second) instead of
+    read from the wall clock, and a step whose action changes nothing (the
+    power-up while it isn't available, or a move into the edge of the area)
+    runs on to the next event in one go, at most max_skip frames; see _skip.
     """
 
-    metadata = {"render_modes": ["human"], "render_fps": 60}
+    metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 60}
 
-    def __init__(self, render_mode=False, persona="survivor"):
+    def __init__(self, render_mode=False, persona="survivor", action_repeat=1, fast_forward=False, max_skip=3600):
         super().__init__()
+        if action_repeat < 1:
+            raise ValueError(f"action_repeat must be at least 1, got {action_repeat}")
         self.persona = persona
+        # Frames simulated per step() with the same action
+        self.action_repeat = action_repeat
+        self.fast_forward = fast_forward
+        self.max_skip = max_skip
         pygame.init()
         self.render_mode = render_mode
-        if self.render_mode:
+        if self.render_mode and self.render_mode != "rgb_array":
             self.screen = pygame.display.set_mode((screen_w, screen_h))
             pygame.display.set_caption("AI Playing - Fruit Catchers")
         else:
@@ -43,9 +63,16 @@ class FruitCatchFullEnv(gym.Env):
 
         # Clock and initial reset
         self.clock = pygame.time.Clock()
+        self._renderer = None
         self.reset()
 
     # Methods
+    def _now(self):
+        # Fast-forwarded frames take no wall time, so that mode keeps time in frames
+        if self.fast_forward:
+            return self.frames / self.metadata["render_fps"]
+        return time.time()
+
     def _get_obs(self):
         f1x = np.clip(self.fruits[0].x / screen_w, 0.0, 1.0)
         f1y = np.clip(self.fruits[0].y / screen_h, 0.0, 1.0)
@@ -53,7 +80,7 @@ class FruitCatchFullEnv(gym.Env):
         f2y = np.clip(self.fruits[1].y / screen_h, 0.0, 1.0)
         bx = np.clip(self.basket_x / screen_w, 0.0, 1.0)
         by = np.clip(self.basket_y / screen_h, 0.0, 1.0)
-        cooldown = np.clip((time.time() - self.last_powerup_time) / self.powerup_cooldown, 0.0, 1.0)
+        cooldown = np.clip((self._now() - self.last_powerup_time) / self.powerup_cooldown, 0.0, 1.0)
         active = 1.0 if self.powerup_active else 0.0
         return np.array([f1x, f1y, f2x, f2y, bx, by, cooldown, active], dtype=np.float32)
 
@@ -64,6 +91,7 @@ class FruitCatchFullEnv(gym.Env):
         self.basket_y = screen_h - basket_h - 40
         self.score = 0
         self.done = False
+        self.frames = 0
 
         # game physics
         self.gravity = base_gravity
@@ -83,36 +111,63 @@ class FruitCatchFullEnv(gym.Env):
         return self._get_obs(), {}
 
     def step(self, action):
-        reward = 0.0
-        info = {}
-        current_time = time.time()
-        
-        # Basket movement 
+        drawn = self.render_mode and self.render_mode != "rgb_array"
+        if self.fast_forward and not drawn and self._idle(action):
+            reward, frames = self._skip(action)
+        else:
+            # The action is repeated for action_repeat frames, stopping early if a bomb is hit
+            reward, frames = 0.0, 0
+            for _ in range(self.action_repeat):
+                reward += self._frame(action)
+                frames += 1
+                if self.done:
+                    break
+        info = {"frames": frames} if self.fast_forward else {}
+        return self._get_obs(), reward, self.done, False, info
+
+    def _moved(self, action):
+        """Where the action puts the basket, clamped to its area."""
+        x, y = self.basket_x, self.basket_y
         move_speed = 10  # tuned for AI training so it can train properly
         if action == 0:
-            self.basket_x -= move_speed
+            x -= move_speed
         elif action == 1:
-            self.basket_x += move_speed
+            x += move_speed
         elif action == 2:
-            self.basket_y -= 8
+            y -= 8
         elif action == 3:
-            self.basket_y += 8
-        elif action == 4:
-            
-        # Activate power-up if available
-            if not self.powerup_active and (current_time - self.last_powerup_time >= self.powerup_cooldown):
-                self.powerup_active = True
-                self.last_powerup_time = current_time
-                self.gravity = base_gravity / 3
-                for f in self.fruits:
-                    f.speed /= 2
-                for b in self.bombs:
-                    b.vy /= 2
+            y += 8
 
         # Clamp basket to screen
-        self.basket_x = np.clip(self.basket_x, 0, screen_w - basket_w)
         min_y = screen_h - 200  # about 200px from bottom
-        self.basket_y = np.clip(self.basket_y, min_y, screen_h - basket_h - 40)
+        return np.clip(x, 0, screen_w - basket_w), np.clip(y, min_y, screen_h - basket_h - 40)
+
+    def _idle(self, action):
+        """Whether the action leaves the basket and the power-up as they are."""
+        if action == 4:
+            return self.powerup_active or self._now() - self.last_powerup_time < self.powerup_cooldown
+        x, y = self._moved(action)
+        return x == self.basket_x and y == self.basket_y
+
+    def _frame(self, action, spawn_roll=None):
+        """One frame of the game; returns its reward. spawn_roll is the bomb spawn draw if already made."""
+        reward = 0.0
+        current_time = self._now()
+        self.frames += 1
+
+        # Basket movement 
+        self.basket_x, self.basket_y = self._moved(action)
+
+        # Activate power-up if available
+        if action == 4 and not self.powerup_active and \
+                current_time - self.last_powerup_time >= self.powerup_cooldown:
+            self.powerup_active = True
+            self.last_powerup_time = current_time
+            self.gravity = base_gravity / 3
+            for f in self.fruits:
+                f.speed /= 2
+            for b in self.bombs:
+                b.vy /= 2
 
         # Power-up timeout 
         if self.powerup_active and (current_time - self.last_powerup_time >= self.powerup_duration):
@@ -124,7 +179,7 @@ class FruitCatchFullEnv(gym.Env):
                 b.vy *= 2
             
         # Bomb logic 
-        if random.random() < 0.002 and len(self.bombs) < 2:
+        if (random.random() if spawn_roll is None else spawn_roll) < 0.002 and len(self.bombs) < 2:
             self.bombs.append(Bomb())
 
         for bomb in self.bombs[:]:
@@ -169,12 +224,21 @@ class FruitCatchFullEnv(gym.Env):
 
         # Alignment reward 
         target = min(self.fruits, key=lambda f: f.y)
+        reward = self._shaping(reward, target.x, action)
+
+        if self.render_mode and self.render_mode != "rgb_array":
+            self.render()
+
+        return reward
+
+    def _shaping(self, reward, target_x, action):
+        """The rewards every frame gets, added to `reward`. Also takes arrays of frames, for _skip."""
         basket_center = self.basket_x + basket_w / 2
-        fruit_center = target.x + 25
+        fruit_center = target_x + 25
         dist_x = abs(fruit_center - basket_center)
 
         # Encourage aligning under fruit
-        reward += max(0, 1 - dist_x / (screen_w / 2)) * 0.5
+        reward += np.maximum(0, 1 - dist_x / (screen_w / 2)) * 0.5
 
         # Gentle penalty for moving too far unnecessarily
         if action in [0, 1, 2, 3]:
@@ -207,12 +271,63 @@ class FruitCatchFullEnv(gym.Env):
             
             # Encourages catching more fruits quickly
             reward += 0.5 * self.score
-            
-        obs = self._get_obs()
-        if self.render_mode:
-            self.render()
-
-        return obs, reward, self.done, False, info
+        return reward
+
+    def _skip(self, action):
+        """Fast-forward an idle action to the next event; returns (reward, frames).
+
+        Until something happens the fruits and bombs only fall, so those frames
+        are worked out together: positions and rewards are summed with
+        np.cumsum, which adds in the same order as frame by frame and so gives
+        identical numbers. The first frame where something does happen (a
+        catch, a fruit or bomb reaching the ground, a bomb hit or spawn, the
+        power-up running out or becoming available) is then run by _frame.
+        """
+        reward, frames = 0.0, 0
+        while frames < self.max_skip:
+            n = min(256, self.max_skip - frames)
+            fruit_y = np.array([_accumulate(f.y, f.speed, n) for f in self.fruits])
+            bomb_vy = [_accumulate(b.vy, main.gravity / 3, n) for b in self.bombs]
+            bomb_y = [_accumulate(b.y, vy, n) for b, vy in zip(self.bombs, bomb_vy)]
+
+            event = np.zeros(n, dtype=bool)
+            for bomb, y in zip(self.bombs, bomb_y):
+                over = self.basket_x < bomb.x + 20 < self.basket_x + basket_w
+                event |= (over & (self.basket_y < y + 20) & (y + 20 < self.basket_y + basket_h)) | (y > screen_h)
+            # Only the last fruit is checked for catches and the ground, as in _frame
+            fruit, y = self.fruits[-1], fruit_y[-1]
+            over = self.basket_x < fruit.x + 25 < self.basket_x + basket_w
+            event |= (over & (self.basket_y < y + 50) & (y + 50 < self.basket_y + basket_h)) | (y + 50 >= screen_h - 40)
+            since = (self.frames + np.arange(n)) / self.metadata["render_fps"] - self.last_powerup_time
+            if self.powerup_active:
+                event |= since >= self.powerup_duration
+            elif action == 4:
+                event |= since >= self.powerup_cooldown
+            end = int(event.argmax()) if event.any() else n
+
+            # The spawn roll is drawn every frame, so draw them in order up to the event
+            roll = None
+            for i in range(min(end + 1, n)):
+                roll = random.random()
+                if roll < 0.002 and len(self.bombs) < 2:
+                    end = i
+                    break
+
+            if end > 0:
+                xs = np.array([f.x for f in self.fruits])
+                rewards = self._shaping(np.zeros(end), xs[fruit_y[:, :end].argmin(axis=0)], action)
+                reward = _accumulate(reward, rewards, end)[-1]
+                for f, y in zip(self.fruits, fruit_y):
+                    f.y = y[end - 1]
+                for b, vy, y in zip(self.bombs, bomb_vy, bomb_y):
+                    b.vy, b.y = vy[end - 1], y[end - 1]
+                self.frames += end
+                frames += end
+            if end < n:
+                reward += self._frame(action, roll)
+                frames += 1
+                break
+        return reward, frames
 
 
 
@@ -220,24 +335,41 @@ class FruitCatchFullEnv(gym.Env):
         if not self.render_mode:
             return
 
-        draw_background()
-        for f in self.fruits:
-            f.draw()
-        for b in self.bombs:
-            b.draw()
-        draw_basket(self.basket_x, self.basket_y)
-        display_score(self.score)
-        remaining = max(0, self.powerup_cooldown - (time.time() - self.last_powerup_time))
-        display_powerup_status(remaining)
-        
+        if self._renderer is None:
+            from rl_common.render import DirtyRenderer
+            background = pygame.Surface((screen_w, screen_h))
+            background.fill(SKY_BLUE)
+            pygame.draw.rect(background, GRASS_GREEN, [0, screen_h - 40, screen_w, 40])
+            self._renderer = DirtyRenderer(self.screen, background)
+        dirty = self._renderer.draw(self._scene())
+
+        if self.render_mode == "rgb_array":
+            return np.frombuffer(pygame.image.tobytes(self.screen, "RGB"), dtype=np.uint8).reshape(screen_h, screen_w, 3)
+        pygame.display.update(dirty)
+        self.clock.tick(60)
+
+    def _scene(self):
+        from rl_common.render import font_key
+
+        items = [("ellipse", f.color, int(f.x), int(f.y), 50, 50) for f in self.fruits]
+        items += [("circle", BLACK, int(b.x + 20), int(b.y + 20), 20) for b in self.bombs]
+        items.append(("rect", BLACK, int(self.basket_x), int(self.basket_y), basket_w, basket_h))
+        items.append(("text", font_key(36, sysfont=True), f"Score: {self.score}", BLACK, 10, 10, "topleft"))
+
+        remaining = max(0, self.powerup_cooldown - (self._now() - self.last_powerup_time))
+        if self.powerup_active:
+            status, color = "POWER-UP ACTIVE!", BLUE
+        elif remaining > 0:
+            status, color = f"Cooldown: {remaining:.1f}s", BLACK
+        else:
+            status, color = "Press SPACE for Power-Up", BLACK
+        items.append(("text", font_key(28, sysfont=True), status, color, 10, 50, "topleft"))
 
         if self.done:
-            font = pygame.font.SysFont(None, 72)
-            text = font.render("Game Over!", True, (0, 0, 0))
-            self.screen.blit(text, (screen_w // 2 - 180, screen_h // 2 - 36))
+            items.append(("text", font_key(72, sysfont=True), "Game Over!", BLACK,
+                          screen_w // 2 - 180, screen_h // 2 - 36, "topleft"))
+        return items
 
-        pygame.display.update()
-        self.clock.tick(60)
-        
     def close(self):
+        self._renderer = None
         pygame.quit()
@@ -85,6 +85,14 @@ class Bomb:
 
 
 # Helper functions 
+_fonts = {}
+
+def get_font(size):
+    # Opening a font every frame is slow, so each size is opened once
+    if size not in _fonts:
+        _fonts[size] = pygame.font.SysFont(None, size)
+    return _fonts[size]
+
 def draw_background():
     screen.fill(SKY_BLUE)
     pygame.draw.rect(screen, GRASS_GREEN, [0, screen_h - 40, screen_w, 40])
@@ -93,12 +101,12 @@ def draw_basket(x, y):
     pygame.draw.rect(screen, BLACK, [x, y, basket_w, basket_h])
 
 def display_score(score):
-    font = pygame.font.SysFont(None, 36)
+    font = get_font(36)
     text = font.render(f"Score: {score}", True, BLACK)
     screen.blit(text, (10, 10))
 
 def display_powerup_status(remaining_cooldown):
-    font = pygame.font.SysFont(None, 28)
+    font = get_font(28)
     if powerup_active:
         text = font.render("POWER-UP ACTIVE!", True, BLUE)
     elif remaining_cooldown > 0:
@@ -108,7 +116,7 @@ def display_powerup_status(remaining_cooldown):
     screen.blit(text, (10, 50))
 
 def game_over():
-    font = pygame.font.SysFont(None, 72)
+    font = get_font(72)
     text = font.render("Game Over!", True, BLACK)
     screen.blit(text, (screen_w // 2 - 180, screen_h // 2 - 36))
     pygame.display.update()
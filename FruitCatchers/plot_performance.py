@@ -2,13 +2,20 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import os
+import sys
 import ast
 
-logs = {
-    "PPO_10": "logs_csv/PPO_10_rewards.csv",
-    "A2C": "logs_csv/A2C_rewards.csv",
-    "PPO_lr5e5": "logs_csv/PPO_lr5e5_rewards.csv"
-}
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rl_common.registry import RunRegistry, repo_path
+
+# Every registered FruitCatchers run with a reward CSV, optionally narrowed by a
+# registry query on the command line, e.g. "python plot_performance.py algo=PPO"
+registry = RunRegistry()
+registry.ensure_populated()
+runs = registry.find(["game=FruitCatchers"] + sys.argv[1:])
+registry.close()
+
+logs = {r["name"]: repo_path(r["csv_path"]) for r in sorted(runs, key=lambda r: r["name"]) if r["csv_path"]}
 
 plt.figure(figsize=(10, 6))
 
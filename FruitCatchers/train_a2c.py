@@ -1,13 +1,35 @@
 # train_a2c_only.py
-from stable_baselines3 import A2C
-from fruit_env_full import FruitCatchFullEnv
-from train_agent import RewardLogger
-
-env = FruitCatchFullEnv(persona="survivor")
-a2c_callback = RewardLogger(log_dir="logs_csv", algo_name="A2C")
-
-print("Training A2C model...")
-model_a2c = A2C("MlpPolicy", env, verbose=1, tensorboard_log="./logs/A2C")
-model_a2c.learn(total_timesteps=500000, callback=a2c_callback)
-model_a2c.save("models/a2c_fruit")
-print("A2C model saved → models/a2c_fruit.zip")
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from train_agent import reward_logger, training_args, training_env
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rl_common.registry import record_sb3_training
+
+
+def main():
+    args = training_args()
+    from stable_baselines3 import A2C
+    from rl_common.async_rollouts import use_async_rollouts
+
+    env = training_env(persona="survivor", args=args)
+    config = {"persona": "survivor", "action_repeat": args.action_repeat}
+    a2c_callback = reward_logger(log_dir="logs_csv", algo_name="A2C")
+
+    print("Training A2C model...")
+    model_a2c = use_async_rollouts(A2C("MlpPolicy", env, verbose=1, tensorboard_log="./logs/A2C"))
+    start_time = time.time()
+    model_a2c.learn(total_timesteps=500000, callback=a2c_callback)
+    model_a2c.save("models/a2c_fruit")
+    record_sb3_training("FruitCatchers", "a2c", model_a2c, "models/a2c_fruit", time.time() - start_time,
+                        config=config, csv_path="logs_csv/A2C_rewards.csv")
+    env.close()
+    print("A2C model saved → models/a2c_fruit.zip")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,112 @@
 # train_agent.py
+import argparse
 import os
-import pandas as pd
-from stable_baselines3 import PPO, A2C
-from stable_baselines3.common.callbacks import BaseCallback
-from stable_baselines3.common.env_checker import check_env
+import sys
+import time
+from functools import partial
+
+# Training never draws, so main.py (imported by the env, and again in every worker process) doesn't open a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
 from fruit_env_full import FruitCatchFullEnv
 
-# Custom callback to save rewards per episode 
-class RewardLogger(BaseCallback):
-    def __init__(self, log_dir, algo_name, verbose=0):
-        super().__init__(verbose)
-        self.log_dir = log_dir
-        self.algo_name = algo_name
-        self.episode_rewards = []
-        self.episode_lengths = []
-
-    def _on_step(self) -> bool:
-        if self.locals.get('done'):
-            self.episode_rewards.append(self.locals['rewards'])
-            self.episode_lengths.append(self.locals['infos'][0].get('episode_length', 0))
-        return True
-
-    def _on_training_end(self) -> None:
-        df = pd.DataFrame({
-            "episode": range(1, len(self.episode_rewards) + 1),
-            "reward": self.episode_rewards,
-            "length": self.episode_lengths
-        })
-        os.makedirs("logs_csv", exist_ok=True)
-        df.to_csv(f"logs_csv/{self.algo_name}_rewards.csv", index=False)
-        print(f"[Saved] Episode data for {self.algo_name} → logs_csv/{self.algo_name}_rewards.csv")
-
-
-# Initialize environment 
-env = FruitCatchFullEnv(persona="survivor")
-
-# Train PPO 
-ppo_callback = RewardLogger(log_dir="logs_csv", algo_name="PPO_10") # Running PPO_10 because it is the best game the AI played 
-model_ppo = PPO("MlpPolicy", env, verbose=1, tensorboard_log="./logs/PPO_10")
-model_ppo.learn(total_timesteps=500000, callback=ppo_callback)
-model_ppo.save("models/ppo_fruit")
-
-# Train A2C 
-a2c_callback = RewardLogger(log_dir="logs_csv", algo_name="A2C")
-model_a2c = A2C("MlpPolicy", env, verbose=1, tensorboard_log="./logs/")
-model_a2c.learn(total_timesteps=500000, callback=a2c_callback)
-model_a2c.save("models/a2c_fruit")
-
-print("\n Training complete. Models and logs saved successfully.")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rl_common.registry import record_sb3_training
+
+
+def reward_logger(log_dir, algo_name, verbose=0):
+    """Callback that saves the rewards per episode to logs_csv/<algo_name>_rewards.csv."""
+    # Defined here so --help and importing this script don't wait for stable-baselines3 and torch
+    from stable_baselines3.common.callbacks import BaseCallback
+
+    class RewardLogger(BaseCallback):
+        def __init__(self, log_dir, algo_name, verbose=0):
+            super().__init__(verbose)
+            self.log_dir = log_dir
+            self.algo_name = algo_name
+            self.episode_rewards = []
+            self.episode_lengths = []
+
+        def _on_step(self) -> bool:
+            if self.locals.get('done'):
+                self.episode_rewards.append(self.locals['rewards'])
+                self.episode_lengths.append(self.locals['infos'][0].get('episode_length', 0))
+            return True
+
+        def _on_training_end(self) -> None:
+            import pandas as pd
+
+            df = pd.DataFrame({
+                "episode": range(1, len(self.episode_rewards) + 1),
+                "reward": self.episode_rewards,
+                "length": self.episode_lengths
+            })
+            os.makedirs("logs_csv", exist_ok=True)
+            df.to_csv(f"logs_csv/{self.algo_name}_rewards.csv", index=False)
+            print(f"[Saved] Episode data for {self.algo_name} → logs_csv/{self.algo_name}_rewards.csv")
+
+    return RewardLogger(log_dir, algo_name, verbose)
+
+
+def make_env(persona="survivor", action_repeat=1):
+    from stable_baselines3.common.monitor import Monitor
+
+    return Monitor(FruitCatchFullEnv(persona=persona, action_repeat=action_repeat))
+
+
+def training_args():
+    parser = argparse.ArgumentParser(description="Train Fruit Catchers agents")
+    parser.add_argument("--n_envs", type=int, default=1,
+                        help="Environments stepped in parallel worker processes")
+    parser.add_argument("--vec_env", type=str, default="shm", choices=["shm", "async", "subproc", "dummy"],
+                        help="Vector env used when n_envs > 1")
+    parser.add_argument("--action_repeat", type=int, default=1,
+                        help="Game frames per policy step (rewards are summed)")
+    # Other words on the command line (the README's 'ppo', 'a2c', ...) are ignored as before
+    args, _ = parser.parse_known_args()
+    return args
+
+
+def training_env(persona="survivor", args=None):
+    """The env to train on: one env, or with --n_envs N that many in worker processes."""
+    args = args or training_args()
+    if args.n_envs == 1:
+        return FruitCatchFullEnv(persona=persona, action_repeat=args.action_repeat)
+    from rl_common.shm_vec_env import make_vec_env
+    env_fns = [partial(make_env, persona, args.action_repeat) for _ in range(args.n_envs)]
+    return make_vec_env(env_fns, args.vec_env)
+
+
+def main():
+    # Initialize environment 
+    args = training_args()
+    from stable_baselines3 import PPO, A2C
+    from rl_common.async_rollouts import use_async_rollouts
+
+    env = training_env(persona="survivor", args=args)
+    config = {"persona": "survivor", "action_repeat": args.action_repeat}
+
+    # Train PPO 
+    ppo_callback = reward_logger(log_dir="logs_csv", algo_name="PPO_10") # Running PPO_10 because it is the best game the AI played 
+    model_ppo = use_async_rollouts(PPO("MlpPolicy", env, verbose=1, tensorboard_log="./logs/PPO_10"))
+    start_time = time.time()
+    model_ppo.learn(total_timesteps=500000, callback=ppo_callback)
+    model_ppo.save("models/ppo_fruit")
+    record_sb3_training("FruitCatchers", "ppo", model_ppo, "models/ppo_fruit", time.time() - start_time,
+                        config=config, csv_path="logs_csv/PPO_10_rewards.csv")
+
+    # Train A2C 
+    a2c_callback = reward_logger(log_dir="logs_csv", algo_name="A2C")
+    model_a2c = use_async_rollouts(A2C("MlpPolicy", env, verbose=1, tensorboard_log="./logs/"))
+    start_time = time.time()
+    model_a2c.learn(total_timesteps=500000, callback=a2c_callback)
+    model_a2c.save("models/a2c_fruit")
+    record_sb3_training("FruitCatchers", "a2c", model_a2c, "models/a2c_fruit", time.time() - start_time,
+                        config=config, csv_path="logs_csv/A2C_rewards.csv")
+
+    env.close()
+    print("\n Training complete. Models and logs saved successfully.")
+
+
+if __name__ == "__main__":
+    main()
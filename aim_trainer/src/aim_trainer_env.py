@@ -5,12 +5,12 @@ from typing import Optional, Tuple
 
 import gymnasium as gym
 import numpy as np
-import pygame
 from gymnasium import spaces
 
 
 class AimTrainerEnv(gym.Env):
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 60}
+    OBS_MODES = ("features", "pixels")
 
     def __init__(
             self,
@@ -19,15 +19,25 @@ class AimTrainerEnv(gym.Env):
             reward_mode: str= "survival",
             max_steps: int = 5000,
             width: int = 1280,
-            height: int = 720
+            height: int = 720,
+            action_repeat: int = 1,
+            obs_mode: str = "features",
+            pixel_size: Tuple[int, int] = (64, 36),
+            render_size: Optional[Tuple[int, int]] = None
     ):
         super().__init__()
+        if action_repeat < 1:
+            raise ValueError(f"action_repeat must be at least 1, got {action_repeat}")
+        if obs_mode not in self.OBS_MODES:
+            raise ValueError(f"obs_mode must be one of {self.OBS_MODES}, got {obs_mode!r}")
         self.mouse_x = None
         self.mouse_y = None
         self.render_mode = render_mode
         self._rnd = random.Random(seed)
         self._np_rng = np.random.default_rng(seed)
         self.max_steps = max_steps
+        # Clicks made per step() with the same action; max_steps still counts clicks
+        self.action_repeat = action_repeat
         self.width = width
         self.height = height
         self.steps = 0
@@ -49,12 +59,28 @@ class AimTrainerEnv(gym.Env):
         self.max_initial_ball_size = 30
         self.target_margin = 100  # Keep targets away from edges
 
-        self.observation_space = spaces.Box(
-            low=0.0,
-            high=1.0,
-            shape=(6,),
-            dtype=np.float32
-        )
+        # obs_mode="pixels" observes a pixel_size (width, height) picture of the target and crosshair instead of
+        # the 6 features; render_size makes rgb_array frames the same way (no score text) instead of with pygame
+        self.obs_mode = obs_mode
+        self.pixel_size = tuple(pixel_size)
+        self.render_size = tuple(render_size) if render_size is not None else None
+        self._pixels = _Raster(self.pixel_size, width, height, self.max_ball_size) if obs_mode == "pixels" else None
+        self._frame = _Raster(self.render_size, width, height, self.max_ball_size) if render_size else None
+
+        if obs_mode == "pixels":
+            self.observation_space = spaces.Box(
+                low=0,
+                high=255,
+                shape=(self.pixel_size[1], self.pixel_size[0], 3),
+                dtype=np.uint8
+            )
+        else:
+            self.observation_space = spaces.Box(
+                low=0.0,
+                high=1.0,
+                shape=(6,),
+                dtype=np.float32
+            )
 
         self.action_space = spaces.Box(
             low=0.0,
@@ -67,7 +93,8 @@ class AimTrainerEnv(gym.Env):
 
         self._pygame = None
         self._screen = None
-        self._clock = None
+        self._renderer = None
+        self._frames = None
 
     def reset(self, *, seed: Optional[int] = None, options: Optional[dict] = None):
         super().reset(seed=seed)
@@ -99,7 +126,29 @@ class AimTrainerEnv(gym.Env):
         return obs, info
 
     def step(self, action: np.ndarray):
+        # The action is repeated for action_repeat clicks, stopping early when the episode ends
+        reward = 0.0
+        for _ in range(self.action_repeat):
+            click_reward, terminated, truncated = self._click(action)
+            reward += click_reward
+            if terminated or truncated:
+                break
 
+        obs = self._get_obs()
+        accuracy = (self.hits / self.clicks) if self.clicks > 0 else 0.0
+        info = {
+            "score": self.score,
+            "accuracy": accuracy,
+            "hits": self.hits,
+            "misses": self.misses,
+            "distance_to_target": math.sqrt((self.mouse_x - self.target_x) ** 2 + (self.mouse_y - self.target_y) ** 2),
+            "reward_breakdown": dict(self.reward_breakdown)
+        }
+
+        return obs, float(reward), bool(terminated), bool(truncated), info
+
+    def _click(self, action: np.ndarray) -> Tuple[float, bool, bool]:
+        """One click: (reward, terminated, truncated)."""
         click_x = float(action[0] * self.width)
         click_y = float(action[1] * self.height)
 
@@ -171,33 +220,26 @@ class AimTrainerEnv(gym.Env):
 
         truncated = self.steps >= self.max_steps
 
-        obs = self._get_obs()
-        accuracy = (self.hits / self.clicks) if self.clicks > 0 else 0.0
-        info = {
-            "score": self.score,
-            "accuracy": accuracy,
-            "hits": self.hits,
-            "misses": self.misses,
-            "distance_to_target": current_distance,
-            "reward_breakdown": dict(self.reward_breakdown)
-        }
-
         if self.render_mode == "human":
-            self._render_human()
+            self._render_human(force=terminated or truncated)
+
+        return float(reward), terminated, truncated
 
-        return obs, float(reward), bool(terminated), bool(truncated), info
     def render(self):
         if self.render_mode == "human":
             self._render_human()
+        elif self.render_mode == "rgb_array":
+            return self._render_rgb_array()
         else:
             return None
 
     def close(self):
         if self._pygame:
-            pygame.quit()
+            self._pygame.quit()
             self._pygame = None
             self._screen = None
-            self._clock = None
+            self._renderer = None
+            self._frames = None
 
     def _spawn_new_target(self):
         margin = self.target_margin
@@ -207,6 +249,8 @@ class AimTrainerEnv(gym.Env):
         self.targets_spawned += 1
 
     def _get_obs(self) -> np.ndarray:
+        if self._pixels is not None:
+            return self._draw(self._pixels)
         # Have to normalize to width of screen
         obs = np.array([
             self.mouse_x / self.width,
@@ -224,65 +268,112 @@ class AimTrainerEnv(gym.Env):
             self._pygame = pygame
             pygame.init()
             self._screen = pygame.display.set_mode((self.width, self.height))
-            self._clock = pygame.time.Clock()
             pygame.display.set_caption("Aim Trainer RL")
+            from rl_common.render import DirtyRenderer, FrameLimiter
+            self._renderer = DirtyRenderer(self._screen, (50, 50, 50))
+            self._frames = FrameLimiter(self.metadata["render_fps"])
+
+    def _draw(self, raster: "_Raster") -> np.ndarray:
+        return raster.draw(self.target_x, self.target_y, self.ball_size, self.mouse_x, self.mouse_y).copy()
 
-    def _render_human(self):
+    def _render_rgb_array(self) -> np.ndarray:
+        if self._frame is not None:
+            return self._draw(self._frame)
+        # Draws on an offscreen surface, so no window or display is needed
+        import pygame
+
+        if self._screen is None:
+            from rl_common.render import DirtyRenderer
+            self._pygame = pygame
+            self._screen = pygame.Surface((self.width, self.height))
+            self._renderer = DirtyRenderer(self._screen, (50, 50, 50))
+        self._renderer.draw(self._scene())
+        width, height = self._screen.get_size()
+        return np.frombuffer(pygame.image.tobytes(self._screen, "RGB"), dtype=np.uint8).reshape(height, width, 3)
+
+    def _render_human(self, force: bool = False):
         self._lazy_pygame()
         pygame = self._pygame
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.close()
-
-        self._draw_scene()
-        pygame.display.flip()
-        self._clock.tick(self.metadata["render_fps"])
-
-    def _draw_scene(self):
-        pygame = self._pygame
-
-        self._screen.fill((50, 50, 50))
-
-        pygame.draw.circle(
-            self._screen,
-            (255, 35, 12),
-            (int(self.target_x), int(self.target_y)),
-            int(self.ball_size)
-        )
-
-        pygame.draw.circle(
-            self._screen,
-            (0, 255, 0),
-            (int(self.mouse_x), int(self.mouse_y)),
-            3
-        )
-
-        pygame.draw.line(
-            self._screen,
-            (0, 255, 0),
-            (int(self.mouse_x) - 10, int(self.mouse_y)),
-            (int(self.mouse_x) + 10, int(self.mouse_y)),
-            2
-        )
-        pygame.draw.line(
-            self._screen,
-            (0, 255, 0),
-            (int(self.mouse_x), int(self.mouse_y) - 10),
-            (int(self.mouse_x), int(self.mouse_y) + 10),
-            2
-        )
-
-        font = pygame.font.Font(None, 36)
-        score_text = font.render(f"Score: {self.score}", True, (255, 255, 255))
-        location_text = font.render(f"X: {round(self.mouse_x, 6)} Y {round(self.mouse_y, 6)}", True, (255, 255, 255))
-
-        self._screen.blit(score_text, (10, 10))
-        self._screen.blit(location_text, (10, 50))
-
-        size_text = pygame.font.Font(None, 24).render(
-            f"Ball Size: {int(self.ball_size)}/{int(self.max_ball_size)}",
-            True,
-            (255, 255, 255)
-        )
-        self._screen.blit(size_text, (10, 90))
\ No newline at end of file
+                return
+
+        # Steps faster than the display rate only draw every few steps; the final frame is always drawn
+        if self._frames.due(force):
+            pygame.display.update(self._renderer.draw(self._scene()))
+
+    def _scene(self) -> list:
+        from rl_common.render import font_key
+
+        green, white = (0, 255, 0), (255, 255, 255)
+        x, y = int(self.mouse_x), int(self.mouse_y)
+        return [
+            ("circle", (255, 35, 12), int(self.target_x), int(self.target_y), int(self.ball_size)),
+            ("circle", green, x, y, 3),
+            ("line", green, x - 10, y, x + 10, y, 2),
+            ("line", green, x, y - 10, x, y + 10, 2),
+            ("text", font_key(36), f"Score: {self.score}", white, 10, 10, "topleft"),
+            ("text", font_key(36), f"X: {round(self.mouse_x, 6)} Y {round(self.mouse_y, 6)}", white, 10, 50, "topleft"),
+            ("text", font_key(24), f"Ball Size: {int(self.ball_size)}/{int(self.max_ball_size)}", white, 10, 90,
+             "topleft"),
+        ]
+
+
+class _Raster:
+    """Draws the target and crosshair into a reused (height, width, 3) uint8 array, without pygame.
+
+    Discs are cut from one grid of squared distances (in game pixels) from a centre pixel, worked out up
+    front for the largest target, so drawing one is a slice, a comparison and a masked assignment. Only the
+    boxes drawn in the previous frame are cleared.
+    """
+
+    BACKGROUND = (50, 50, 50)
+    TARGET = (255, 35, 12)
+    CROSSHAIR = (0, 255, 0)
+
+    def __init__(self, size: Tuple[int, int], game_width: int, game_height: int, max_radius: float):
+        self.width, self.height = size
+        self.sx = self.width / game_width
+        self.sy = self.height / game_height
+        self.frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.frame[:] = self.BACKGROUND
+        # One pixel of slack for a target that grows just past max_radius on its last miss
+        self.rx = int((max_radius + 1) * self.sx)
+        self.ry = int((max_radius + 1) * self.sy)
+        dx = np.arange(-self.rx, self.rx + 1) / self.sx
+        dy = np.arange(-self.ry, self.ry + 1) / self.sy
+        self.distance2 = dy[:, None] ** 2 + dx[None, :] ** 2
+        self._drawn = []
+
+    def draw(self, target_x: float, target_y: float, radius: float, mouse_x: float, mouse_y: float) -> np.ndarray:
+        for y0, y1, x0, x1 in self._drawn:
+            self.frame[y0:y1, x0:x1] = self.BACKGROUND
+        # The same shapes as AimTrainerEnv._scene: target, crosshair dot and the two 2 pixel wide arms
+        self._drawn = [
+            self._disc(target_x, target_y, radius, self.TARGET),
+            self._disc(mouse_x, mouse_y, 3, self.CROSSHAIR),
+            self._box(mouse_x - 10, mouse_y, mouse_x + 10, mouse_y + 1, self.CROSSHAIR),
+            self._box(mouse_x, mouse_y - 10, mouse_x + 1, mouse_y + 10, self.CROSSHAIR),
+        ]
+        return self.frame
+
+    def _disc(self, x: float, y: float, radius: float, color) -> Tuple[int, int, int, int]:
+        cx = min(max(int(x * self.sx), 0), self.width - 1)
+        cy = min(max(int(y * self.sy), 0), self.height - 1)
+        # The centre pixel is always drawn, so a target smaller than a pixel still shows
+        ex = min(int(radius * self.sx), self.rx)
+        ey = min(int(radius * self.sy), self.ry)
+        x0, x1 = max(cx - ex, 0), min(cx + ex + 1, self.width)
+        y0, y1 = max(cy - ey, 0), min(cy + ey + 1, self.height)
+        inside = self.distance2[y0 - cy + self.ry:y1 - cy + self.ry, x0 - cx + self.rx:x1 - cx + self.rx]
+        self.frame[y0:y1, x0:x1][inside <= radius * radius] = color
+        return y0, y1, x0, x1
+
+    def _box(self, left: float, top: float, right: float, bottom: float, color) -> Tuple[int, int, int, int]:
+        """Fills the pixels covering game pixels left..right, top..bottom (inclusive)."""
+        x0, x1 = max(math.floor(left * self.sx), 0), min(math.floor(right * self.sx) + 1, self.width)
+        y0, y1 = max(math.floor(top * self.sy), 0), min(math.floor(bottom * self.sy) + 1, self.height)
+        self.frame[y0:y1, x0:x1] = color
+        return y0, y1, x0, x1
@@ -1,131 +1,261 @@
 import argparse
 import os
+import sys
 import csv
+import time
+from functools import partial
 import numpy as np
-from stable_baselines3 import PPO
 from aim_trainer_env import AimTrainerEnv
 
-
-def run_episode(model, reward_mode="survival", render=False, max_steps=5000, seed=None):
-
-    env = AimTrainerEnv(
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from rl_common.batched_eval import ScalarEnvBatch, run_lockstep, sb3_predictor
+from rl_common.eval_cache import EvalCache, code_version, episode_seeds
+from rl_common.parallel_eval import default_workers, run_episodes
+from rl_common.policies import BACKENDS, CNN_BACKENDS, backend_file, load_policy, policy_hash
+from rl_common.registry import RunRegistry
+from rl_common.streaming_stats import EpisodeAggregator, RunningStats
+from rl_common.tapes import TapeSelector, write_tapes
+
+FIELDNAMES = [
+    "episode", "reward", "score", "accuracy", "steps", "hits", "misses",
+    "total_clicks", "crashed", "truncated", "action_var_x", "action_var_y",
+    "avg_action_x", "avg_action_y"
+]
+
+
+class EpisodeTracker:
+    """Per-episode metrics, fed one step at a time by either evaluation loop."""
+
+    def __init__(self):
+        self.ep_reward = 0.0
+        self.steps = 0
+        self.actions = RunningStats()
+
+    def step(self, action, reward, info):
+        self.actions.add(np.asarray(action, dtype=np.float64))
+        self.ep_reward += reward
+        self.steps += 1
+
+    def finish(self, done, trunc, info):
+        # Episode-level metrics
+        score = int(info.get("score", 0))
+        accuracy = float(info.get("accuracy", 0.0))
+        hits = int(info.get("hits", 0))
+        misses = int(info.get("misses", 0))
+        total_clicks = hits + misses
+
+        # Calculate action statistics
+        action_variance = self.actions.var if self.actions.n > 1 else [0.0, 0.0]
+        avg_action = self.actions.mean if self.actions.n > 0 else [0.5, 0.5]
+
+        return {
+            "reward": float(self.ep_reward),
+            "score": score,
+            "accuracy": accuracy,
+            "steps": self.steps,
+            "hits": hits,
+            "misses": misses,
+            "total_clicks": total_clicks,
+            "crashed": int(done and not trunc),
+            "truncated": int(trunc),
+            "action_var_x": float(action_variance[0]),
+            "action_var_y": float(action_variance[1]),
+            "avg_action_x": float(avg_action[0]),
+            "avg_action_y": float(avg_action[1]),
+        }
+
+
+def make_env(reward_mode="survival", render=False, max_steps=5000, seed=None, action_repeat=1, obs_mode="features",
+             pixel_size=(64, 36)):
+    return AimTrainerEnv(
         render_mode="human" if render else None,
         reward_mode=reward_mode,
         max_steps=max_steps,
-        seed=seed
+        seed=seed,
+        action_repeat=action_repeat,
+        obs_mode=obs_mode,
+        pixel_size=pixel_size
     )
+
+
+def run_episode(model, reward_mode="survival", render=False, max_steps=5000, seed=None, action_repeat=1,
+                obs_mode="features", pixel_size=(64, 36)):
+
+    env = make_env(reward_mode, render, max_steps, seed, action_repeat, obs_mode, pixel_size)
     obs, info = env.reset()
     done = trunc = False
-
-    ep_reward = 0.0
-    steps = 0
-    actions_taken = []
+    tracker = EpisodeTracker()
 
     while not (done or trunc):
         action, _ = model.predict(obs, deterministic=True)
-        actions_taken.append(action.copy())
         obs, r, done, trunc, info = env.step(action)
-        ep_reward += r
-        steps += 1
-
-    # Episode-level metrics
-    score = int(info.get("score", 0))
-    accuracy = float(info.get("accuracy", 0.0))
-    hits = int(info.get("hits", 0))
-    misses = int(info.get("misses", 0))
-    total_clicks = hits + misses
-
-    # Calculate action statistics
-    actions_array = np.array(actions_taken)
-    action_variance = np.var(actions_array, axis=0) if len(actions_taken) > 1 else [0.0, 0.0]
-    avg_action = np.mean(actions_array, axis=0) if len(actions_taken) > 0 else [0.5, 0.5]
+        tracker.step(action, r, info)
 
     env.close()
 
-    return {
-        "reward": float(ep_reward),
-        "score": score,
-        "accuracy": accuracy,
-        "steps": steps,
-        "hits": hits,
-        "misses": misses,
-        "total_clicks": total_clicks,
-        "crashed": int(done and not trunc),
-        "truncated": int(trunc),
-        "action_var_x": float(action_variance[0]),
-        "action_var_y": float(action_variance[1]),
-        "avg_action_x": float(avg_action[0]),
-        "avg_action_y": float(avg_action[1]),
-    }
+    return tracker.finish(done, trunc, info)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Evaluate trained Aim Trainer agent")
-    parser.add_argument("--model_path", type=str, required=True,
+    parser.add_argument("--model_path", type=str, default=None,
                         help="Path to trained model (without .zip extension)")
+    parser.add_argument("--model_query", type=str, default=None,
+                        help="Pick the model from the run registry instead, e.g. "
+                             "\"reward_mode=survival learning_rate<1e-4 best=mean_score\"")
     parser.add_argument("--episodes", type=int, default=10,
                         help="Number of evaluation episodes")
     parser.add_argument("--reward_mode", type=str, default="accuracy",
                         choices=["survival", "accuracy"],
                         help="Reward function to use")
-    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Base seed that every episode's seed is derived from (random if not given)")
     parser.add_argument("--render", type=int, default=0,
                         help="Whether to render episodes (1 for yes, 0 for no)")
     parser.add_argument("--max_steps", type=int, default=5000,
                         help="Maximum steps per episode")
+    parser.add_argument("--action_repeat", type=int, default=1,
+                        help="Clicks per policy step (must match training)")
+    parser.add_argument("--obs_mode", type=str, default="features", choices=AimTrainerEnv.OBS_MODES,
+                        help="Observation the model was trained on")
+    parser.add_argument("--pixel_size", type=int, nargs=2, default=[64, 36], metavar=("WIDTH", "HEIGHT"),
+                        help="Size of the pixel observations (must match training)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes to run episodes in (0 for one per core)")
+    parser.add_argument("--batch_size", type=int, default=1,
+                        help="Run this many episodes in lockstep with one batched model call per step")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Recompute every episode instead of reusing cached results")
+    parser.add_argument("--backend", type=str, default="sb3", choices=BACKENDS,
+                        help="Inference backend to run the policy with")
+    parser.add_argument("--tapes", nargs="+", default=[],
+                        help="Save replay tapes of these episodes: best, worst, all and/or episode numbers")
+    parser.add_argument("--tape_dir", type=str, default="logs/tapes",
+                        help="Folder the tapes are written to")
     args = parser.parse_args()
-
-
-    if not os.path.exists(args.model_path + ".zip"):
-        raise FileNotFoundError(f"Model not found: {args.model_path}.zip")
+    try:
+        tapes = TapeSelector(args.tapes)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.obs_mode == "pixels" and args.backend not in CNN_BACKENDS:
+        parser.error(f"pixel models only run with --backend {' or '.join(CNN_BACKENDS)}")
+    args.workers = default_workers(args.workers)
+    if args.render and (args.workers > 1 or args.batch_size > 1):
+        parser.error("--render only works with a single worker and a batch size of 1")
+    if args.workers > 1 and args.batch_size > 1:
+        parser.error("use either --workers or --batch_size, not both")
+
+    registry = RunRegistry()
+    if args.model_path is None:
+        if args.model_query is None:
+            parser.error("one of --model_path or --model_query is required")
+        try:
+            args.model_path = registry.resolve_model(f"game=aim_trainer {args.model_query}")
+        except LookupError as e:
+            parser.error(str(e))
+
+
+    model_file = backend_file(args.model_path, args.backend)
+    if not os.path.exists(model_file):
+        raise FileNotFoundError(f"Model not found: {model_file}")
 
     os.makedirs(os.path.dirname(f"logs/snake_eval_{args.reward_mode}.csv"), exist_ok=True)
 
-    model = PPO.load(args.model_path)
 
     print(f"Episodes: {args.episodes}")
     print(f"Max Steps: {args.max_steps}")
     print(f"Rendering: {'Yes' if args.render else 'No'}")
+    print(f"Workers: {args.workers}")
+    print(f"Batch Size: {args.batch_size}")
+    print(f"Backend: {args.backend}")
+
+    args.seed, seeds = episode_seeds(args.seed, args.episodes)
+    print(f"Base Seed: {args.seed}")
+
+    load_model = partial(load_policy, backend=args.backend)
+
+    def compute(indices):
+        todo = [seeds[i] for i in indices]
+        # With several workers each one loads its own copy instead
+        model = load_model(args.model_path) if args.workers == 1 else None
+        if args.batch_size > 1:
+            envs = ScalarEnvBatch(partial(make_env, args.reward_mode, False, args.max_steps,
+                                          action_repeat=args.action_repeat, obs_mode=args.obs_mode,
+                                          pixel_size=args.pixel_size), args.batch_size)
+            return run_lockstep(envs, sb3_predictor(model), todo, EpisodeTracker)
+        episode_kwargs = [
+            dict(reward_mode=args.reward_mode, render=bool(args.render), max_steps=args.max_steps, seed=seed,
+                 action_repeat=args.action_repeat, obs_mode=args.obs_mode, pixel_size=args.pixel_size)
+            for seed in todo
+        ]
+        return run_episodes(run_episode, load_model, args.model_path, episode_kwargs,
+                            workers=args.workers, model=model)
+
+    cache = None
+    if not (args.no_cache or args.render):
+        cache = EvalCache()
+        src_dir = os.path.dirname(os.path.abspath(__file__))
+        version = code_version(os.path.join(src_dir, "aim_trainer_env.py"), os.path.abspath(__file__))
+        model_hash = policy_hash(args.model_path, args.backend)
+        env_config = {"reward_mode": args.reward_mode, "max_steps": args.max_steps,
+                      "action_repeat": args.action_repeat, "obs_mode": args.obs_mode, "pixel_size": args.pixel_size}
+        keys = [EvalCache.key(model_hash, "AimTrainerEnv", env_config, seed, version) for seed in seeds]
+
+    agg = EpisodeAggregator(
+        stats=["reward", "score", "accuracy", "steps", "hits", "misses", "crashed",
+               "action_var_x", "action_var_y"],
+        counters={
+            "excellent": lambda r: r["score"] >= 140,
+            "good": lambda r: 0.6 <= r["score"] < 139,
+            "fair": lambda r: 0.4 <= r["score"] < 110,
+            "poor": lambda r: r["score"] < 75,
+        },
+    )
+    start_time = time.time()
+    with open(f"logs/snake_eval_{args.reward_mode}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
 
+        results = cache.run(keys, compute) if cache else compute(range(args.episodes))
 
-    rows = []
-    for ep in range(1, args.episodes + 1):
-        print(f"Running episode {ep}/{args.episodes}...", end=" ")
+        for ep, metrics in results:
+            metrics["episode"] = ep
+            agg.add(metrics)
+            tapes.add(ep, metrics)
+            writer.writerow(metrics)
+            f.flush()
 
-        metrics = run_episode(
-            model,
-            reward_mode=args.reward_mode,
-            render=bool(args.render),
-            max_steps=args.max_steps,
-            seed=args.seed
-        )
-        metrics["episode"] = ep
-        rows.append(metrics)
+            print(f"Running episode {ep}/{args.episodes}... "
+                  f"Score: {metrics['score']}, Accuracy: {metrics['accuracy']:.1%}, Reward: {metrics['reward']:.2f}")
 
-        print(f"Score: {metrics['score']}, Accuracy: {metrics['accuracy']:.1%}, Reward: {metrics['reward']:.2f}")
+    duration = time.time() - start_time
+    if cache:
+        cache.close()
+
+    for path in write_tapes(tapes, partial(load_model, args.model_path),
+                            lambda seed: make_env(args.reward_mode, False, args.max_steps, seed, args.action_repeat,
+                                                  args.obs_mode, args.pixel_size),
+                            seeds, "aim_trainer", {"reward_mode": args.reward_mode, "max_steps": args.max_steps,
+                                          "action_repeat": args.action_repeat, "obs_mode": args.obs_mode,
+                                          "pixel_size": args.pixel_size}, args.tape_dir,
+                            args.model_path):
+        print(f"Saved tape {path}")
 
     print("\nEvaluation:")
 
-    rewards = [r["reward"] for r in rows]
-    scores = [r["score"] for r in rows]
-    accuracies = [r["accuracy"] for r in rows]
-    steps = [r["steps"] for r in rows]
-    hits = [r["hits"] for r in rows]
-    misses = [r["misses"] for r in rows]
-
-    mean_reward = float(np.mean(rewards))
-    std_reward = float(np.std(rewards))
-    mean_score = float(np.mean(scores))
-    std_score = float(np.std(scores))
-    mean_accuracy = float(np.mean(accuracies))
-    std_accuracy = float(np.std(accuracies))
-    mean_steps = float(np.mean(steps))
-    total_hits = sum(hits)
-    total_misses = sum(misses)
+    mean_reward = agg.mean("reward")
+    std_reward = agg.std("reward")
+    mean_score = agg.mean("score")
+    std_score = agg.std("score")
+    mean_accuracy = agg.mean("accuracy")
+    std_accuracy = agg.std("accuracy")
+    mean_steps = agg.mean("steps")
+    total_hits = agg.total("hits")
+    total_misses = agg.total("misses")
     overall_accuracy = total_hits / (total_hits + total_misses) if (total_hits + total_misses) > 0 else 0.0
-    crash_rate = float(np.mean([r["crashed"] for r in rows]))
+    crash_rate = agg.mean("crashed")
 
-    print(f"Episodes: {len(rows)}")
+    print(f"Episodes: {agg.n}")
     print(f"Mean Reward: {mean_reward:.2f} ± {std_reward:.2f}")
     print(f"Mean Score: {mean_score:.2f} ± {std_score:.2f}")
     print(f"Mean Accuracy: {mean_accuracy:.1%} ± {std_accuracy:.1%}")
@@ -137,35 +267,39 @@ def main():
 
     print("\nPerformance:")
     print("-" * 30)
-    excellent = sum(1 for r in rows if r["score"] >= 140)
-    good = sum(1 for r in rows if 0.6 <= r["score"] < 139)
-    fair = sum(1 for r in rows if 0.4 <= r["score"] < 110)
-    poor = sum(1 for r in rows if r["score"] < 75)
+    excellent = agg.counters["excellent"]
+    good = agg.counters["good"]
+    fair = agg.counters["fair"]
+    poor = agg.counters["poor"]
 
     print(f"Excellent (≥140): {excellent} episodes")
     print(f"Good (110-139): {good} episodes")
     print(f"Fair (75-110): {fair} episodes")
     print(f"Poor (50): {poor} episodes")
 
-    action_vars_x = [r["action_var_x"] for r in rows]
-    action_vars_y = [r["action_var_y"] for r in rows]
-
     print("\nActions")
     print("-" * 30)
-    print(f"Avg Action Variance X: {np.mean(action_vars_x):.4f}")
-    print(f"Avg Action Variance Y: {np.mean(action_vars_y):.4f}")
-
-    fieldnames = [
-        "episode", "reward", "score", "accuracy", "steps", "hits", "misses",
-        "total_clicks", "crashed", "truncated", "action_var_x", "action_var_y",
-        "avg_action_x", "avg_action_y"
-    ]
-
-    with open(f"logs/snake_eval_{args.reward_mode}.csv", "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
+    print(f"Avg Action Variance X: {agg.mean('action_var_x'):.4f}")
+    print(f"Avg Action Variance Y: {agg.mean('action_var_y'):.4f}")
+
+    registry.record_eval(
+        "aim_trainer",
+        args.model_path,
+        config=vars(args),
+        metrics={
+            "mean_reward": mean_reward,
+            "std_reward": std_reward,
+            "mean_score": mean_score,
+            "std_score": std_score,
+            "mean_accuracy": mean_accuracy,
+            "overall_accuracy": overall_accuracy,
+            "mean_steps": mean_steps,
+            "crash_rate": crash_rate,
+        },
+        duration=duration,
+        steps_per_sec=agg.total("steps") / duration if duration > 0 else None,
+    )
+    registry.close()
 
 
 
@@ -1,20 +1,28 @@
 import argparse
 import os
+import sys
+import time
+from functools import partial
 
 import gymnasium as gym
-from stable_baselines3 import PPO
-from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.logger import configure
 
 from aim_trainer_env import AimTrainerEnv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from rl_common.registry import record_sb3_training
 
-def make_env(render_mode=None, seed=42, max_steps=5000):
+
+def make_env(render_mode=None, seed=42, max_steps=5000, action_repeat=1, obs_mode="features", pixel_size=(64, 36)):
     """Create and wrap the AimTrainer environment"""
+    from stable_baselines3.common.monitor import Monitor
+
     env = AimTrainerEnv(
         render_mode=render_mode,
         seed=seed,
-        max_steps=max_steps
+        max_steps=max_steps,
+        action_repeat=action_repeat,
+        obs_mode=obs_mode,
+        pixel_size=pixel_size
     )
     env = Monitor(env)
     return env
@@ -30,8 +38,14 @@ def main():
     parser.add_argument("--modeldir", type=str, default="./models",
                         help="Directory to save models")
     parser.add_argument("--max_steps", type=int, default=5000)
+    parser.add_argument("--action_repeat", type=int, default=1,
+                        help="Clicks per policy step (rewards are summed)")
     parser.add_argument("--reward_mode", type=str, default="accuracy",
                         choices=["survival", "accuracy"])
+    parser.add_argument("--obs_mode", type=str, default="features", choices=AimTrainerEnv.OBS_MODES,
+                        help="features (positions and ball size) or pixels (a small picture, trained with a CNN)")
+    parser.add_argument("--pixel_size", type=int, nargs=2, default=[64, 36], metavar=("WIDTH", "HEIGHT"),
+                        help="Size of the pixel observations")
 
     parser.add_argument("--learning_rate", type=float, default=1e-4)
     parser.add_argument("--n_steps", type=int, default=2048)
@@ -40,8 +54,17 @@ def main():
     parser.add_argument("--gamma", type=float, default=0.99)
     parser.add_argument("--gae_lambda", type=float, default=0.95)
 
+    parser.add_argument("--n_envs", type=int, default=1,
+                        help="Environments stepped in parallel worker processes (n_steps is per environment)")
+    parser.add_argument("--vec_env", type=str, default="shm", choices=["shm", "async", "subproc", "dummy"],
+                        help="Vector env used when n_envs > 1")
+
     args = parser.parse_args()
 
+    # Imported after parsing so --help doesn't wait for torch
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.logger import configure
+
     os.makedirs(args.logdir, exist_ok=True)
     os.makedirs(args.modeldir, exist_ok=True)
 
@@ -52,12 +75,23 @@ def main():
 
     env = make_env(
         seed=args.seed,
-        max_steps=args.max_steps
+        max_steps=args.max_steps,
+        action_repeat=args.action_repeat,
+        obs_mode=args.obs_mode,
+        pixel_size=args.pixel_size
     )
 
+    train_env = env
+    if args.n_envs > 1:
+        from rl_common.shm_vec_env import make_vec_env
+        train_env = make_vec_env([partial(make_env, seed=args.seed + i, max_steps=args.max_steps,
+                                          action_repeat=args.action_repeat, obs_mode=args.obs_mode,
+                                          pixel_size=args.pixel_size) for i in range(args.n_envs)],
+                                 args.vec_env)
+
     model = PPO(
-        policy="MlpPolicy",
-        env=env,
+        policy="CnnPolicy" if args.obs_mode == "pixels" else "MlpPolicy",
+        env=train_env,
         verbose=1,
         tensorboard_log=args.logdir,
         seed=args.seed,
@@ -78,9 +112,14 @@ def main():
         )
     )
 
+    if args.n_envs > 1 and args.vec_env == "async":
+        from rl_common.async_rollouts import use_async_rollouts
+        use_async_rollouts(model)
+
     new_logger = configure(args.logdir, ["stdout", "tensorboard"])
     model.set_logger(new_logger)
 
+    start_time = time.time()
     model.learn(
         total_timesteps=args.timesteps,
         progress_bar=True
@@ -89,6 +128,7 @@ def main():
     save_name = f"ppo_aim_trainer_{args.reward_mode}"
     save_path = os.path.join(args.modeldir, save_name)
     model.save(save_path)
+    duration = time.time() - start_time
 
     print("Training completed!")
     print(f"Model saved to: {save_path}")
@@ -108,7 +148,18 @@ def main():
 
     print(f"Test Results - Steps: {steps}, Total Reward: {total_reward:.2f}, Score: {info['score']}")
 
+    record_sb3_training(
+        "aim_trainer", save_name, model, save_path, duration,
+        config=vars(args),
+        metrics={
+            "test_reward": total_reward,
+            "test_score": info["score"],
+        },
+    )
+
     env.close()
+    if train_env is not env:
+        train_env.close()
 
 
 if __name__ == "__main__":
@@ -1,12 +1,18 @@
 import argparse
-import pygame
-from stable_baselines3 import PPO
+import os
+import sys
+
 from aim_trainer_env import AimTrainerEnv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from rl_common.inference_server import load_model
+from rl_common.policies import BACKENDS, CNN_BACKENDS
+from rl_common.tapes import Tape, play
+
 
 def main():
     parser = argparse.ArgumentParser(description="Watch trained Aim Trainer agent play")
-    parser.add_argument("--model_path", type=str, required=True,
+    parser.add_argument("--model_path", type=str, default=None,
                         help="Path to trained model (without .zip extension)")
     parser.add_argument("--max_steps", type=int, default=5000,
                         help="Maximum steps per episode")
@@ -14,12 +20,37 @@ def main():
                         help="Number of episodes to run")
     parser.add_argument("--fps", type=int, default=60,
                         help="Frames per second for rendering")
+    parser.add_argument("--backend", type=str, default="sb3", choices=BACKENDS,
+                        help="Inference backend to run the policy with")
+    parser.add_argument("--server", type=str, default=None,
+                        help="Get actions from a running inference server at this address "
+                             "(\"default\", a Unix socket path or host:port) instead of loading the model")
     parser.add_argument("--reward_mode", type=str, default="accuracy",
                         choices=["survival", "accuracy"],
                         help="Reward function to use")
-
+    parser.add_argument("--obs_mode", type=str, default="features", choices=AimTrainerEnv.OBS_MODES,
+                        help="Observation the model was trained on")
+    parser.add_argument("--pixel_size", type=int, nargs=2, default=[64, 36], metavar=("WIDTH", "HEIGHT"),
+                        help="Size of the pixel observations (must match training)")
+
+    parser.add_argument("--tape", type=str, default=None,
+                        help="Replay a tape saved by the eval script instead of running a model")
+    parser.add_argument("--speed", type=int, default=1,
+                        help="Tape steps shown per frame")
+    parser.add_argument("--start_step", type=int, default=0,
+                        help="Step of the tape to start from")
     args = parser.parse_args()
 
+    if args.tape:
+        tape = Tape.load(args.tape)
+        play(tape, lambda seed: AimTrainerEnv(render_mode="human", seed=seed, **tape.env_config),
+             fps=args.fps, speed=args.speed, start_step=args.start_step)
+        return
+    if args.model_path is None:
+        parser.error("--model_path is required unless --tape is given")
+    if args.obs_mode == "pixels" and args.backend not in CNN_BACKENDS:
+        parser.error(f"pixel models only run with --backend {' or '.join(CNN_BACKENDS)}")
+
     print(f"Model: {args.model_path}")
     print(f"Episodes: {args.episodes}")
     print(f"Max Steps: {args.max_steps}")
@@ -30,8 +61,9 @@ def main():
     print("Q - Quit")
     print("ESC - Quit")
 
+    import pygame
 
-    model = PPO.load(args.model_path)
+    model = load_model(args.model_path, args.server, args.backend)
 
     for episode in range(1, args.episodes + 1):
         print(f"\nEpisode {episode}/{args.episodes}")
@@ -39,7 +71,9 @@ def main():
         env = AimTrainerEnv(
             render_mode="human",
             max_steps=args.max_steps,
-            reward_mode=args.reward_mode
+            reward_mode=args.reward_mode,
+            obs_mode=args.obs_mode,
+            pixel_size=args.pixel_size
         )
 
         obs, info = env.reset()
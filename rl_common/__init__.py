@@ -0,0 +1,8 @@
+"""Shared tooling used by the snake, aim_trainer and FruitCatchers folders.
+
+The games themselves stay self-contained; this package only holds the
+analysis and evaluation helpers that are useful across all three of them.
+"""
+import os
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
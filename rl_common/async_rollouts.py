@@ -0,0 +1,333 @@
+"""Asynchronous rollout collection for PPO and A2C.
+
+With a synchronous vector env every step waits for the slowest worker: a long
+snake, or an env that renders, holds all the others up. `AsyncRollouts`
+replaces a model's `collect_rollouts` so that the learner acts for whichever
+workers of its `AsyncShmVecEnv` have finished their step (at least
+`min_ready` of them) and sends them straight back while the others are still
+stepping. Fast workers contribute more transitions to a rollout than slow
+ones; the rollout buffer still holds exactly n_steps * n_envs.
+
+Keeping it on-policy:
+
+- every transition in a rollout was acted by the policy being updated. A step
+  still running when the rollout ends was acted by that policy too, so when it
+  comes back during the next rollout its transition is dropped and the env
+  simply carries on from the observation it returned
+- each worker's transitions are kept as that worker's own trajectory, and the
+  buffer columns are filled with the trajectories one after the other.
+  Wherever a trajectory is cut (at the end of a buffer column or of the
+  worker's part of the rollout) without the episode having ended,
+  gamma * V(next observation) is added to the reward and the next row starts
+  a new segment. GAE then bootstraps at the cut the same way SB3 does at a
+  time limit. A step that hit a time limit already bootstraps from its final
+  observation, so nothing more is added at a cut there
+
+After every rollout the share of its wall time each worker spent stepping
+(`rollout/worker_utilization`, and `_min` for the least busy worker), the
+share the learner spent waiting for workers and the number of dropped
+transitions are logged.
+
+Usage:
+    env = make_vec_env(env_fns, "async")
+    model = use_async_rollouts(PPO("MlpPolicy", env))
+
+Benchmark against the synchronous env, with stragglers simulated by making
+some workers sleep on every step:
+    python -m rl_common.async_rollouts --game snake --n_envs 4 --slow_envs 1 --slow_ms 2
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from functools import partial
+from typing import List, Optional, Tuple
+
+import gymnasium as gym
+import numpy as np
+import torch as th
+from gymnasium import spaces
+from stable_baselines3.common.buffers import RolloutBuffer
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.on_policy_algorithm import OnPolicyAlgorithm
+from stable_baselines3.common.utils import obs_as_tensor
+from stable_baselines3.common.vec_env import VecEnv
+
+from rl_common.shm_vec_env import AsyncShmVecEnv
+
+# (obs, action, reward, value, log_prob, episode_start, terminal, timeout_obs)
+Transition = Tuple[np.ndarray, np.ndarray, float, float, float, bool, bool, Optional[np.ndarray]]
+
+
+def fill_buffer(rollout_buffer: RolloutBuffer, trajectories: List[List[Transition]], next_values: List[float],
+                gamma: float) -> None:
+    """Lay the workers' trajectories into the buffer's columns and compute returns and advantages.
+
+    `next_values[i]` is V of the state after trajectory i's last transition. Timeout rewards must already
+    include their bootstrap, as in SB3.
+    """
+    n_steps, n_envs = rollout_buffer.buffer_size, rollout_buffer.n_envs
+    rows = [t for trajectory in trajectories for t in trajectory]
+    assert len(rows) == n_steps * n_envs, f"{len(rows)} transitions for a {n_steps}x{n_envs} buffer"
+    values = np.array([t[3] for t in rows], dtype=np.float32)
+    rewards = np.array([t[2] for t in rows], dtype=np.float32)
+    terminal = np.array([t[6] for t in rows])
+    timeout = np.array([t[7] is not None for t in rows])
+    starts = np.array([t[5] for t in rows])
+
+    # V of the state after each row: the next row's, or the trajectory's next value at its end
+    after = np.empty_like(values)
+    ends = np.zeros(len(rows), dtype=bool)
+    pos = 0
+    for trajectory, next_value in zip(trajectories, next_values):
+        if trajectory:
+            end = pos + len(trajectory)
+            after[pos:end - 1] = values[pos + 1:end]
+            after[end - 1] = next_value
+            ends[end - 1] = True
+            pos = end
+    ends[n_steps - 1::n_steps] = True
+    # After a time limit the next row is the reset observation of a new episode
+    cut = ends & ~terminal & ~timeout
+    rewards[cut] += gamma * after[cut]
+    starts[1:] |= ends[:-1]
+
+    def columns(x: np.ndarray) -> np.ndarray:
+        # Row k * n_steps + t goes to buffer row t of column k
+        return x.reshape((n_envs, n_steps) + x.shape[1:]).swapaxes(0, 1)
+
+    rollout_buffer.observations[:] = columns(np.array([t[0] for t in rows]))
+    rollout_buffer.actions[:] = columns(np.array([t[1] for t in rows]).reshape(len(rows), -1))
+    rollout_buffer.rewards[:] = columns(rewards)
+    rollout_buffer.episode_starts[:] = columns(starts)
+    rollout_buffer.values[:] = columns(values)
+    rollout_buffer.log_probs[:] = columns(np.array([t[4] for t in rows], dtype=np.float32))
+    rollout_buffer.pos, rollout_buffer.full = n_steps, True
+    # Every column ends at a cut, a terminal or a time limit, so nothing is bootstrapped past the last row
+    rollout_buffer.compute_returns_and_advantage(last_values=th.zeros(n_envs), dones=np.ones(n_envs))
+
+
+class AsyncRollouts:
+    """Collects `model`'s rollouts from its `AsyncShmVecEnv` (see the module docstring).
+
+    :param model: PPO or A2C model whose env is an `AsyncShmVecEnv`
+    :param min_ready: Finished workers to wait for before acting; more gives larger policy batches
+    """
+
+    def __init__(self, model: OnPolicyAlgorithm, min_ready: int = 1):
+        if not isinstance(model.env, AsyncShmVecEnv):
+            raise ValueError(f"AsyncRollouts needs an AsyncShmVecEnv, not {type(model.env).__name__}")
+        self.model = model
+        self.env: AsyncShmVecEnv = model.env
+        self.min_ready = min_ready
+        n_envs = self.env.num_envs
+        # Latest observation of every env, and whether it starts an episode
+        self.obs: Optional[np.ndarray] = None
+        self.episode_start = np.ones(n_envs, dtype=bool)
+        # (obs, action, value, log_prob, episode_start) of each running step
+        self.pending: List[Optional[tuple]] = [None] * n_envs
+        # Running steps acted by an earlier policy
+        self.stale = np.zeros(n_envs, dtype=bool)
+        self.utilization = np.zeros(n_envs)
+
+    def _act(self, indices: np.ndarray) -> None:
+        if len(indices) == 0:
+            return
+        model, policy = self.model, self.model.policy
+        obs = self.obs[indices]
+        with th.no_grad():
+            actions, values, log_probs = policy(obs_as_tensor(obs, model.device))
+        actions = actions.cpu().numpy()
+        clipped_actions = actions
+        if isinstance(model.action_space, spaces.Box):
+            if policy.squash_output:
+                clipped_actions = policy.unscale_action(clipped_actions)
+            else:
+                clipped_actions = np.clip(actions, model.action_space.low, model.action_space.high)
+        values = values.flatten().cpu().numpy()
+        log_probs = log_probs.cpu().numpy()
+        for k, i in enumerate(indices):
+            self.pending[i] = (obs[k], actions[k], values[k], log_probs[k], bool(self.episode_start[i]))
+        self.env.send(indices, clipped_actions)
+
+    def _values(self, obs: List[np.ndarray]) -> np.ndarray:
+        if not obs:
+            return np.zeros(0, dtype=np.float32)
+        with th.no_grad():
+            values = self.model.policy.predict_values(obs_as_tensor(np.array(obs), self.model.device))
+        return values.flatten().cpu().numpy()
+
+    def collect_rollouts(self, env: VecEnv, callback: BaseCallback, rollout_buffer: RolloutBuffer,
+                         n_rollout_steps: int) -> bool:
+        """Drop-in for `OnPolicyAlgorithm.collect_rollouts`."""
+        model, n_envs = self.model, self.env.num_envs
+        model.policy.set_training_mode(False)
+        if model.use_sde:
+            model.policy.reset_noise(n_envs)
+        if model._last_obs is not self.obs:
+            # learn() has just reset the env (which waited for any running steps)
+            self.obs = np.array(model._last_obs)
+            self.episode_start[:] = model._last_episode_starts
+            self.pending = [None] * n_envs
+            self.stale[:] = False
+        rollout_buffer.reset()
+        callback.on_rollout_start()
+
+        total = n_rollout_steps * n_envs
+        trajectories: List[List[Transition]] = [[] for _ in range(n_envs)]
+        collected = dropped = unreported = 0
+        waited = 0.0
+        # What the callback sees at each of its steps: everything since its previous step
+        new_obs, rewards, dones, infos = [], [], [], []
+        busy, start = self.env.busy_time(), time.perf_counter()
+        self._act(np.flatnonzero(~self.env.in_flight))
+        while collected < total:
+            wait_start = time.perf_counter()
+            indices, batch_obs, batch_rewards, batch_dones, batch_infos = self.env.poll(self.min_ready)
+            waited += time.perf_counter() - wait_start
+            fresh = []
+            for k, i in enumerate(indices):
+                if self.stale[i]:
+                    self.stale[i] = False
+                    dropped += 1
+                else:
+                    obs, action, value, log_prob, episode_start = self.pending[i]
+                    info = batch_infos[k]
+                    timeout_obs = info["terminal_observation"] if info.get("TimeLimit.truncated") else None
+                    terminal = bool(batch_dones[k]) and timeout_obs is None
+                    trajectories[i].append((obs, action, float(batch_rewards[k]), value, log_prob, episode_start,
+                                            terminal, timeout_obs))
+                    fresh.append(k)
+                self.pending[i] = None
+                self.obs[i] = batch_obs[k]
+                self.episode_start[i] = batch_dones[k]
+            # Episodes that ended in a dropped step still count in the episode stats
+            model._update_info_buffer(batch_infos, batch_dones)
+            collected += len(fresh)
+            model.num_timesteps += len(fresh)
+            new_obs += [batch_obs[k] for k in fresh]
+            rewards += [batch_rewards[k] for k in fresh]
+            dones += [batch_dones[k] for k in fresh]
+            infos += [batch_infos[k] for k in fresh]
+
+            # One callback step per n_envs transitions, as with a synchronous env
+            unreported += len(fresh)
+            while unreported >= n_envs:
+                unreported -= n_envs
+                callback.update_locals(locals())
+                if not callback.on_step():
+                    self.stale |= self.env.in_flight
+                    return False
+                new_obs, rewards, dones, infos = [], [], [], []
+            if collected < total:
+                self._act(indices)
+
+        self.stale |= self.env.in_flight
+        # The last batch may overshoot: its newest transitions go, and each one's value bootstraps the one before
+        next_values: List[Optional[float]] = [None] * n_envs
+        excess = collected - total
+        for k in fresh[len(fresh) - excess:] if excess else ():
+            i = indices[k]
+            next_values[i] = trajectories[i].pop()[3]
+        unknown = []
+        for i in range(n_envs):
+            if next_values[i] is None:
+                if self.env.in_flight[i]:
+                    next_values[i] = self.pending[i][2]
+                else:
+                    unknown.append(i)
+        for i, value in zip(unknown, self._values([self.obs[i] for i in unknown])):
+            next_values[i] = value
+        # Time limits bootstrap with the value of the final observation, as SB3 does
+        timeouts = [(i, j) for i, trajectory in enumerate(trajectories) for j, t in enumerate(trajectory)
+                    if t[7] is not None]
+        for (i, j), value in zip(timeouts, self._values([trajectories[i][j][7] for i, j in timeouts])):
+            t = trajectories[i][j]
+            trajectories[i][j] = (t[0], t[1], t[2] + model.gamma * float(value)) + t[3:]
+        fill_buffer(rollout_buffer, trajectories, next_values, model.gamma)
+        model._last_obs = self.obs
+        model._last_episode_starts = self.episode_start.copy()
+
+        elapsed = time.perf_counter() - start
+        self.utilization = (self.env.busy_time() - busy) / elapsed
+        model.logger.record("rollout/worker_utilization", float(self.utilization.mean()))
+        model.logger.record("rollout/worker_utilization_min", float(self.utilization.min()))
+        model.logger.record("rollout/learner_wait", waited / elapsed)
+        model.logger.record("rollout/dropped_stale", dropped)
+
+        callback.update_locals(locals())
+        callback.on_rollout_end()
+        return True
+
+
+def use_async_rollouts(model: OnPolicyAlgorithm, min_ready: int = 1) -> OnPolicyAlgorithm:
+    """Collect `model`'s rollouts with `AsyncRollouts` if it trains on an `AsyncShmVecEnv`; returns the model."""
+    if not isinstance(model.env, AsyncShmVecEnv):
+        return model
+    excluded = model._excluded_save_params
+    model.collect_rollouts = AsyncRollouts(model, min_ready).collect_rollouts
+    # Bound methods in the instance dict would otherwise be pickled into the saved zip
+    model._excluded_save_params = lambda: excluded() + ["collect_rollouts", "_excluded_save_params"]
+    return model
+
+
+class _Slow(gym.Wrapper):
+    """Sleeps `seconds` on every step, to stand in for an expensive env."""
+
+    def __init__(self, env: gym.Env, seconds: float):
+        super().__init__(env)
+        self.seconds = seconds
+
+    def step(self, action):
+        time.sleep(self.seconds)
+        return self.env.step(action)
+
+
+def _make_env(game: str, seed: int, slow: float):
+    from rl_common.env_bench import make_env
+    from stable_baselines3.common.monitor import Monitor
+
+    env = Monitor(make_env(game, seed))
+    return _Slow(env, slow) if slow else env
+
+
+def main():
+    from stable_baselines3 import A2C, PPO
+
+    from rl_common.shm_vec_env import make_vec_env
+    from rl_common.tournament import GAMES
+
+    parser = argparse.ArgumentParser(description="Compare rollout collection with synchronous and async workers")
+    parser.add_argument("--game", type=str, default="snake", choices=sorted(GAMES))
+    parser.add_argument("--algo", type=str, default="ppo", choices=["ppo", "a2c"])
+    parser.add_argument("--n_envs", type=int, default=4)
+    parser.add_argument("--n_steps", type=int, default=256, help="Steps per env per rollout")
+    parser.add_argument("--rollouts", type=int, default=4, help="Rollouts timed per vector env (after one warmup)")
+    parser.add_argument("--slow_envs", type=int, default=1, help="Workers that sleep on every step")
+    parser.add_argument("--slow_ms", type=float, default=2.0, help="How long they sleep")
+    parser.add_argument("--min_ready", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    algo = PPO if args.algo == "ppo" else A2C
+    print(f"{args.game}: {args.n_envs} envs, {args.slow_envs} sleeping {args.slow_ms} ms a step, "
+          f"{args.n_steps} steps per env per rollout")
+    for kind in ("shm", "async"):
+        env_fns = [partial(_make_env, args.game, args.seed + i, args.slow_ms / 1000 if i < args.slow_envs else 0.0)
+                   for i in range(args.n_envs)]
+        env = make_vec_env(env_fns, kind)
+        model = use_async_rollouts(algo("MlpPolicy", env, n_steps=args.n_steps, seed=args.seed, device="cpu"),
+                                   args.min_ready)
+        model.learn(args.n_steps * args.n_envs)
+        busy, start = env.busy_time(), time.perf_counter()
+        model.learn(args.n_steps * args.n_envs * args.rollouts, reset_num_timesteps=False)
+        elapsed = time.perf_counter() - start
+        utilization = (env.busy_time() - busy) / elapsed
+        steps = args.n_steps * args.n_envs * args.rollouts
+        print(f"{kind:6s} {steps / elapsed:9.0f} steps/s (including updates)  worker utilization "
+              + " ".join(f"{u:.2f}" for u in utilization))
+        env.close()
+
+
+if __name__ == "__main__":
+    main()
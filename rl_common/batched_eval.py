@@ -0,0 +1,149 @@
+"""Lockstep evaluation: step K environments together and batch the policy calls.
+
+For the small MLP policies in this repo a single `model.predict(obs)` is
+mostly framework overhead, so calling it once per step for a stack of K
+observations costs about the same as calling it for one. The evaluator keeps
+K episode slots busy: every step the observations of the live slots are
+stacked into one batch, and a slot whose episode ends is refilled with the
+next seed from the queue (or masked out once the queue is empty).
+
+Anything implementing the small `EnvBatch` interface can be driven this way;
+`ScalarEnvBatch` adapts a list of ordinary single-episode envs.
+"""
+from __future__ import annotations
+
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class EnvBatch:
+    """A fixed number of env slots that can be reset individually and stepped together."""
+
+    num_envs: int
+
+    def reset_slot(self, index: int, seed: Optional[int]) -> Tuple[np.ndarray, dict]:
+        raise NotImplementedError
+
+    def step(self, actions: np.ndarray, active: np.ndarray):
+        """Step the slots where `active` is True with the matching rows of `actions`.
+
+        Returns (obs, rewards, terminated, truncated, infos) with one entry per
+        slot; entries for inactive slots are left untouched and must be ignored.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ScalarEnvBatch(EnvBatch):
+    def __init__(self, make_env: Callable[[], object], num_envs: int):
+        self.envs = [make_env() for _ in range(num_envs)]
+        self.num_envs = num_envs
+        self._obs: Optional[np.ndarray] = None
+        self._rewards = np.zeros(num_envs, dtype=np.float64)
+        self._terminated = np.zeros(num_envs, dtype=bool)
+        self._truncated = np.zeros(num_envs, dtype=bool)
+        self._infos: List[dict] = [{} for _ in range(num_envs)]
+
+    def reset_slot(self, index, seed):
+        env = self.envs[index]
+        # Same RNG state as building a fresh `Env(seed=seed)` and calling reset(),
+        # which is what the per-episode eval loops do
+        if seed is not None:
+            env.reset(seed=seed)
+        obs, info = env.reset()
+        if self._obs is None:
+            self._obs = np.zeros((self.num_envs,) + np.shape(obs), dtype=np.asarray(obs).dtype)
+        self._obs[index] = obs
+        return obs, info
+
+    def step(self, actions, active):
+        for i in np.flatnonzero(active):
+            obs, r, term, trunc, info = self.envs[i].step(actions[i])
+            self._obs[i] = obs
+            self._rewards[i] = r
+            self._terminated[i] = term
+            self._truncated[i] = trunc
+            self._infos[i] = info
+        return self._obs, self._rewards, self._terminated, self._truncated, self._infos
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+def sb3_predictor(model) -> Callable[[np.ndarray], np.ndarray]:
+    """Deterministic batched predict for a stable-baselines3 model."""
+    def predict(obs: np.ndarray) -> np.ndarray:
+        actions, _ = model.predict(obs, deterministic=True)
+        return actions
+    return predict
+
+
+def run_lockstep(
+        envs: EnvBatch,
+        predict: Callable[[np.ndarray], np.ndarray],
+        seeds: Sequence[Optional[int]],
+        make_tracker: Callable[[], object],
+) -> Iterator[Tuple[int, dict]]:
+    """Run one episode per entry of `seeds` and yield (episode, result) in episode order.
+
+    `make_tracker()` builds a per-episode object with `step(action, reward, info)`
+    and `finish(terminated, truncated, info) -> dict`, the same trackers the
+    eval scripts use for their one-episode-at-a-time loop.
+    """
+    n = envs.num_envs
+    active = np.zeros(n, dtype=bool)
+    episode_of = np.full(n, -1, dtype=np.int64)
+    trackers: List[Optional[object]] = [None] * n
+    next_episode = 0
+    obs_batch = None
+
+    def start(slot):
+        nonlocal next_episode, obs_batch
+        if next_episode >= len(seeds):
+            active[slot] = False
+            return
+        obs, _ = envs.reset_slot(slot, seeds[next_episode])
+        if obs_batch is None:
+            obs_batch = np.zeros((n,) + np.shape(obs), dtype=np.asarray(obs).dtype)
+        obs_batch[slot] = obs
+        episode_of[slot] = next_episode
+        trackers[slot] = make_tracker()
+        active[slot] = True
+        next_episode += 1
+
+    for slot in range(n):
+        start(slot)
+
+    # Episodes finish out of order; hold results back so they come out in order
+    finished: Dict[int, dict] = {}
+    next_to_yield = 0
+    actions = None
+
+    while active.any():
+        live = np.flatnonzero(active)
+        live_actions = np.asarray(predict(obs_batch[live]))
+        if actions is None:
+            actions = np.zeros((n,) + live_actions.shape[1:], dtype=live_actions.dtype)
+        actions[live] = live_actions
+
+        obs, rewards, terminated, truncated, infos = envs.step(actions, active)
+
+        for slot in live:
+            tracker = trackers[slot]
+            tracker.step(actions[slot], float(rewards[slot]), infos[slot])
+            if terminated[slot] or truncated[slot]:
+                finished[int(episode_of[slot])] = tracker.finish(bool(terminated[slot]), bool(truncated[slot]),
+                                                                 infos[slot])
+                start(slot)
+            else:
+                obs_batch[slot] = obs[slot]
+
+        while next_to_yield in finished:
+            yield next_to_yield + 1, finished.pop(next_to_yield)
+            next_to_yield += 1
+
+    envs.close()
@@ -0,0 +1,245 @@
+"""Distil a trained policy into smaller networks and chart latency against score.
+
+1. The teacher plays episodes (with a little random exploration so the data
+   also covers states just off its own path) and every observation is stored
+   with the teacher's action distribution: logits for discrete actions, mean
+   and log std for boxes. The dataset is saved as an `.npz`.
+2. For each student size a fresh model of the teacher's algorithm is built
+   with that `net_arch` and its actor is trained to minimise
+   KL(teacher || student) on the dataset. Optional DAgger rounds then let the
+   student drive, label its states with the teacher and train again.
+3. Teacher and students are evaluated on the same seeds and their predict
+   latency is measured, giving the latency/score curve.
+
+Students are ordinary SB3 zips saved next to the teacher
+(`<teacher>_student_32x32.zip`), so every eval script, backend export and the
+registry work with them unchanged. Their value network is left untrained.
+
+Usage:
+    python -m rl_common.distill snake/models/ppo_snake_survival --sizes 32,32 64,64 128,128
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from rl_common.eval_cache import episode_seeds
+from rl_common.numpy_policy import from_sb3
+from rl_common.policies import backend_file, load_sb3
+from rl_common.registry import RunRegistry
+from rl_common.tournament import GAMES, episode_metrics, game_of, load_game, model_env_kwargs
+
+
+def teacher_targets(model, obs: np.ndarray) -> np.ndarray:
+    """Logits (discrete) or [mean, log_std] (box) of the teacher for each observation."""
+    out = []
+    with torch.no_grad():
+        for i in range(0, len(obs), 4096):
+            dist = model.policy.get_distribution(torch.as_tensor(obs[i:i + 4096], device=model.device))
+            d = dist.distribution
+            if isinstance(d, torch.distributions.Categorical):
+                out.append(d.logits.cpu().numpy())
+            else:
+                out.append(torch.cat([d.mean, d.stddev.log()], dim=1).cpu().numpy())
+    return np.concatenate(out).astype(np.float32)
+
+
+def collect(game: str, driver, seeds: List[int], env_kwargs: dict, max_samples: int, explore: float,
+            rng: np.random.Generator) -> np.ndarray:
+    """Observations of episodes driven by `driver`, with probability `explore` of a random action."""
+    module = load_game(game)
+    observations = []
+    for seed in seeds:
+        env = module.make_env(seed=seed, **env_kwargs)
+        obs, _ = env.reset()
+        done = trunc = False
+        while not (done or trunc) and len(observations) < max_samples:
+            observations.append(obs)
+            if rng.random() < explore:
+                action = env.action_space.sample()
+            else:
+                action, _ = driver.predict(obs, deterministic=True)
+            obs, _, done, trunc, _ = env.step(action)
+        env.close()
+        if len(observations) >= max_samples:
+            break
+    return np.asarray(observations, dtype=np.float32)
+
+
+def make_student(teacher, sizes: List[int], env):
+    """Untrained model of the teacher's algorithm with a smaller network."""
+    policy_kwargs = dict(net_arch=dict(pi=list(sizes), vf=list(sizes)),
+                         activation_fn=teacher.policy.activation_fn)
+    student = type(teacher)("MlpPolicy", env, policy_kwargs=policy_kwargs, seed=0, device="cpu")
+    if hasattr(teacher.policy, "log_std"):
+        with torch.no_grad():
+            student.policy.log_std.copy_(teacher.policy.log_std)
+    return student
+
+
+def kl_loss(student, obs: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
+    """Mean KL(teacher || student) over the batch."""
+    d = student.policy.get_distribution(obs).distribution
+    if isinstance(d, torch.distributions.Categorical):
+        teacher_logp = torch.log_softmax(target, dim=1)
+        return (teacher_logp.exp() * (teacher_logp - d.logits)).sum(dim=1).mean()
+    n = target.shape[1] // 2
+    t_mean, t_log_std = target[:, :n], target[:, n:]
+    s_mean, s_log_std = d.mean, d.stddev.log()
+    kl = (s_log_std - t_log_std
+          + (torch.exp(2 * t_log_std) + (t_mean - s_mean) ** 2) / (2 * torch.exp(2 * s_log_std)) - 0.5)
+    return kl.sum(dim=1).mean()
+
+
+def train(student, obs: np.ndarray, targets: np.ndarray, epochs: int, batch_size: int, lr: float,
+          rng: np.random.Generator) -> float:
+    """Fit the student's actor to the targets; returns the final mean KL over the dataset."""
+    policy = student.policy
+    params = list(policy.mlp_extractor.policy_net.parameters()) + list(policy.action_net.parameters())
+    if hasattr(policy, "log_std"):
+        params.append(policy.log_std)
+    optimizer = torch.optim.Adam(params, lr=lr)
+    obs_t, target_t = torch.as_tensor(obs), torch.as_tensor(targets)
+
+    policy.set_training_mode(True)
+    for _ in range(epochs):
+        order = torch.as_tensor(rng.permutation(len(obs)))
+        for i in range(0, len(obs), batch_size):
+            idx = order[i:i + batch_size]
+            loss = kl_loss(student, obs_t[idx], target_t[idx])
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+    policy.set_training_mode(False)
+    with torch.no_grad():
+        return float(kl_loss(student, obs_t, target_t))
+
+
+def latency_us(policy, obs: np.ndarray, repeats: int = 500) -> float:
+    policy.predict(obs, deterministic=True)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        policy.predict(obs, deterministic=True)
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def param_count(model) -> int:
+    policy = model.policy
+    modules = [policy.mlp_extractor.policy_net, policy.action_net]
+    return sum(p.numel() for m in modules for p in m.parameters())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distil a trained policy into smaller students")
+    parser.add_argument("model_path", type=str, help="Teacher model (with or without .zip)")
+    parser.add_argument("--sizes", nargs="+", default=["32,32"],
+                        help="Student hidden layer sizes, one comma separated list per student")
+    parser.add_argument("--game", type=str, default=None, choices=[g for g, s in GAMES.items() if s.lockstep],
+                        help="Game the teacher plays (worked out from the models folder if not given)")
+    parser.add_argument("--reward_mode", type=str, default=None,
+                        help="Env reward mode (defaults to the one the teacher was trained with)")
+    parser.add_argument("--max_steps", type=int, default=5000, help="Maximum steps per episode")
+    parser.add_argument("--samples", type=int, default=100_000, help="Observations in the teacher dataset")
+    parser.add_argument("--explore", type=float, default=0.05,
+                        help="Chance of a random action while collecting, to cover states off the teacher's path")
+    parser.add_argument("--dagger", type=int, default=1,
+                        help="Rounds where the student drives and the teacher labels its states")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch_size", type=int, default=256)
+    parser.add_argument("--learning_rate", type=float, default=1e-3)
+    parser.add_argument("--eval_episodes", type=int, default=30, help="Episodes for the score of each policy")
+    parser.add_argument("--metric", type=str, default="score")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dataset", type=str, default=None,
+                        help="Where to save the teacher dataset (default <teacher>_distill.npz)")
+    args = parser.parse_args()
+
+    zip_path = backend_file(args.model_path)
+    game = args.game or game_of(zip_path)
+    if game is None or not GAMES[game].lockstep:
+        parser.error("distillation needs a seeded env with make_env (snake or aim_trainer), pass --game")
+    registry = RunRegistry()
+    registry.ensure_populated()
+    run = registry.model_run(os.path.abspath(zip_path))
+    reward_mode = args.reward_mode or (run["reward_mode"] if run is not None else None) or GAMES[game].reward_modes[0]
+    env_kwargs = model_env_kwargs(registry, game, os.path.abspath(zip_path),
+                                  {"reward_mode": reward_mode, "max_steps": args.max_steps})
+
+    module = load_game(game)
+    teacher = load_sb3(zip_path)
+    try:
+        # Students are MLPs and the latency column runs the numpy export
+        from_sb3(teacher)
+    except ValueError as e:
+        parser.error(f"{zip_path}: {e}")
+    rng = np.random.default_rng(args.seed)
+    # Collection and evaluation seeds come from different streams
+    _, collect_seeds = episode_seeds(args.seed, 10_000)
+    _, eval_seeds = episode_seeds(args.seed + 1, args.eval_episodes)
+
+    start = time.time()
+    obs = collect(game, teacher, collect_seeds, env_kwargs, args.samples, args.explore, rng)
+    targets = teacher_targets(teacher, obs)
+    dataset = args.dataset or zip_path[:-len(".zip")] + "_distill.npz"
+    np.savez_compressed(dataset, obs=obs, targets=targets)
+    print(f"Teacher: {os.path.basename(zip_path)[:-4]} ({game}, reward mode {reward_mode})")
+    print(f"Dataset: {len(obs)} observations in {time.time() - start:.1f}s -> {dataset}")
+
+    probe = obs[0]
+    rows: List[Tuple[str, int, Optional[float], float, float, float]] = []
+    teacher_scores = episode_metrics(game, teacher, eval_seeds, env_kwargs, args.metric, 16)
+    rows.append(("teacher", param_count(teacher), None, teacher_scores.mean(),
+                 latency_us(from_sb3(teacher), probe), latency_us(teacher, probe)))
+
+    for spec in args.sizes:
+        sizes = [int(s) for s in spec.split(",")]
+        name = "x".join(map(str, sizes))
+        student = make_student(teacher, sizes, module.make_env(**env_kwargs))
+        start = time.time()
+        train_obs, train_targets = obs, targets
+        kl = train(student, train_obs, train_targets, args.epochs, args.batch_size, args.learning_rate, rng)
+        for _ in range(args.dagger):
+            new_obs = collect(game, student, collect_seeds[len(collect_seeds) // 2:], env_kwargs,
+                              args.samples // 2, args.explore, rng)
+            train_obs = np.concatenate([train_obs, new_obs])
+            train_targets = np.concatenate([train_targets, teacher_targets(teacher, new_obs)])
+            kl = train(student, train_obs, train_targets, args.epochs, args.batch_size, args.learning_rate, rng)
+        duration = time.time() - start
+
+        save_path = f"{zip_path[:-len('.zip')]}_student_{name}"
+        student.save(save_path)
+        scores = episode_metrics(game, student, eval_seeds, env_kwargs, args.metric, 16)
+        rows.append((name, param_count(student), kl, scores.mean(),
+                     latency_us(from_sb3(student), probe), latency_us(student, probe)))
+        print(f"Student {name}: KL {kl:.4f} after {duration:.1f}s -> {save_path}.zip")
+
+        registry.record_train(
+            game, os.path.basename(save_path), type(student).__name__,
+            config={"teacher": os.path.basename(zip_path)[:-4], "net_arch": sizes, "reward_mode": reward_mode,
+                    "samples": len(train_obs), "epochs": args.epochs, "dagger": args.dagger,
+                    "distill_learning_rate": args.learning_rate, "seed": args.seed,
+                    # The student plays the teacher's env, so tournaments and quantize pick the same options
+                    **{key: env_kwargs[key] for key, _ in GAMES[game].env_options}},
+            model_path=save_path,
+            metrics={"distill_kl": kl, f"mean_{args.metric}": float(scores.mean()),
+                     f"teacher_mean_{args.metric}": float(teacher_scores.mean())},
+            duration=duration,
+        )
+    registry.close()
+
+    print(f"\nLatency / {args.metric} ({args.eval_episodes} episodes, single observation predict):")
+    print("-" * 72)
+    print(f"{'network':10s} {'actor params':>12s} {'KL':>8s} {'mean ' + args.metric:>12s} "
+          f"{'numpy us':>9s} {'sb3 us':>8s}")
+    for name, params, kl, score, numpy_us, sb3_us in rows:
+        kl_text = f"{kl:8.4f}" if kl is not None else f"{'-':>8s}"
+        print(f"{name:10s} {params:12d} {kl_text} {score:12.2f} {numpy_us:9.1f} {sb3_us:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
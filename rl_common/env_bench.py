@@ -0,0 +1,419 @@
+"""Environment benchmark suite for the three games, with regression checks.
+
+`run` times each game's env and writes the results to JSON together with a
+description of the machine:
+
+- steps/s with random actions and with a trained policy (its predict
+  included), and through `ScalarEnvBatch`, `ShmVecEnv` and SB3's
+  `SubprocVecEnv` for the lockstep games (for snake's ray observations
+  also through `SnakeEnvBatch`, which casts the whole batch at once)
+- reset, observation construction and rendering (`rgb_array`, and `human`
+  on the dummy video driver for snake and aim_trainer) cost per call
+- snake steps/s at growing lengths up to the full board, with the snake
+  walking a cycle through every cell of the board so it never dies, with
+  the default, reachable-space and ray observations
+- aim_trainer's pixel observations, and its numpy `rgb_array` renderer
+  at full size against the pygame one
+- `predict` latency of the trained policy, single and batched
+
+Every case uses fixed seeds, runs `--warmup` untimed iterations first and
+reports the median of `--repeats` timed runs. `compare` lines two result
+files up case by case and exits 1 if any case got worse by more than
+`--threshold`.
+
+Usage:
+    python -m rl_common.env_bench run --out benchmarks/baseline.json
+    python -m rl_common.env_bench run --games snake --out benchmarks/current.json
+    python -m rl_common.env_bench compare benchmarks/baseline.json benchmarks/current.json --threshold 0.1
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import time
+from functools import partial
+from importlib import metadata
+from statistics import median
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from rl_common import REPO_ROOT
+from rl_common.policies import BACKENDS
+
+SNAKE_LENGTHS = (3, 100, 500, 1000, 2000, 3000, 3455)
+PACKAGES = ("numpy", "gymnasium", "pygame", "torch", "stable-baselines3", "opencv-python", "opencv-python-headless")
+
+
+def make_env(game: str, seed: int, render_mode: Optional[str] = None, **env_kwargs):
+    from rl_common.tournament import GAMES, load_game
+
+    spec = GAMES[game]
+    env_class = getattr(load_game(game), spec.env_class)
+    if spec.lockstep:
+        return env_class(render_mode=render_mode, seed=seed, **env_kwargs)
+    random.seed(seed)
+    return env_class(render_mode=render_mode, **env_kwargs)
+
+
+def per_call(fn: Callable[[], object], calls: int, warmup: int, repeats: int) -> float:
+    """Median seconds per call of `fn` over `repeats` runs of `calls` calls."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        times.append((time.perf_counter() - start) / calls)
+    return median(times)
+
+
+class Stepper:
+    """Steps an env with a fixed action sequence or a policy, resetting when episodes end."""
+
+    def __init__(self, env, seed: int, policy=None, n_actions: int = 4096):
+        self.env = env
+        self.policy = policy
+        env.action_space.seed(seed)
+        self.actions = [env.action_space.sample() for _ in range(n_actions)]
+        self.i = 0
+        self.obs, _ = env.reset(seed=seed)
+
+    def __call__(self):
+        if self.policy is not None:
+            action, _ = self.policy.predict(self.obs, deterministic=True)
+        else:
+            action = self.actions[self.i % len(self.actions)]
+        self.i += 1
+        self.obs, _, done, trunc, _ = self.env.step(action)
+        if done or trunc:
+            self.obs, _ = self.env.reset()
+
+
+def snake_cycle(width: int, height: int) -> List[tuple]:
+    """Grid cells of a cycle through the whole board: rows back and forth, back up column 0."""
+    cells = [(x, 0) for x in range(width)]
+    for y in range(1, height):
+        xs = range(width - 1, 0, -1) if y % 2 else range(1, width)
+        cells += [(x, y) for x in xs]
+    cells += [(0, y) for y in range(height - 1, 0, -1)]
+    return cells
+
+
+def snake_on_cycle(env, length: int) -> Callable[[], object]:
+    """Puts a snake of `length` on the cycle; the returned function steps it one cell along.
+
+    The food is kept in the middle of the body, where it is never eaten, so the length stays the same
+    (and a nearly full board doesn't run out of cells to spawn food on).
+    """
+    if env.grid_height % 2:
+        raise ValueError("the cycle needs an even number of rows")
+    size = env.grid_size
+    cycle = [(x * size, y * size) for x, y in snake_cycle(env.grid_width, env.grid_height)]
+    n = len(cycle)
+    head = length - 1
+    env.snake_body = [list(cycle[head - k]) for k in range(length)]
+    env.snake_pos = list(cycle[head])
+    env.food_pos = list(cycle[head - length // 2])
+    state = {"i": head}
+
+    def step():
+        i = state["i"]
+        (x, y), (nx, ny) = cycle[i % n], cycle[(i + 1) % n]
+        # 0=UP, 1=DOWN, 2=LEFT, 3=RIGHT
+        action = 0 if ny < y else 1 if ny > y else 2 if nx < x else 3
+        env.direction = action
+        env.step(action)
+        env.food_pos = list(cycle[(i + 1 - length // 2) % n])
+        state["i"] = i + 1
+
+    return step
+
+
+def default_model(game: str) -> Optional[str]:
+    from rl_common.tournament import GAMES
+
+    models = sorted(glob.glob(os.path.join(REPO_ROOT, GAMES[game].models_dir, "*.zip")))
+    return models[0] if models else None
+
+
+def bench_game(game: str, model_path: Optional[str], backend: str, steps: int, warmup: int, repeats: int,
+               seed: int, batch: int, vec_envs: int) -> Dict[str, dict]:
+    from rl_common.tournament import GAMES
+
+    results = {}
+
+    def add(case: str, value: float, unit: str, higher_is_better: bool):
+        results[f"{game}/{case}"] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"  {case:28s} {value:12.1f} {unit}")
+
+    print(game)
+    env = make_env(game, seed)
+    add("random/steps_per_sec", 1 / per_call(Stepper(env, seed), steps, warmup, repeats), "steps/s", True)
+
+    seeds = iter(range(seed, seed + 10 ** 6))
+    add("reset_us", per_call(lambda: env.reset(seed=next(seeds)), max(1, steps // 20), warmup, repeats) * 1e6,
+        "us", False)
+    env.reset(seed=seed)
+    for _ in range(50):
+        obs, _, done, trunc, _ = env.step(env.action_space.sample())
+        if done or trunc:
+            env.reset()
+    add("obs_us", per_call(env._get_obs, steps, warmup, repeats) * 1e6, "us", False)
+    env.close()
+
+    render_calls = max(1, steps // 10)
+    env = make_env(game, seed, render_mode="rgb_array")
+    stepper = Stepper(env, seed)
+    for _ in range(50):
+        stepper()
+    # Steps between frames so the dirty-rectangle renderers have something to redraw
+    add("render_rgb_array_us", (per_call(lambda: (stepper(), env.render()), render_calls, warmup, repeats)
+                                - per_call(stepper, render_calls, warmup, repeats)) * 1e6, "us", False)
+    env.close()
+    if GAMES[game].lockstep:
+        env = make_env(game, seed, render_mode="human")
+        # Steps don't draw, so every frame is drawn by the forced call and none is skipped
+        env.render_mode = None
+        stepper = Stepper(env, seed)
+        add("render_human_us", (per_call(lambda: (stepper(), env._render_human(force=True)), render_calls, warmup,
+                                         repeats) - per_call(stepper, render_calls, warmup, repeats)) * 1e6,
+            "us", False)
+        env.close()
+
+    if GAMES[game].lockstep:
+        from rl_common.batched_eval import ScalarEnvBatch
+        from rl_common.tournament import load_game
+
+        batches = [("lockstep", partial(ScalarEnvBatch, lambda: make_env(game, seed), batch))]
+        if game == "snake":
+            # Rays cast env by env, and for the whole batch in one call
+            rays_env = partial(make_env, game, seed, obs_mode="rays")
+            batches += [("rays_scalar_lockstep", partial(ScalarEnvBatch, rays_env, batch)),
+                        ("rays_lockstep", partial(load_game(game).SnakeEnvBatch, rays_env, batch))]
+        for name, make_batch in batches:
+            envs = make_batch()
+            for i in range(batch):
+                envs.reset_slot(i, seed + i)
+            active = np.ones(batch, dtype=bool)
+            space = envs.envs[0].action_space
+            space.seed(seed)
+            actions = [np.array([space.sample() for _ in range(batch)]) for _ in range(256)]
+            counter = iter(range(10 ** 9))
+
+            def batch_step():
+                _, _, terminated, truncated, _ = envs.step(actions[next(counter) % len(actions)], active)
+                for i in np.flatnonzero(terminated | truncated):
+                    envs.reset_slot(i, None)
+
+            add(f"{name}_{batch}/steps_per_sec",
+                batch / per_call(batch_step, max(1, steps // batch), warmup, repeats), "steps/s", True)
+            envs.close()
+
+    if GAMES[game].lockstep and vec_envs > 1:
+        from rl_common.shm_vec_env import make_vec_env
+
+        for kind in ("shm", "subproc"):
+            venv = make_vec_env([partial(make_env, game, seed + i) for i in range(vec_envs)], kind)
+            venv.reset()
+            venv.action_space.seed(seed)
+            actions = [np.array([venv.action_space.sample() for _ in range(vec_envs)]) for _ in range(256)]
+            counter = iter(range(10 ** 9))
+            add(f"vec_{kind}_{vec_envs}/steps_per_sec",
+                vec_envs / per_call(lambda: venv.step(actions[next(counter) % len(actions)]),
+                                    max(1, steps // vec_envs), warmup, repeats), "steps/s", True)
+            venv.close()
+
+    if game == "snake":
+        env = make_env(game, seed, obs_mode="rays")
+        env.reset(seed=seed)
+        add("rays_obs_us", per_call(env._get_obs, steps, warmup, repeats) * 1e6, "us", False)
+        env.close()
+        for prefix, env_kwargs in (("length", {}), ("reachable_length", {"reachable_space": True}),
+                                   ("rays_length", {"obs_mode": "rays"})):
+            env = make_env(game, seed, **env_kwargs)
+            for length in SNAKE_LENGTHS:
+                env.reset(seed=seed)
+                add(f"{prefix}_{length}/steps_per_sec",
+                    1 / per_call(snake_on_cycle(env, length), steps, warmup, repeats), "steps/s", True)
+            env.close()
+
+    if game == "aim_trainer":
+        env = make_env(game, seed, obs_mode="pixels")
+        env.reset(seed=seed)
+        add("pixels_obs_us", per_call(env._get_obs, steps, warmup, repeats) * 1e6, "us", False)
+        add("pixels/steps_per_sec", 1 / per_call(Stepper(env, seed), steps, warmup, repeats), "steps/s", True)
+        env.close()
+        # The numpy renderer at full size, against render_rgb_array_us for pygame
+        env = make_env(game, seed, render_mode="rgb_array", render_size=(env.width, env.height))
+        stepper = Stepper(env, seed)
+        add("render_numpy_us", (per_call(lambda: (stepper(), env.render()), render_calls, warmup, repeats)
+                                - per_call(stepper, render_calls, warmup, repeats)) * 1e6, "us", False)
+        env.close()
+
+    if game == "FruitCatchers":
+        # Only asking for the power-up idles nearly every frame, which is what fast_forward skips through
+        for name, fast_forward in (("idle", False), ("idle_fast_forward", True)):
+            env = make_env(game, seed, fast_forward=fast_forward)
+            env.reset()
+
+            def idle_second():
+                frames = 0
+                while frames < 60:
+                    _, _, done, _, info = env.step(4)
+                    frames += info.get("frames", 1)
+                    if done:
+                        env.reset()
+
+            add(f"{name}/frames_per_sec", 60 / per_call(idle_second, max(1, steps // 60), warmup // 60, repeats),
+                "frames/s", True)
+            env.close()
+
+    if model_path is not None:
+        from rl_common.policies import load_policy
+
+        policy = load_policy(model_path, backend)
+        env = make_env(game, seed)
+        policy_steps = max(1, steps // 4)
+        add("policy/steps_per_sec", 1 / per_call(Stepper(env, seed, policy), policy_steps, warmup, repeats),
+            "steps/s", True)
+        obs = np.stack([env.observation_space.sample() for _ in range(batch)]).astype(np.float32)
+        add("predict_single_us", per_call(lambda: policy.predict(obs[0], deterministic=True), policy_steps,
+                                          warmup, repeats) * 1e6, "us", False)
+        add(f"predict_batch{batch}_us", per_call(lambda: policy.predict(obs, deterministic=True), policy_steps,
+                                                 warmup, repeats) * 1e6, "us", False)
+        env.close()
+    return results
+
+
+def machine() -> dict:
+    cpu = platform.processor()
+    if os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo") as f:
+            cpu = next((line.split(":", 1)[1].strip() for line in f if line.startswith("model name")), cpu)
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    from rl_common.registry import git_hash
+
+    return {"cpu": cpu, "cores": os.cpu_count(), "machine": platform.machine(), "platform": platform.platform(),
+            "python": platform.python_version(), "packages": versions, "git_hash": git_hash(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """Print both result sets side by side; returns the cases that regressed by more than `threshold`."""
+    for key in ("cpu", "cores", "python"):
+        if baseline["machine"].get(key) != current["machine"].get(key):
+            print(f"Warning: {key} differs ({baseline['machine'].get(key)} vs {current['machine'].get(key)}), "
+                  f"the comparison may not mean much")
+    regressions = []
+    print(f"{'case':42s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+    print("-" * 80)
+    for case, base in baseline["results"].items():
+        if case not in current["results"]:
+            continue
+        value = current["results"][case]["value"]
+        change = (value - base["value"]) / base["value"] if base["value"] else 0.0
+        # Positive is better: more steps/s, fewer microseconds
+        better = change if base["higher_is_better"] else -change
+        flag = ""
+        if better < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(case)
+        print(f"{case:42s} {base['value']:12.1f} {value:12.1f} {change * 100:+7.1f}%{flag}")
+    missing = [case for case in baseline["results"] if case not in current["results"]]
+    if missing:
+        print(f"{len(missing)} baseline cases not in the current results")
+    return regressions
+
+
+def main():
+    from rl_common.tournament import GAMES
+
+    parser = argparse.ArgumentParser(description="Benchmark the game environments and check for regressions")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="Run the benchmarks and write the results as JSON")
+    p.add_argument("--games", nargs="+", default=list(GAMES), choices=list(GAMES))
+    p.add_argument("--models", nargs="+", default=[],
+                   help="Trained policies to time, at most one per game "
+                        "(default: the first model in each game's models folder)")
+    p.add_argument("--no_models", action="store_true", help="Skip the trained-policy cases")
+    p.add_argument("--backend", type=str, default="sb3", choices=BACKENDS)
+    p.add_argument("--steps", type=int, default=2000, help="Calls per timed run (fewer for the slower cases)")
+    p.add_argument("--warmup", type=int, default=200, help="Untimed calls before each case")
+    p.add_argument("--repeats", type=int, default=5, help="Timed runs per case (the median is kept)")
+    p.add_argument("--batch", type=int, default=16, help="Envs in the lockstep case and batch size for predict")
+    p.add_argument("--vec_envs", type=int, default=4,
+                   help="Worker processes in the ShmVecEnv/SubprocVecEnv cases (0 to skip them)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", type=str, default=None, help="JSON file to write")
+    p.add_argument("--baseline", type=str, default=None, help="Compare against this result file when done")
+    p.add_argument("--threshold", type=float, default=0.1)
+
+    p = sub.add_parser("compare", help="Flag cases that got worse than in a baseline result file")
+    p.add_argument("baseline", type=str)
+    p.add_argument("current", type=str)
+    p.add_argument("--threshold", type=float, default=0.1,
+                   help="Relative change in the wrong direction that counts as a regression")
+
+    args = parser.parse_args()
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        print(f"\n{len(regressions)} regressions beyond {args.threshold * 100:.0f}%")
+        sys.exit(1 if regressions else 0)
+
+    from rl_common.tournament import game_of
+
+    # The results are keyed by game, so each game times one model
+    models = {}
+    for path in args.models:
+        game = game_of(path if path.endswith(".zip") else path + ".zip")
+        if game is None:
+            parser.error(f"can't tell which game {path} belongs to")
+        if game in models:
+            parser.error(f"one model per game: {models[game]} and {path} are both {game} models")
+        models[game] = path
+    results = {}
+    used = {}
+    start = time.time()
+    for game in args.games:
+        model_path = used[game] = None if args.no_models else models.get(game) or default_model(game)
+        results.update(bench_game(game, model_path, args.backend, args.steps, args.warmup, args.repeats,
+                                  args.seed, args.batch, args.vec_envs))
+    print(f"Done in {time.time() - start:.1f}s")
+
+    report = {"machine": machine(),
+              "config": {"games": args.games, "backend": args.backend, "steps": args.steps, "warmup": args.warmup,
+                         "repeats": args.repeats, "batch": args.batch, "vec_envs": args.vec_envs, "seed": args.seed,
+                         "models": {game: path and os.path.relpath(path, REPO_ROOT) for game, path in used.items()}},
+              "results": results}
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
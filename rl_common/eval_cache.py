@@ -0,0 +1,107 @@
+"""Deterministic episode seeds and an on-disk cache of per-episode eval results.
+
+An episode's result only depends on the model weights, the env class and its
+config, the episode seed and the code that runs it, so it is stored under a
+hash of exactly those. Re-running an evaluation, or growing it from 100 to
+1000 episodes with the same base seed, only computes the episodes that are
+not in the cache yet.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import random
+import sqlite3
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rl_common import REPO_ROOT
+
+DEFAULT_CACHE = os.environ.get("RL_EVAL_CACHE", os.path.join(REPO_ROOT, "eval_cache.sqlite"))
+
+_file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def episode_seeds(base_seed: Optional[int], episodes: int) -> Tuple[int, List[int]]:
+    """Per-episode seeds derived from a base seed.
+
+    The schedule is prefix-stable: the first N seeds are the same whatever the
+    total number of episodes. Without a base seed a random one is drawn and
+    returned so the run can be repeated.
+    """
+    if base_seed is None:
+        base_seed = random.SystemRandom().randrange(2 ** 31)
+    seeds = np.random.SeedSequence(base_seed).generate_state(episodes, dtype=np.uint32)
+    return base_seed, [int(s) for s in seeds]
+
+
+def file_hash(path: str) -> str:
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    digest = _file_hashes.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = _file_hashes[key] = h.hexdigest()
+    return digest
+
+
+def code_version(*paths: str) -> str:
+    """Hash of the source files that decide an episode's outcome (env, metric code)."""
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(file_hash(path).encode())
+    return h.hexdigest()[:16]
+
+
+class EvalCache:
+    def __init__(self, path: str = DEFAULT_CACHE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS episodes (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def key(model_hash: str, env_class: str, env_config: dict, seed: int, version: str) -> str:
+        payload = json.dumps([model_hash, env_class, env_config, seed, version], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, dict]:
+        found = {}
+        keys = list(keys)
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ", ".join("?" for _ in chunk)
+            for key, result in self.conn.execute(f"SELECT key, result FROM episodes WHERE key IN ({marks})", chunk):
+                found[key] = json.loads(result)
+        return found
+
+    def put(self, key: str, result: dict):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO episodes (key, result) VALUES (?, ?)", (key, json.dumps(result)))
+
+    def run(self, keys: Sequence[str], compute: Callable[[List[int]], Iterator[Tuple[int, dict]]]
+            ) -> Iterator[Tuple[int, dict]]:
+        """Yield (episode, result) for every key in order, computing only cache misses.
+
+        `compute(indices)` gets the 0-based indices of the missing episodes and
+        must yield one result per index, in that order; its first element of
+        each pair is ignored.
+        """
+        cached = self.get_many(keys)
+        missing = [i for i, k in enumerate(keys) if k not in cached]
+        computed = compute(missing) if missing else iter(())
+
+        for i, key in enumerate(keys):
+            result = cached.get(key)
+            if result is None:
+                _, result = next(computed)
+                self.put(key, result)
+            yield i + 1, dict(result)
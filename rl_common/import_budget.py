@@ -0,0 +1,130 @@
+"""Import-time budgets for the env modules and scripts.
+
+Each entry is imported in a fresh interpreter under `python -X importtime`,
+from its own folder the way the scripts are run and with
+`SDL_VIDEODRIVER=dummy`. The median cumulative import time over a few runs
+is compared with the entry's budget, and the import tree is checked for
+modules the entry must not load at import time: pygame before anything is
+rendered, torch and stable_baselines3 before a model is loaded.
+
+An entry that fails prints its heaviest direct imports, which is usually
+enough to find the import that should have been deferred. Exits 1 if any
+entry fails.
+
+FruitCatchers' env imports the playable game (`main.py`), which opens its
+window at import, so pygame is allowed there.
+
+`tests/test_import_budget.py` runs the same check for every entry under
+pytest; set RL_IMPORT_BUDGET_SCALE (the default of `--scale`) on a slower
+machine than the budgets were set on.
+
+Usage:
+    python -m rl_common.import_budget
+    python -m rl_common.import_budget --only snake --repeats 9
+    python -m rl_common.import_budget --scale 2    # slower machine than the budgets were set on
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+from statistics import median
+from typing import Dict, List, Tuple
+
+from rl_common import REPO_ROOT
+
+SCALE = float(os.environ.get("RL_IMPORT_BUDGET_SCALE", "1"))
+
+HEAVY = ("torch", "stable_baselines3")
+RENDER = ("pygame",)
+
+# (folder, module, budget in ms, modules it must not import)
+BUDGETS: List[Tuple[str, str, float, Tuple[str, ...]]] = [
+    ("snake/src", "snake_env", 350, HEAVY + RENDER),
+    ("snake/src", "snake_eval", 400, HEAVY + RENDER),
+    ("snake/src", "visualize_snake", 400, HEAVY + RENDER),
+    ("snake/src", "train_snake", 400, HEAVY + RENDER),
+    ("aim_trainer/src", "aim_trainer_env", 350, HEAVY + RENDER),
+    ("aim_trainer/src", "eval_aim_trainer", 400, HEAVY + RENDER),
+    ("aim_trainer/src", "visualize_aim_trainer", 400, HEAVY + RENDER),
+    ("aim_trainer/src", "train_aim_trainer", 400, HEAVY + RENDER),
+    ("FruitCatchers", "fruit_env_full", 400, HEAVY),
+    ("FruitCatchers", "eval_agent", 450, HEAVY),
+    ("FruitCatchers", "train_agent", 450, HEAVY),
+    ("FruitCatchers", "train_a2c", 450, HEAVY),
+    ("FruitCatchers", "train_agent_lr", 450, HEAVY),
+    (".", "rl_common.registry", 100, HEAVY + RENDER),
+    (".", "rl_common.policies", 250, HEAVY + RENDER),
+    (".", "rl_common.tournament", 300, HEAVY + RENDER),
+    (".", "rl_common.tapes", 250, HEAVY + RENDER),
+    (".", "rl_common.inference_server", 300, HEAVY + RENDER),
+    (".", "rl_common.video_export", 300, HEAVY + RENDER),
+]
+
+
+def import_tree(folder: str, module: str) -> List[Tuple[int, int, str]]:
+    """(depth, cumulative us, name) of every module imported by `import module` in a fresh interpreter."""
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    env.pop("PYTHONPATH", None)
+    code = f"import sys; sys.path.insert(0, '.'); import {module}"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=os.path.join(REPO_ROOT, folder),
+                          env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=120)
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+    tree = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        name = name[1:]
+        tree.append(((len(name) - len(name.lstrip())) // 2, int(cumulative), name.strip()))
+    return tree
+
+
+def check(folder: str, module: str, budget_ms: float, forbidden: Tuple[str, ...], repeats: int) -> Dict:
+    times = []
+    for _ in range(repeats):
+        tree = import_tree(folder, module)
+        times.append(next(us for depth, us, name in tree if depth == 0 and name == module) / 1000)
+    loaded = sorted({f for f in forbidden for _, _, name in tree if name == f or name.startswith(f + ".")})
+    # A module's own imports are listed one level deeper, between it and the previous top-level module
+    end = next(i for i, (depth, _, name) in enumerate(tree) if depth == 0 and name == module)
+    start = max([i for i in range(end) if tree[i][0] == 0], default=-1) + 1
+    children = [(us, name) for depth, us, name in tree[start:end] if depth == 1]
+    return {"ms": median(times), "budget": budget_ms, "forbidden": loaded,
+            "heaviest": sorted(children, reverse=True)[:3]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import times of the env modules and scripts against budgets")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per entry (the median is used)")
+    parser.add_argument("--scale", type=float, default=SCALE,
+                        help="Multiply every budget by this (default from RL_IMPORT_BUDGET_SCALE, else 1)")
+    parser.add_argument("--only", type=str, default=None, help="Only check entries whose folder or module contain this")
+    args = parser.parse_args()
+
+    failed = 0
+    print(f"{'module':38s} {'ms':>7s} {'budget':>7s}")
+    print("-" * 60)
+    for folder, module, budget_ms, forbidden in BUDGETS:
+        if args.only and args.only not in folder and args.only not in module:
+            continue
+        result = check(folder, module, budget_ms * args.scale, forbidden, args.repeats)
+        problems = []
+        if result["ms"] > result["budget"]:
+            problems.append("over budget")
+        if result["forbidden"]:
+            problems.append("imports " + ", ".join(result["forbidden"]))
+        name = module if folder == "." else f"{folder}/{module}"
+        print(f"{name:38s} {result['ms']:7.0f} {result['budget']:7.0f}  {'; '.join(problems) or 'ok'}")
+        if problems:
+            failed += 1
+            for us, child in result["heaviest"]:
+                print(f"    {us / 1000:7.1f} ms  {child}")
+    print(f"\n{failed} failed" if failed else "\nAll within budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
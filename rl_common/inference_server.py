@@ -0,0 +1,273 @@
+"""Local policy inference server that batches concurrent requests.
+
+One server process hosts any number of the repo's models (loaded on first
+use through `rl_common.policies`). Each model has its own batching thread:
+it takes the first waiting request, keeps collecting requests for up to
+`max_wait_ms` or until `max_batch` observations are queued, runs a single
+`predict` on the stacked batch and hands every client its rows back. With one
+client it behaves like a local `predict`; with many (several visualizers, a
+demo and a game client) they share one copy of each model and one batched
+call per step.
+
+`RemotePolicy` is the client: it has the SB3 `predict(obs)` call, so scripts
+use it in place of a loaded model. Addresses are a Unix socket path or
+`host:port` for TCP.
+
+Usage:
+    python -m rl_common.inference_server serve --backend numpy --max_wait_ms 2
+    python src/visualize_snake.py --model_path models/ppo_snake_survival --server default
+    python -m rl_common.inference_server stats
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import queue
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from rl_common.policies import BACKENDS, load_policy
+from rl_common.streaming_stats import QuantileSketch, RunningStats
+
+DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), "rl_policy_server.sock")
+_AUTHKEY = b"rl_common.inference_server"
+
+
+def parse_address(address: Optional[str]) -> Union[str, Tuple[str, int]]:
+    """"default", a Unix socket path, or host:port."""
+    if address in (None, "", "default"):
+        return DEFAULT_ADDRESS
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+class _Request:
+    __slots__ = ("obs", "single", "start", "done", "actions", "error")
+
+    def __init__(self, obs: np.ndarray, single: bool):
+        self.obs = obs
+        self.single = single
+        self.start = time.perf_counter()
+        self.done = threading.Event()
+        self.actions = None
+        self.error = None
+
+
+class ModelWorker(threading.Thread):
+    """Owns one loaded policy and turns its queue of requests into batched predict calls."""
+
+    def __init__(self, model_path: str, backend: str, max_batch: int, max_wait: float):
+        super().__init__(daemon=True, name=f"policy:{os.path.basename(model_path)}")
+        self.policy = load_policy(model_path, backend)
+        self.obs_shape = tuple(getattr(self.policy, "obs_shape", None) or self.policy.observation_space.shape)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests: "queue.Queue[_Request]" = queue.Queue()
+
+        self.latency_ms = RunningStats()
+        self.latency_quantiles = QuantileSketch(max_bins=512)
+        self.batch_sizes = RunningStats()
+        self.predict_time = 0.0
+        self.first_request: Optional[float] = None
+
+    def predict(self, obs: np.ndarray):
+        single = obs.shape == self.obs_shape
+        if not single and obs.shape[1:] != self.obs_shape:
+            # Rejected here so one bad client can't fail the batch it would have joined
+            raise ValueError(f"observation shape {obs.shape} doesn't match the model's {self.obs_shape} "
+                             f"(or a batch of them)")
+        request = _Request(obs.reshape((1,) + self.obs_shape) if single else obs, single)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise RuntimeError(request.error)
+        return request.actions[0] if single else request.actions
+
+    def _collect(self) -> List[_Request]:
+        batch = [self.requests.get()]
+        rows = len(batch[0].obs)
+        deadline = batch[0].start + self.max_wait
+        while rows < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Past the deadline, still take whatever is already waiting
+                request = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            rows += len(request.obs)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self._collect()
+            if self.first_request is None:
+                self.first_request = batch[0].start
+            start = time.perf_counter()
+            try:
+                obs = np.concatenate([r.obs for r in batch]) if len(batch) > 1 else batch[0].obs
+                actions, _ = self.policy.predict(obs, deterministic=True)
+                actions = np.asarray(actions)
+            except Exception as e:  # report to every waiting client instead of killing the thread
+                for request in batch:
+                    request.error = f"{type(e).__name__}: {e}"
+                    request.done.set()
+                continue
+            now = time.perf_counter()
+            self.predict_time += now - start
+            self.batch_sizes.add(len(obs))
+
+            offset = 0
+            for request in batch:
+                request.actions = actions[offset:offset + len(request.obs)]
+                offset += len(request.obs)
+                latency = (now - request.start) * 1e3
+                self.latency_ms.add(latency)
+                self.latency_quantiles.add(round(latency, 2))
+                request.done.set()
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.first_request if self.first_request else 0.0
+        rows = self.batch_sizes.total
+        return {
+            "requests": self.latency_ms.n,
+            "observations": int(rows),
+            "batches": self.batch_sizes.n,
+            "mean_batch": float(self.batch_sizes.mean),
+            "max_batch": int(self.batch_sizes.max or 0),
+            "mean_latency_ms": float(self.latency_ms.mean),
+            "p50_latency_ms": self.latency_quantiles.quantile(0.5) if self.latency_ms.n else 0.0,
+            "p99_latency_ms": self.latency_quantiles.quantile(0.99) if self.latency_ms.n else 0.0,
+            "obs_per_sec": rows / elapsed if elapsed > 0 else 0.0,
+            "predict_busy": self.predict_time / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class InferenceServer:
+    def __init__(self, address=DEFAULT_ADDRESS, backend: str = "sb3", max_batch: int = 64,
+                 max_wait_ms: float = 2.0):
+        self.address = address
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1e3
+        self.workers: Dict[str, ModelWorker] = {}
+        self._lock = threading.Lock()
+
+    def worker(self, model_path: str) -> ModelWorker:
+        with self._lock:
+            worker = self.workers.get(model_path)
+            if worker is None:
+                print(f"Loading {model_path} ({self.backend})")
+                worker = self.workers[model_path] = ModelWorker(model_path, self.backend, self.max_batch,
+                                                                self.max_wait)
+                worker.start()
+        return worker
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if message[0] == "predict":
+                        _, model_path, obs = message
+                        conn.send(("ok", self.worker(model_path).predict(np.asarray(obs))))
+                    elif message[0] == "stats":
+                        conn.send(("ok", {path: w.stats() for path, w in list(self.workers.items())}))
+                    else:
+                        conn.send(("error", f"unknown request {message[0]!r}"))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    def serve_forever(self):
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+        with Listener(self.address, authkey=_AUTHKEY) as listener:
+            print(f"Serving on {self.address} (backend {self.backend}, max batch {self.max_batch}, "
+                  f"max wait {self.max_wait * 1e3:g} ms)")
+            while True:
+                try:
+                    conn = listener.accept()
+                except OSError:
+                    # A client that fails the handshake shouldn't take the server down
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+class RemotePolicy:
+    """A model hosted by the inference server, with SB3's `predict(obs)` call."""
+
+    def __init__(self, model_path: str, address: Optional[str] = None):
+        self.model_path = os.path.abspath(model_path)
+        self.conn = Client(parse_address(address), authkey=_AUTHKEY)
+
+    def _call(self, *message):
+        self.conn.send(message)
+        status, value = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"inference server: {value}")
+        return value
+
+    def predict(self, obs, state=None, episode_start=None, deterministic: bool = True):
+        return self._call("predict", self.model_path, np.asarray(obs, dtype=np.float32)), state
+
+    def stats(self) -> dict:
+        return self._call("stats")
+
+    def close(self):
+        self.conn.close()
+
+
+def load_model(model_path: str, server: Optional[str] = None, backend: str = "sb3"):
+    """The hosted model if a server address is given, otherwise a local copy."""
+    if server:
+        return RemotePolicy(model_path, server)
+    return load_policy(model_path, backend)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched policy inference server")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="Run the server")
+    p.add_argument("--address", type=str, default="default",
+                   help=f"Unix socket path or host:port (default {DEFAULT_ADDRESS})")
+    p.add_argument("--backend", type=str, default="sb3", choices=BACKENDS, help="Backend models are loaded with")
+    p.add_argument("--max_batch", type=int, default=64, help="Most observations per batched predict call")
+    p.add_argument("--max_wait_ms", type=float, default=2.0,
+                   help="How long the first request of a batch waits for others to join")
+
+    p = sub.add_parser("stats", help="Print per-model latency and throughput of a running server")
+    p.add_argument("--address", type=str, default="default")
+
+    args = parser.parse_args()
+    address = parse_address(args.address)
+    if args.command == "serve":
+        InferenceServer(address, args.backend, args.max_batch, args.max_wait_ms).serve_forever()
+    else:
+        conn = Client(address, authkey=_AUTHKEY)
+        conn.send(("stats",))
+        _, stats = conn.recv()
+        conn.close()
+        if not stats:
+            print("No models loaded yet")
+        for path, s in stats.items():
+            print(os.path.relpath(path))
+            print(f"  requests {s['requests']}, observations {s['observations']}, batches {s['batches']} "
+                  f"(mean {s['mean_batch']:.1f}, max {s['max_batch']})")
+            print(f"  latency mean {s['mean_latency_ms']:.2f} ms, p50 {s['p50_latency_ms']:.2f} ms, "
+                  f"p99 {s['p99_latency_ms']:.2f} ms")
+            print(f"  throughput {s['obs_per_sec']:.0f} obs/s, predict busy {s['predict_busy'] * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Run exported SB3 actor networks with nothing but NumPy.
+
+Every policy in this repo is an SB3 `ActorCriticPolicy` whose actor is a
+small MLP (`mlp_extractor.policy_net` followed by `action_net`). `export`
+copies those weights into a `.npz` next to the zip; `NumpyPolicy` then
+computes the same deterministic actions as `model.predict(obs,
+deterministic=True)` without importing torch or stable-baselines3, so it
+loads in milliseconds and a single observation takes a few microseconds.
+
+Usage:
+    python -m rl_common.numpy_policy export snake/models/*.zip
+    python -m rl_common.numpy_policy check snake/models/ppo_snake_survival
+    python -m rl_common.numpy_policy bench snake/models/ppo_snake_survival
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "identity": lambda x: x,
+}
+
+
+class NumpyPolicy:
+    """Deterministic actor of an SB3 policy, loaded from an exported `.npz`."""
+
+    def __init__(self, weights: List[np.ndarray], biases: List[np.ndarray], activation: str,
+                 action_type: str, low: Optional[np.ndarray] = None, high: Optional[np.ndarray] = None,
+                 obs_shape: Tuple[int, ...] = ()):
+        # Weights are stored (in, out) so a batch is just `obs @ W + b`
+        self.weights = [np.ascontiguousarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float32) for b in biases]
+        self.activation = activation
+        self._act = ACTIVATIONS[activation]
+        self.action_type = action_type
+        self.low = low
+        self.high = high
+        self.obs_shape = tuple(obs_shape)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyPolicy":
+        if not path.endswith(".npz"):
+            path += ".npz"
+        with np.load(path) as data:
+            n = int(data["n_layers"])
+            return cls(
+                weights=[data[f"w{i}"] for i in range(n)],
+                biases=[data[f"b{i}"] for i in range(n)],
+                activation=str(data["activation"]),
+                action_type=str(data["action_type"]),
+                low=data["low"] if "low" in data else None,
+                high=data["high"] if "high" in data else None,
+                obs_shape=tuple(int(d) for d in data["obs_shape"]),
+            )
+
+    def save(self, path: str, **extra):
+        arrays = {f"w{i}": w for i, w in enumerate(self.weights)}
+        arrays.update({f"b{i}": b for i, b in enumerate(self.biases)})
+        if self.low is not None:
+            arrays["low"], arrays["high"] = self.low, self.high
+        np.savez(path, n_layers=len(self.weights), activation=self.activation, action_type=self.action_type,
+                 obs_shape=np.asarray(self.obs_shape, dtype=np.int64), **arrays, **extra)
+
+    def forward(self, obs: np.ndarray) -> np.ndarray:
+        """Logits (discrete) or action means (box) for a batch of flattened observations."""
+        x = np.asarray(obs, dtype=np.float32)
+        last = len(self.weights) - 1
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ w
+            x += b
+            if i < last:
+                x = self._act(x)
+        return x
+
+    def predict(self, obs, state=None, episode_start=None, deterministic: bool = True):
+        """Same call and return shape as SB3's `model.predict` (always deterministic)."""
+        obs = np.asarray(obs, dtype=np.float32)
+        single = obs.shape == self.obs_shape
+        batch = obs.reshape(1 if single else obs.shape[0], -1)
+        out = self.forward(batch)
+        if self.action_type == "discrete":
+            actions = out.argmax(axis=1)
+        else:
+            actions = np.clip(out, self.low, self.high)
+        return (actions[0] if single else actions), state
+
+
+def from_sb3(model) -> NumpyPolicy:
+    """Pull the actor network out of a loaded SB3 actor-critic model."""
+    import torch.nn as nn
+    from gymnasium import spaces
+
+    policy = model.policy
+    if getattr(policy, "squash_output", False):
+        raise ValueError("policies with squashed (tanh) outputs are not supported")
+    if type(policy.features_extractor).__name__ != "FlattenExtractor":
+        raise ValueError(f"only MLP policies can be exported, this one has a "
+                         f"{type(policy.features_extractor).__name__} (use the sb3 backend)")
+    linears, activations = [], set()
+    for module in policy.mlp_extractor.policy_net:
+        if isinstance(module, nn.Linear):
+            linears.append(module)
+        else:
+            activations.add(type(module).__name__.lower())
+    linears.append(policy.action_net)
+    activation = activations.pop() if activations else "identity"
+    if activations or activation not in ACTIVATIONS:
+        raise ValueError(f"unsupported activation in {policy.mlp_extractor.policy_net}")
+
+    weights = [layer.weight.detach().cpu().numpy().T for layer in linears]
+    biases = [layer.bias.detach().cpu().numpy() for layer in linears]
+    if isinstance(model.action_space, spaces.Discrete):
+        return NumpyPolicy(weights, biases, activation, "discrete", obs_shape=model.observation_space.shape)
+    if isinstance(model.action_space, spaces.Box):
+        return NumpyPolicy(weights, biases, activation, "box",
+                           low=model.action_space.low.astype(np.float32),
+                           high=model.action_space.high.astype(np.float32),
+                           obs_shape=model.observation_space.shape)
+    raise ValueError(f"unsupported action space {model.action_space}")
+
+
+def export(model_path: str, out_path: Optional[str] = None) -> str:
+    from rl_common.eval_cache import file_hash
+    from rl_common.policies import load_sb3
+
+    zip_path = model_path if model_path.endswith(".zip") else model_path + ".zip"
+    out_path = out_path or zip_path[:-len(".zip")] + ".npz"
+    from_sb3(load_sb3(zip_path)).save(out_path, source_sha256=file_hash(zip_path))
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export SB3 policies to NumPy and check them")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="Write a .npz next to each model zip")
+    p.add_argument("models", nargs="+", help="Model zips (with or without .zip)")
+
+    p = sub.add_parser("check", help="Compare NumPy actions with model.predict")
+    p.add_argument("models", nargs="+")
+    p.add_argument("--samples", type=int, default=10000, help="Random observations to compare on")
+    p.add_argument("--seed", type=int, default=0)
+
+    p = sub.add_parser("bench", help="Time loading and inference against SB3")
+    p.add_argument("models", nargs="+")
+    p.add_argument("--batch", type=int, default=64)
+
+    args = parser.parse_args()
+    from rl_common.policies import bench, parity
+
+    failed = False
+    for model_path in args.models:
+        if args.command == "export":
+            print(f"Exported {export(model_path)}")
+        elif args.command == "check":
+            mismatches, max_diff = parity(model_path, "numpy", args.samples, args.seed)
+            status = "OK" if mismatches == 0 else "MISMATCH"
+            print(f"{status:8s} {model_path}: {mismatches} differing actions, max difference {max_diff:.2e}")
+            failed = failed or mismatches > 0
+        elif args.command == "bench":
+            bench(model_path, ["numpy", "sb3"], batch=args.batch)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
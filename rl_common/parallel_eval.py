@@ -0,0 +1,66 @@
+"""Run evaluation episodes across worker processes.
+
+Each worker loads the model once in its initializer and then runs whole
+episodes. Results come back in episode order as soon as they are ready, so
+callers can print and write CSV rows while later episodes are still running,
+and anything computed from the rows is identical to a serial run.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+from functools import partial
+from typing import Callable, Iterator, List, Optional, Tuple
+
+_worker_model = None
+
+
+def _init_worker(load_model: Callable, model_path: str):
+    global _worker_model
+    try:
+        import torch
+        # N workers each using every core would just fight over them
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    _worker_model = load_model(model_path)
+
+
+def _run_task(run_episode: Callable, kwargs: dict) -> dict:
+    return run_episode(_worker_model, **kwargs)
+
+
+def run_episodes(
+        run_episode: Callable,
+        load_model: Callable,
+        model_path: str,
+        episode_kwargs: List[dict],
+        workers: int = 1,
+        model=None,
+) -> Iterator[Tuple[int, dict]]:
+    """Yield (episode, metrics) for each entry of `episode_kwargs`, in order.
+
+    `run_episode(model, **kwargs)` must be a module-level function so it can be
+    sent to the workers. With `workers <= 1` everything runs in this process
+    using `model` (loaded here if not given).
+    """
+    if workers <= 1:
+        if model is None:
+            model = load_model(model_path)
+        for ep, kwargs in enumerate(episode_kwargs, start=1):
+            yield ep, run_episode(model, **kwargs)
+        return
+
+    workers = min(workers, len(episode_kwargs))
+    with mp.get_context("spawn").Pool(workers, initializer=_init_worker, initargs=(load_model, model_path)) as pool:
+        results = pool.imap(partial(_run_task, run_episode), episode_kwargs, chunksize=1)
+        for ep, metrics in enumerate(results, start=1):
+            yield ep, metrics
+
+
+def default_workers(requested: Optional[int]) -> int:
+    """`--workers 0` means one worker per core."""
+    if requested is None or requested < 0:
+        return 1
+    if requested == 0:
+        return mp.cpu_count()
+    return requested
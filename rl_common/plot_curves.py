@@ -0,0 +1,97 @@
+"""Plot training curves for any of the games straight from their tensorboard logs.
+
+Run from the repository root, for example:
+
+    python -m rl_common.plot_curves --list
+    python -m rl_common.plot_curves --tag rollout/ep_rew_mean --out plots/ep_rew_mean.png
+    python -m rl_common.plot_curves --games snake --runs "snake_survival*" --tag rollout/ep_len_mean
+"""
+import argparse
+import fnmatch
+import os
+import time
+
+from rl_common.tfevents import (
+    DEFAULT_CACHE_DIR, DEFAULT_MAX_POINTS, GAME_LOG_ROOTS, CurveCache, discover_runs, load_run
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare training curves across runs and games")
+    parser.add_argument("--games", nargs="+", default=None, choices=list(GAME_LOG_ROOTS),
+                        help="Games to include (default: all)")
+    parser.add_argument("--runs", nargs="+", default=None,
+                        help="Glob patterns matched against run names, e.g. 'PPO_*'")
+    parser.add_argument("--tag", type=str, default="rollout/ep_rew_mean",
+                        help="Scalar tag to plot")
+    parser.add_argument("--points", type=int, default=DEFAULT_MAX_POINTS,
+                        help="Maximum number of downsampled points per curve")
+    parser.add_argument("--cache_dir", type=str, default=DEFAULT_CACHE_DIR,
+                        help="Where downsampled curves are cached")
+    parser.add_argument("--no_band", action="store_true",
+                        help="Only draw the mean line, not the min/max band")
+    parser.add_argument("--list", action="store_true",
+                        help="List runs with their tags and final values instead of plotting")
+    parser.add_argument("--out", type=str, default=None,
+                        help="Save the figure here instead of opening a window")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cache = CurveCache(args.cache_dir, args.points)
+
+    runs = discover_runs(args.games)
+    if args.runs:
+        runs = [r for r in runs if any(fnmatch.fnmatch(r.name, p) for p in args.runs)]
+    if not runs:
+        print("No runs found.")
+        return
+
+    curves = {(r.game, r.name): load_run(r, cache) for r in runs}
+    load_time = time.perf_counter() - start
+
+    if args.list:
+        for (game, name), tags in curves.items():
+            print(f"{game}/{name}")
+            for tag in sorted(tags):
+                c = tags[tag]
+                print(f"    {tag:32s} points={len(c.step):4d} last_step={int(c.step[-1]) if len(c.step) else 0:>10d} "
+                      f"last={c.last:.4f}")
+        print(f"\nLoaded {len(curves)} runs in {load_time * 1000:.0f} ms")
+        return
+
+    import matplotlib
+    if args.out:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    games = [g for g in GAME_LOG_ROOTS if any(key[0] == g for key in curves)]
+    fig, axes = plt.subplots(1, len(games), figsize=(6 * len(games), 5), squeeze=False)
+
+    for ax, game in zip(axes[0], games):
+        for (run_game, name), tags in curves.items():
+            if run_game != game or args.tag not in tags:
+                continue
+            c = tags[args.tag]
+            line, = ax.plot(c.step, c.mean, label=name, linewidth=1.5)
+            if not args.no_band:
+                ax.fill_between(c.step, c.min, c.max, color=line.get_color(), alpha=0.2, linewidth=0)
+        ax.set_title(game)
+        ax.set_xlabel("Timesteps")
+        ax.set_ylabel(args.tag)
+        ax.grid(True, linestyle="--", alpha=0.6)
+        ax.legend(fontsize=8)
+
+    fig.tight_layout()
+    print(f"Loaded {len(curves)} runs in {load_time * 1000:.0f} ms, "
+          f"rendered in {(time.perf_counter() - start - load_time) * 1000:.0f} ms")
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        fig.savefig(args.out, dpi=150)
+        print(f"Plot saved → {args.out}")
+    else:
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
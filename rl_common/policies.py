@@ -0,0 +1,207 @@
+"""Load a trained policy with the inference backend of choice.
+
+Every backend returns an object with SB3's `predict(obs, deterministic=True)`
+call, so the eval and visualize scripts don't care which one they get:
+
+    sb3          the model zip through stable-baselines3 (the default)
+    numpy        the `.npz` from `python -m rl_common.numpy_policy export`, no torch needed
+    torchscript  the `.pt` from `python -m rl_common.torch_policy export`
+    compile      the actor of the model zip through torch.compile
+    int8         the `.int8.pt` from `python -m rl_common.quantize`, int8 weights
+    mmap         the zip's actor weights memory-mapped and shared between processes
+                 (see rl_common.shared_policies)
+
+All but sb3 rebuild only the actor MLP, so CNN policies (aim_trainer's
+pixel observations) only run with sb3; exporting one raises ValueError.
+
+The exported files (numpy, torchscript, int8) record the hash of the zip
+they were made from. A numpy or TorchScript file older than its zip is
+exported again before it is used; an int8 one raises, since quantizing again
+means playing its evaluation gate.
+
+Usage:
+    python -m rl_common.policies check --backend torchscript snake/models/ppo_snake_survival
+    python -m rl_common.policies bench snake/models/ppo_snake_survival
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import os
+import sys
+import time
+import zipfile
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+BACKENDS = ("sb3", "numpy", "torchscript", "compile", "int8", "mmap")
+
+CNN_BACKENDS = ("sb3",)
+
+_EXTENSIONS = {"sb3": ".zip", "numpy": ".npz", "torchscript": ".pt", "compile": ".zip", "int8": ".int8.pt",
+               "mmap": ".zip"}
+_EXPORTERS = {"numpy": "rl_common.numpy_policy", "torchscript": "rl_common.torch_policy"}
+
+
+def _base(model_path: str) -> str:
+    # Longest first so ".int8.pt" isn't taken for ".pt"
+    for ext in sorted(set(_EXTENSIONS.values()), key=len, reverse=True):
+        if model_path.endswith(ext):
+            return model_path[:-len(ext)]
+    return model_path
+
+
+def backend_file(model_path: str, backend: str = "sb3") -> str:
+    """The file a backend loads for a model path given without extension."""
+    return _base(model_path) + _EXTENSIONS[backend]
+
+
+def load_sb3(model_path: str):
+    """Load an SB3 zip with whichever algorithm saved it."""
+    from stable_baselines3 import A2C, PPO
+    from rl_common.registry import read_model_config
+
+    zip_path = backend_file(model_path)
+    algo = read_model_config(zip_path).get("algo", "PPO")
+    return (A2C if algo == "A2C" else PPO).load(zip_path)
+
+
+def export_source(path: str) -> Optional[str]:
+    """Hash of the model zip an exported file was made from (None if it doesn't record one), without torch."""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return str(data["source_sha256"]) if "source_sha256" in data.files else None
+    # TorchScript files are zip archives with the extra files under <name>/extra/
+    with zipfile.ZipFile(path) as z:
+        name = next((n for n in z.namelist() if n.endswith("/extra/source_sha256")), None)
+        return z.read(name).decode() if name else None
+
+
+def ensure_current(model_path: str, backend: str):
+    """Export a numpy or TorchScript file again if its model zip changed since; raise for an int8 one."""
+    if backend not in ("numpy", "torchscript", "int8"):
+        return
+    from rl_common.eval_cache import file_hash
+
+    zip_path, path = backend_file(model_path), backend_file(model_path, backend)
+    # Without the zip (only the export shipped) there is nothing to compare with
+    if not (os.path.exists(zip_path) and os.path.exists(path)) or export_source(path) == file_hash(zip_path):
+        return
+    if backend == "int8":
+        raise ValueError(f"{path} wasn't quantized from the current {zip_path}, "
+                         f"run python -m rl_common.quantize on it again")
+    print(f"{path} wasn't exported from the current {zip_path}, exporting it again")
+    importlib.import_module(_EXPORTERS[backend]).export(zip_path)
+
+
+def load_policy(model_path: str, backend: str = "sb3"):
+    ensure_current(model_path, backend)
+    if backend == "sb3":
+        return load_sb3(model_path)
+    if backend == "numpy":
+        from rl_common.numpy_policy import NumpyPolicy
+        return NumpyPolicy.load(backend_file(model_path, backend))
+    if backend in ("torchscript", "int8"):
+        from rl_common.torch_policy import load_torchscript
+        return load_torchscript(backend_file(model_path, backend))
+    if backend == "compile":
+        from rl_common.torch_policy import load_compiled
+        return load_compiled(model_path)
+    if backend == "mmap":
+        from rl_common.shared_policies import load_shared
+        return load_shared(model_path)
+    raise ValueError(f"unknown backend '{backend}', expected one of {BACKENDS}")
+
+
+def policy_hash(model_path: str, backend: str = "sb3") -> str:
+    """Cache key part for a model under a backend; backends may round differently."""
+    from rl_common.eval_cache import file_hash
+
+    ensure_current(model_path, backend)
+    digest = file_hash(backend_file(model_path))
+    if backend == "sb3":
+        return digest
+    if backend in ("compile", "mmap"):
+        return f"{digest}:{backend}"
+    return f"{digest}:{backend}:{file_hash(backend_file(model_path, backend))}"
+
+
+def parity(model_path: str, backend: str, samples: int = 10000, seed: int = 0,
+           atol: float = 1e-5) -> Tuple[int, float]:
+    """(action mismatches, max |action difference|) against `model.predict` on random observations."""
+    model = load_sb3(model_path)
+    policy = load_policy(model_path, backend)
+    space = model.observation_space
+    rng = np.random.default_rng(seed)
+    obs = rng.uniform(space.low, space.high, size=(samples,) + space.shape).astype(np.float32)
+
+    expected, _ = model.predict(obs, deterministic=True)
+    actual, _ = policy.predict(obs, deterministic=True)
+    diff = np.abs(np.asarray(expected, dtype=np.float64) - actual).reshape(samples, -1).max(axis=1)
+    mismatches = int((diff > atol).sum())
+
+    # Single observations take a different path in both predict()s
+    for i in range(min(samples, 100)):
+        e, _ = model.predict(obs[i], deterministic=True)
+        a, _ = policy.predict(obs[i], deterministic=True)
+        if np.shape(e) != np.shape(a) or np.abs(np.asarray(e, dtype=np.float64) - a).max() > atol:
+            mismatches += 1
+    return mismatches, float(diff.max())
+
+
+def bench(model_path: str, backends: List[str], batch: int = 64, repeats: int = 2000):
+    """Print load time and per-call latency of `predict` for each backend."""
+    print(os.path.basename(_base(model_path)))
+    print(f"  {'backend':12s} {'load ms':>9s} {'single us':>10s} {'batch ' + str(batch) + ' us':>12s}")
+    for backend in backends:
+        start = time.perf_counter()
+        policy = load_policy(model_path, backend)
+        load_ms = (time.perf_counter() - start) * 1e3
+        obs_shape = tuple(getattr(policy, "obs_shape", None) or policy.observation_space.shape)
+        obs = np.random.default_rng(0).random((batch,) + obs_shape, dtype=np.float32)
+
+        def per_call(x):
+            # Warm up first so compilation and lazy initialisation aren't timed
+            for _ in range(3):
+                policy.predict(x, deterministic=True)
+            n = repeats if backend == "numpy" else repeats // 4
+            start = time.perf_counter()
+            for _ in range(n):
+                policy.predict(x, deterministic=True)
+            return (time.perf_counter() - start) / n * 1e6
+
+        print(f"  {backend:12s} {load_ms:9.1f} {per_call(obs[0]):10.1f} {per_call(obs):12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark policy inference backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("check", help="Compare a backend's actions with model.predict")
+    p.add_argument("models", nargs="+", help="Model paths (without extension)")
+    p.add_argument("--backend", type=str, required=True, choices=BACKENDS[1:])
+    p.add_argument("--samples", type=int, default=10000, help="Random observations to compare on")
+    p.add_argument("--seed", type=int, default=0)
+
+    p = sub.add_parser("bench", help="Time loading and predict() of each backend")
+    p.add_argument("models", nargs="+", help="Model paths (without extension)")
+    p.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    p.add_argument("--batch", type=int, default=64)
+
+    args = parser.parse_args()
+    failed = False
+    for model_path in args.models:
+        if args.command == "check":
+            mismatches, max_diff = parity(model_path, args.backend, args.samples, args.seed)
+            status = "OK" if mismatches == 0 else "MISMATCH"
+            print(f"{status:8s} {model_path} ({args.backend}): "
+                  f"{mismatches} differing actions, max difference {max_diff:.2e}")
+            failed = failed or mismatches > 0
+        else:
+            bench(model_path, args.backends, batch=args.batch)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
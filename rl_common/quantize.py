@@ -0,0 +1,103 @@
+"""Int8 dynamic quantization of a policy's actor, gated on evaluation score.
+
+The actor MLP's Linear layers are quantized with
+`torch.ao.quantization.quantize_dynamic` (int8 weights, activations
+quantized on the fly), and the result is traced to `<model>.int8.pt`, which
+the eval and visualize scripts load with `--backend int8`. The value network
+is dropped since evaluation never uses it.
+
+Before anything is written the quantized policy plays a fixed set of seeds
+next to the float policy; if its mean score falls more than `max_drop` below
+the float one, it is rejected.
+
+Usage:
+    python -m rl_common.quantize snake/models/ppo_snake_survival --episodes 50 --max_drop 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from statistics import NormalDist
+
+import torch
+import torch.nn as nn
+
+from rl_common.eval_cache import episode_seeds, file_hash
+from rl_common.policies import backend_file, load_sb3
+from rl_common.registry import RunRegistry
+from rl_common.torch_policy import TorchPolicy, actor_from_sb3, save_traced
+from rl_common.tournament import GAMES, compare, episode_metrics, game_of, model_env_kwargs
+
+
+def quantize_actor(model) -> nn.Module:
+    actor = actor_from_sb3(model)
+    return torch.ao.quantization.quantize_dynamic(actor, {nn.Linear}, dtype=torch.qint8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize policies to int8 with an evaluation accuracy gate")
+    parser.add_argument("models", nargs="+", help="Model paths (with or without .zip)")
+    parser.add_argument("--game", type=str, default=None, choices=sorted(GAMES),
+                        help="Game the models play (worked out from the models folder if not given)")
+    parser.add_argument("--reward_mode", type=str, default=None,
+                        help="Env reward mode (defaults to the one the model was trained with)")
+    parser.add_argument("--metric", type=str, default="score", help="Per-episode metric the gate compares")
+    parser.add_argument("--episodes", type=int, default=50, help="Episodes in the fixed gate seed set")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed of the gate seed set")
+    parser.add_argument("--max_steps", type=int, default=5000, help="Maximum steps per episode")
+    parser.add_argument("--max_drop", type=float, default=0.05,
+                        help="Reject if the mean metric drops more than this fraction below the float policy")
+    parser.add_argument("--batch_size", type=int, default=16,
+                        help="Episodes run in lockstep (snake and aim_trainer)")
+    parser.add_argument("--force", action="store_true", help="Write the quantized model even if it fails the gate")
+    args = parser.parse_args()
+
+    _, seeds = episode_seeds(args.seed, args.episodes)
+    registry = RunRegistry()
+    registry.ensure_populated()
+    rejected = False
+    for model_path in args.models:
+        zip_path = backend_file(model_path)
+        game = args.game or game_of(zip_path)
+        if game is None:
+            parser.error(f"can't tell which game {zip_path} belongs to, pass --game")
+        run = registry.model_run(os.path.abspath(zip_path))
+        reward_mode = args.reward_mode or (run["reward_mode"] if run is not None else None)
+        reward_mode = reward_mode or GAMES[game].reward_modes[0]
+        env_kwargs = {"max_steps": args.max_steps}
+        if GAMES[game].reward_modes[0] is not None:
+            env_kwargs["reward_mode"] = reward_mode
+        env_kwargs = model_env_kwargs(registry, game, os.path.abspath(zip_path), env_kwargs)
+
+        model = load_sb3(zip_path)
+        try:
+            actor = quantize_actor(model)
+        except ValueError as e:
+            parser.error(f"{zip_path}: {e}")
+        policy = TorchPolicy(actor, model.observation_space.shape)
+
+        float_scores = episode_metrics(game, model, seeds, env_kwargs, args.metric, args.batch_size)
+        int8_scores = episode_metrics(game, policy, seeds, env_kwargs, args.metric, args.batch_size)
+        float_mean, int8_mean = float_scores.mean(), int8_scores.mean()
+        diff, half_width, _, _ = compare(int8_scores, float_scores, NormalDist().inv_cdf(0.975), 0.0)
+        drop = (float_mean - int8_mean) / abs(float_mean) if float_mean else 0.0
+        passed = drop <= args.max_drop
+
+        print(f"{os.path.basename(zip_path)[:-4]} ({game}, {args.episodes} episodes, base seed {args.seed})")
+        print(f"  float mean {args.metric}: {float_mean:.2f}")
+        print(f"  int8 mean {args.metric}:  {int8_mean:.2f} "
+              f"(paired difference {diff:+.2f} ± {half_width:.2f})")
+        print(f"  drop: {drop * 100:.1f}% (limit {args.max_drop * 100:.1f}%) -> {'PASS' if passed else 'REJECT'}")
+
+        if passed or args.force:
+            out_path = backend_file(zip_path, "int8")
+            save_traced(actor, model.observation_space.shape, out_path, file_hash(zip_path))
+            print(f"  Wrote {out_path}")
+        rejected = rejected or not passed
+    registry.close()
+    sys.exit(1 if rejected else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+"""SQLite registry of every trained model and evaluation run in the repo.
+
+Training and evaluation scripts record themselves here (config, git hash,
+model and tensorboard paths, final metrics and throughput) so models can be
+found by query instead of by directory naming conventions:
+
+    python -m rl_common.registry scan
+    python -m rl_common.registry list --game snake
+    python -m rl_common.registry best --game snake --where reward_mode=survival "learning_rate<1e-4" --metric mean_score
+    python -m rl_common.registry resolve "game=snake reward_mode=survival learning_rate<1e-4 best=mean_score"
+
+Paths inside the repo are stored relative to the repo root so the database
+stays valid if the checkout moves.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import time
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+from rl_common import REPO_ROOT
+
+DEFAULT_DB = os.environ.get("RL_REGISTRY", os.path.join(REPO_ROOT, "runs.sqlite"))
+
+# Columns that can be used directly in queries; anything else is looked up as a metric
+RUN_COLUMNS = (
+    "id", "kind", "game", "name", "algo", "reward_mode", "learning_rate", "timesteps", "seed",
+    "git_hash", "model_path", "tfevents_path", "csv_path", "created", "duration", "steps_per_sec", "parent_id",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    game TEXT NOT NULL,
+    name TEXT,
+    algo TEXT,
+    reward_mode TEXT,
+    learning_rate REAL,
+    timesteps INTEGER,
+    seed INTEGER,
+    config TEXT,
+    git_hash TEXT,
+    model_path TEXT,
+    tfevents_path TEXT,
+    csv_path TEXT,
+    created REAL NOT NULL,
+    duration REAL,
+    steps_per_sec REAL,
+    parent_id INTEGER REFERENCES runs(id)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, key)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_game_kind ON runs(game, kind, reward_mode);
+CREATE INDEX IF NOT EXISTS idx_runs_lr ON runs(learning_rate);
+CREATE INDEX IF NOT EXISTS idx_runs_model ON runs(model_path);
+CREATE INDEX IF NOT EXISTS idx_runs_parent ON runs(parent_id);
+CREATE INDEX IF NOT EXISTS idx_metrics_key ON metrics(key, value);
+"""
+
+_CONDITION = re.compile(r"^([A-Za-z_][\w/]*)\s*(<=|>=|!=|<|>|=)\s*(.+)$")
+
+# Models that were trained before the registry existed; `scan` backfills these
+_LEGACY_FRUIT_RUNS = {
+    "ppo_10": ("models/ppo_fruit_10.zip", "logs/PPO_10", "logs_csv/PPO_10_rewards.csv"),
+    "a2c": ("models/a2c_fruit.zip", "logs/A2C/A2C_1", "logs_csv/A2C_rewards.csv"),
+    "ppo_lr5e5": ("models/ppo_fruit_lr5e5.zip", "logs/PPO_lr5e5/PPO_1", "logs_csv/PPO_lr5e5_rewards.csv"),
+    "ppo": ("models/ppo_fruit.zip", None, "logs_csv/PPO_rewards.csv"),
+}
+_LEGACY_TF_LOGS = {
+    "ppo_snake_length_base": "snake/tf_logs/snake_length",
+    "ppo_snake_survival": "snake/tf_logs/snake_survival",
+    "ppo_snake_survival_lower_learning_rate": "snake/tf_logs/snake_survival_low_learning",
+    "ppo_aim_trainer_accuracy": "aim_trainer/tf_logs/aim_trainer_accuracy",
+    "ppo_aim_trainer_accuracy_lower_learning_rate": "aim_trainer/tf_logs/aim_trainer_accuracy_low_learning",
+    "ppo_aim_trainer_survival": "aim_trainer/tf_logs/aim_trainer_survival",
+}
+
+
+def git_hash() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _rel(path: Optional[str]) -> Optional[str]:
+    if path is None:
+        return None
+    path = os.path.abspath(path)
+    if path.startswith(REPO_ROOT + os.sep):
+        return os.path.relpath(path, REPO_ROOT).replace(os.sep, "/")
+    return path
+
+
+def repo_path(path: Optional[str]) -> Optional[str]:
+    """Absolute path for a path stored in the registry."""
+    if path is None or os.path.isabs(path):
+        return path
+    return os.path.join(REPO_ROOT, path)
+
+
+def _zip_path(model_path: str) -> str:
+    return model_path if model_path.endswith(".zip") else model_path + ".zip"
+
+
+def _parse_value(text: str):
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def parse_conditions(conditions: List[str]) -> List[Tuple[str, str, object]]:
+    parsed = []
+    for cond in conditions:
+        m = _CONDITION.match(cond.strip())
+        if not m:
+            raise ValueError(f"Bad condition '{cond}', expected e.g. learning_rate<1e-4")
+        parsed.append((m.group(1), m.group(2), _parse_value(m.group(3).strip())))
+    return parsed
+
+
+class RunRegistry:
+    def __init__(self, path: str = DEFAULT_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # Recording
+    def _insert(self, kind: str, game: str, metrics: Dict[str, float], **fields) -> int:
+        config = fields.pop("config", None) or {}
+        fields.setdefault("reward_mode", config.get("reward_mode"))
+        fields.setdefault("learning_rate", config.get("learning_rate"))
+        fields.setdefault("timesteps", config.get("timesteps"))
+        fields.setdefault("seed", config.get("seed"))
+        fields.setdefault("git_hash", git_hash())
+        for key in ("model_path", "tfevents_path", "csv_path"):
+            if fields.get(key) is not None:
+                fields[key] = _rel(fields[key])
+
+        row = dict(kind=kind, game=game, config=json.dumps(config, default=str), created=time.time(), **fields)
+        cols = ", ".join(row)
+        marks = ", ".join("?" for _ in row)
+        with self.conn:
+            cur = self.conn.execute(f"INSERT INTO runs ({cols}) VALUES ({marks})", list(row.values()))
+            run_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO metrics (run_id, key, value) VALUES (?, ?, ?)",
+                [(run_id, k, float(v)) for k, v in (metrics or {}).items() if v is not None],
+            )
+        return run_id
+
+    def record_train(self, game: str, name: str, algo: str, config: dict, model_path: str,
+                     tfevents_path: Optional[str] = None, csv_path: Optional[str] = None,
+                     metrics: Optional[Dict[str, float]] = None, duration: Optional[float] = None,
+                     steps_per_sec: Optional[float] = None) -> int:
+        existing = self.model_run(model_path)
+        if existing is not None:
+            # Retraining overwrites the zip, so the old record no longer describes it
+            with self.conn:
+                self.conn.execute("UPDATE runs SET model_path = NULL WHERE id = ?", (existing["id"],))
+        return self._insert("train", game, metrics, name=name, algo=algo, config=config,
+                            model_path=_zip_path(model_path), tfevents_path=tfevents_path, csv_path=csv_path,
+                            duration=duration, steps_per_sec=steps_per_sec)
+
+    def record_eval(self, game: str, model_path: str, config: dict, metrics: Dict[str, float],
+                    duration: Optional[float] = None, steps_per_sec: Optional[float] = None) -> int:
+        model_path = _zip_path(model_path)
+        parent = self.model_run(model_path)
+        if parent is None:
+            parent_id = self._register_model_file(game, repo_path(_rel(model_path)))
+        else:
+            parent_id = parent["id"]
+        return self._insert("eval", game, metrics, name=os.path.basename(model_path)[:-4], config=config,
+                            model_path=model_path, duration=duration, steps_per_sec=steps_per_sec,
+                            parent_id=parent_id)
+
+    def model_run(self, model_path: str) -> Optional[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT * FROM runs WHERE kind = 'train' AND model_path = ? ORDER BY created DESC LIMIT 1",
+            (_rel(_zip_path(model_path)),),
+        ).fetchone()
+
+    def ensure_populated(self):
+        """Register the model files in the repo the registry doesn't know yet (already known ones are skipped)."""
+        scan(self)
+
+    # Querying
+    def find(self, conditions: List[str] = (), kind: str = "train", metric: Optional[str] = None,
+             limit: Optional[int] = None, has_model: bool = False) -> List[sqlite3.Row]:
+        """Runs matching every condition, best `metric` first (latest first if no metric).
+
+        A training run's metrics include those of its most recent evaluation,
+        so `mean_score` on a model means its latest evaluated mean score.
+        """
+        params: List[object] = []
+        select = "r.*"
+        order = "r.created DESC"
+        if metric:
+            select += ", (" + self._metric_sql("r") + ") AS metric"
+            params.append(metric)
+            order = "metric IS NULL, metric DESC, r.created DESC"
+
+        where = ["r.kind = ?"]
+        params.append(kind)
+        if has_model:
+            where.append("r.model_path IS NOT NULL")
+        for key, op, value in parse_conditions(list(conditions)):
+            if key in RUN_COLUMNS:
+                where.append(f"r.{key} {op} ? COLLATE NOCASE")
+                params.append(value)
+            else:
+                where.append(f"({self._metric_sql('r')}) {op} ?")
+                params.extend([key, value])
+
+        sql = f"SELECT {select} FROM runs r WHERE {' AND '.join(where)} ORDER BY {order}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self.conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _metric_sql(alias: str) -> str:
+        return (
+            "SELECT m.value FROM metrics m JOIN runs e ON m.run_id = e.id "
+            f"WHERE (e.id = {alias}.id OR e.parent_id = {alias}.id) AND m.key = ? "
+            "ORDER BY e.created DESC LIMIT 1"
+        )
+
+    def metrics(self, run_id: int) -> Dict[str, float]:
+        rows = self.conn.execute("SELECT key, value FROM metrics WHERE run_id = ?", (run_id,))
+        return {r["key"]: r["value"] for r in rows}
+
+    def resolve_run(self, query: str) -> sqlite3.Row:
+        """The training run a query like "game=snake learning_rate<1e-4 best=mean_score" picks.
+
+        Bare words match the run name, `best=<metric>` picks the highest value
+        of that metric, otherwise the most recent matching model wins.
+        """
+        self.ensure_populated()
+
+        conditions = []
+        metric = None
+        for token in query.split():
+            if token.startswith("best="):
+                metric = token[len("best="):]
+            elif _CONDITION.match(token):
+                conditions.append(token)
+            else:
+                conditions.append(f"name={token}")
+
+        rows = self.find(conditions, metric=metric, limit=1, has_model=True)
+        if not rows:
+            raise LookupError(f"No model matches '{query}'")
+        return rows[0]
+
+    def resolve_model(self, query: str) -> str:
+        """Absolute model path for a query, without the .zip extension like every --model_path."""
+        return model_file(self.resolve_run(query))[:-len(".zip")]
+
+    # Backfill
+    def _register_model_file(self, game: str, zip_path: str, name: Optional[str] = None,
+                             tfevents_path: Optional[str] = None, csv_path: Optional[str] = None) -> int:
+        config = read_model_config(zip_path)
+        name = name or os.path.basename(zip_path)[:-4]
+        metrics = {}
+        if tfevents_path and os.path.isdir(tfevents_path):
+            metrics = _final_training_metrics(tfevents_path)
+        mode = re.search(r"_(survival|length|accuracy)", name)
+        config.setdefault("reward_mode", mode.group(1) if mode else None)
+        return self._insert("train", game, metrics, name=name, algo=config.get("algo"), config=config,
+                            model_path=zip_path, tfevents_path=tfevents_path, csv_path=csv_path,
+                            git_hash=None)
+
+
+def record_sb3_training(game: str, name: str, model, model_path: str, duration: float,
+                        config: Optional[dict] = None, csv_path: Optional[str] = None,
+                        metrics: Optional[Dict[str, float]] = None) -> int:
+    """Record a freshly trained SB3 model, pulling what it can from the model itself."""
+    config = dict(config or {})
+    config.setdefault("learning_rate", model.learning_rate if isinstance(model.learning_rate, float) else None)
+    config.setdefault("timesteps", model.num_timesteps)
+    config.setdefault("seed", model.seed)
+    ep_rewards = [ep["r"] for ep in model.ep_info_buffer or []]
+    ep_lengths = [ep["l"] for ep in model.ep_info_buffer or []]
+
+    registry = RunRegistry()
+    run_id = registry.record_train(
+        game, name, type(model).__name__,
+        config=config,
+        model_path=model_path,
+        tfevents_path=model.logger.get_dir() if model.logger is not None else None,
+        csv_path=csv_path,
+        metrics={
+            "train_ep_rew_mean": sum(ep_rewards) / len(ep_rewards) if ep_rewards else None,
+            "train_ep_len_mean": sum(ep_lengths) / len(ep_lengths) if ep_lengths else None,
+            **(metrics or {}),
+        },
+        duration=duration,
+        steps_per_sec=model.num_timesteps / duration if duration > 0 else None,
+    )
+    registry.close()
+    return run_id
+
+
+def model_file(run: sqlite3.Row) -> str:
+    """Absolute path of a run's model zip."""
+    return repo_path(run["model_path"])
+
+
+def read_model_config(zip_path: str) -> dict:
+    """Hyperparameters stored in an SB3 zip, read without importing torch."""
+    config = {}
+    try:
+        with zipfile.ZipFile(zip_path) as z:
+            data = json.loads(z.read("data"))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return config
+    for key in ("learning_rate", "n_steps", "batch_size", "n_epochs", "gamma", "gae_lambda",
+                "ent_coef", "vf_coef", "seed", "policy_kwargs"):
+        if key in data and not isinstance(data[key], dict):
+            config[key] = data[key]
+    config["timesteps"] = data.get("num_timesteps")
+    config["algo"] = "PPO" if "clip_range" in data else "A2C"
+    return config
+
+
+def _final_training_metrics(tfevents_dir: str) -> Dict[str, float]:
+    from rl_common.tfevents import CurveCache, Run, load_run
+
+    files = sorted(os.path.join(tfevents_dir, f) for f in os.listdir(tfevents_dir)
+                   if f.startswith("events.out.tfevents"))
+    if not files:
+        return {}
+    curves = load_run(Run("", "", files), CurveCache())
+    metrics = {}
+    for tag, key in (("rollout/ep_rew_mean", "train_ep_rew_mean"), ("rollout/ep_len_mean", "train_ep_len_mean"),
+                     ("time/fps", "train_fps")):
+        if tag in curves and len(curves[tag].mean):
+            metrics[key] = curves[tag].last
+    return metrics
+
+
+def scan(registry: RunRegistry) -> int:
+    """Register every model zip in the repo that the registry does not know yet."""
+    added = 0
+    for game in ("snake", "aim_trainer"):
+        model_dir = os.path.join(REPO_ROOT, game, "models")
+        if not os.path.isdir(model_dir):
+            continue
+        for fname in sorted(os.listdir(model_dir)):
+            if not fname.endswith(".zip"):
+                continue
+            path = os.path.join(model_dir, fname)
+            if registry.model_run(path) is not None:
+                continue
+            tf_log = _LEGACY_TF_LOGS.get(fname[:-4])
+            registry._register_model_file(game, path, tfevents_path=repo_path(tf_log) if tf_log else None)
+            added += 1
+
+    fruit_dir = os.path.join(REPO_ROOT, "FruitCatchers")
+    for name, (model, tf_log, csv_log) in _LEGACY_FRUIT_RUNS.items():
+        path = os.path.join(fruit_dir, model)
+        if not os.path.exists(path) or registry.model_run(path) is not None:
+            continue
+        registry._register_model_file(
+            "FruitCatchers", path, name=name,
+            tfevents_path=os.path.join(fruit_dir, tf_log) if tf_log else None,
+            csv_path=os.path.join(fruit_dir, csv_log),
+        )
+        added += 1
+    return added
+
+
+def _print_rows(registry: RunRegistry, rows: List[sqlite3.Row], show_metrics: bool):
+    for r in rows:
+        lr = f"{r['learning_rate']:.1e}" if r["learning_rate"] is not None else "-"
+        extra = f" metric={r['metric']:.3f}" if "metric" in r.keys() and r["metric"] is not None else ""
+        print(f"#{r['id']:<4d} {r['kind']:5s} {r['game']:13s} {r['name'] or '-':45s} algo={r['algo'] or '-':4s} "
+              f"mode={r['reward_mode'] or '-':8s} lr={lr}{extra}  {r['model_path'] or '-'}")
+        if show_metrics:
+            for k, v in sorted(registry.metrics(r["id"]).items()):
+                print(f"        {k}: {v:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the registry of trained models and evaluations")
+    parser.add_argument("--db", type=str, default=DEFAULT_DB, help="Registry database path")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("scan", help="Register model zips that are not in the registry yet")
+
+    for cmd in ("list", "best"):
+        p = sub.add_parser(cmd, help="List matching runs" if cmd == "list" else "Best run by a metric")
+        p.add_argument("--game", type=str, default=None)
+        p.add_argument("--kind", type=str, default="train", choices=["train", "eval"])
+        p.add_argument("--where", nargs="*", default=[], help="Conditions such as learning_rate<1e-4")
+        p.add_argument("--metric", type=str, default=None if cmd == "list" else "mean_score")
+        p.add_argument("--limit", type=int, default=None if cmd == "list" else 1)
+        p.add_argument("--metrics", action="store_true", help="Also print every metric of each run")
+
+    p = sub.add_parser("resolve", help="Print the model path a query resolves to")
+    p.add_argument("query", type=str)
+
+    args = parser.parse_args()
+    registry = RunRegistry(args.db)
+
+    if args.command == "scan":
+        print(f"Registered {scan(registry)} new models")
+    elif args.command in ("list", "best"):
+        conditions = list(args.where) + ([f"game={args.game}"] if args.game else [])
+        _print_rows(registry, registry.find(conditions, kind=args.kind, metric=args.metric, limit=args.limit),
+                    args.metrics)
+    elif args.command == "resolve":
+        print(registry.resolve_model(args.query))
+
+    registry.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Shared pygame drawing for the game envs: cached text and dirty-rectangle redraws.
+
+An env describes its frame as a list of plain tuples (rectangles, circles,
+lines, text) instead of drawing it. `DirtyRenderer` compares that list with
+the previous frame's and only repaints the areas that changed: for snake
+that is the new head, the old tail and sometimes the food and score, not the
+whole board. Fonts are opened once and text is built from cached glyph
+surfaces, so a HUD line that changes every frame doesn't go through the font
+renderer. `FrameLimiter` lets a window draw at most `fps` frames a second
+however fast the env steps.
+
+Items, all coordinates in whole pixels:
+
+    ("rect", color, x, y, w, h)
+    ("ellipse", color, x, y, w, h)
+    ("circle", color, cx, cy, radius)
+    ("line", color, x1, y1, x2, y2, width)
+    ("text", font, text, color, x, y, anchor)   font from `font_key`, anchor a pygame.Rect attribute
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import pygame
+
+_fonts: Dict[tuple, "pygame.font.Font"] = {}
+_glyphs: Dict[tuple, "pygame.Surface"] = {}
+_texts: "OrderedDict[tuple, pygame.Surface]" = OrderedDict()
+_MAX_TEXTS = 256
+_quit_hooked = False
+
+
+def font_key(size: int, name: Optional[str] = None, sysfont: bool = False) -> tuple:
+    """Hashable font description for text items: `pygame.font.Font(name, size)` or `SysFont(name, size)`."""
+    return (name, size, sysfont)
+
+
+def _forget_fonts():
+    global _quit_hooked
+    _fonts.clear()
+    _glyphs.clear()
+    _texts.clear()
+    _quit_hooked = False
+
+
+def font(key: tuple) -> "pygame.font.Font":
+    global _quit_hooked
+    if not pygame.font.get_init():
+        _forget_fonts()
+        pygame.font.init()
+    if not _quit_hooked:
+        # Fonts don't survive pygame.quit(), even if pygame.init() brings the font module back before the next
+        # call, so the caches are emptied when it runs (pygame forgets its quit hooks once they have run)
+        pygame.register_quit(_forget_fonts)
+        _quit_hooked = True
+    f = _fonts.get(key)
+    if f is None:
+        name, size, sysfont = key
+        f = _fonts[key] = pygame.font.SysFont(name, size) if sysfont else pygame.font.Font(name, size)
+    return f
+
+
+def text_surface(key: tuple, text: str, color) -> "pygame.Surface":
+    """`text` rendered with the font, pieced together from cached glyphs (no kerning)."""
+    cache_key = (key, text, color)
+    surface = _texts.get(cache_key)
+    if surface is not None:
+        _texts.move_to_end(cache_key)
+        return surface
+    f = font(key)
+    glyphs = []
+    for ch in text:
+        glyph = _glyphs.get((key, ch, color))
+        if glyph is None:
+            glyph = _glyphs[(key, ch, color)] = f.render(ch, True, color)
+        glyphs.append(glyph)
+    surface = pygame.Surface((max(1, sum(g.get_width() for g in glyphs)), f.get_height()), pygame.SRCALPHA)
+    x = 0
+    for glyph in glyphs:
+        surface.blit(glyph, (x, 0))
+        x += glyph.get_width()
+    _texts[cache_key] = surface
+    if len(_texts) > _MAX_TEXTS:
+        _texts.popitem(last=False)
+    return surface
+
+
+def _text_rect(item: tuple) -> "pygame.Rect":
+    _, key, text, color, x, y, anchor = item
+    rect = text_surface(key, text, color).get_rect()
+    setattr(rect, anchor, (x, y))
+    return rect
+
+
+def bounds(item: tuple) -> "pygame.Rect":
+    kind = item[0]
+    if kind in ("rect", "ellipse"):
+        return pygame.Rect(item[2:6])
+    if kind == "circle":
+        _, _, cx, cy, r = item
+        return pygame.Rect(cx - r - 1, cy - r - 1, 2 * r + 3, 2 * r + 3)
+    if kind == "line":
+        _, _, x1, y1, x2, y2, width = item
+        return pygame.Rect(min(x1, x2), min(y1, y2), abs(x2 - x1) + 1, abs(y2 - y1) + 1).inflate(width + 2, width + 2)
+    if kind == "text":
+        return _text_rect(item)
+    raise ValueError(f"unknown item kind {kind!r}")
+
+
+def draw_item(surface: "pygame.Surface", item: tuple, rect: "pygame.Rect"):
+    kind = item[0]
+    if kind == "rect":
+        pygame.draw.rect(surface, item[1], rect)
+    elif kind == "ellipse":
+        pygame.draw.ellipse(surface, item[1], rect)
+    elif kind == "circle":
+        pygame.draw.circle(surface, item[1], item[2:4], item[4])
+    elif kind == "line":
+        _, color, x1, y1, x2, y2, width = item
+        # Clipping changes how pygame rasterises thick lines, so straight ones are filled as the
+        # same rectangle pygame.draw.line would cover
+        offset = (width - 1) // 2
+        if y1 == y2:
+            surface.fill(color, (min(x1, x2), y1 - offset, abs(x2 - x1) + 1, width))
+        elif x1 == x2:
+            surface.fill(color, (x1 - offset, min(y1, y2), width, abs(y2 - y1) + 1))
+        else:
+            pygame.draw.line(surface, color, (x1, y1), (x2, y2), width)
+    else:
+        surface.blit(text_surface(item[1], item[2], item[3]), rect)
+
+
+class DirtyRenderer:
+    """Draws frames given as item lists onto `surface`, repainting only what changed."""
+
+    def __init__(self, surface: "pygame.Surface", background: Union[Tuple[int, int, int], "pygame.Surface"]):
+        self.surface = surface
+        self.background = background
+        self._rects: Dict[tuple, "pygame.Rect"] = {}
+
+    def invalidate(self):
+        """Repaint everything on the next frame (e.g. after something else drew on the surface)."""
+        self._rects = {}
+
+    def _erase(self, area: "pygame.Rect"):
+        if isinstance(self.background, pygame.Surface):
+            self.surface.blit(self.background, area, area)
+        else:
+            self.surface.fill(self.background, area)
+
+    def draw(self, items: Sequence[tuple]) -> List["pygame.Rect"]:
+        """Bring the surface up to `items` (drawn in order); returns the rectangles that changed."""
+        previous = self._rects
+        current = {}
+        for item in items:
+            current[item] = previous[item] if item in previous else bounds(item)
+        self._rects = current
+        order = list(current)
+        rects = list(current.values())
+
+        if not previous:
+            full = self.surface.get_rect()
+            self._erase(full)
+            for item, rect in current.items():
+                draw_item(self.surface, item, rect)
+            return [full]
+
+        dirty = [rect for item, rect in previous.items() if item not in current]
+        dirty += [rect for item, rect in current.items() if item not in previous]
+        clip = self.surface.get_clip()
+        for area in dirty:
+            # Repaint the area from the background up, clipped so nothing outside it is drawn twice
+            self.surface.set_clip(area)
+            self._erase(area)
+            for i in area.collidelistall(rects):
+                draw_item(self.surface, order[i], rects[i])
+        self.surface.set_clip(clip)
+        return dirty
+
+
+class FrameLimiter:
+    """Says whether a frame is due, so a window draws at most `fps` frames a second."""
+
+    def __init__(self, fps: float):
+        self.interval = 1.0 / fps
+        self._last = float("-inf")
+        self.skipped = 0
+
+    def due(self, force: bool = False) -> bool:
+        now = time.perf_counter()
+        if force or now - self._last >= self.interval:
+            self._last = now
+            return True
+        self.skipped += 1
+        return False
@@ -0,0 +1,193 @@
+"""Inference weights memory-mapped once and shared by every process that uses them.
+
+`PPO.load` in every eval worker unzips and unpickles the whole model (critic
+and optimizer state included) into that worker's private memory. Here a
+model's actor weights are written once, as plain `.npy` files in a cache
+folder keyed by the zip's hash, and every process opens them with
+`np.load(mmap_mode="r")`. The pages live in the OS page cache and are shared by
+all processes, so attaching is zero-copy and takes about a millisecond.
+
+Each process keeps a small LRU of attached models, so a tournament that goes
+through many models only has a few of them mapped at any time.
+
+Usage:
+    python -m rl_common.shared_policies materialize snake/models/*.zip
+    python -m rl_common.shared_policies bench --workers 4 snake/models/*.zip
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from rl_common import REPO_ROOT
+from rl_common.numpy_policy import NumpyPolicy
+
+DEFAULT_DIR = os.environ.get("RL_POLICY_CACHE", os.path.join(REPO_ROOT, ".policy_cache"))
+
+
+def _zip_path(model_path: str) -> str:
+    return model_path if model_path.endswith(".zip") else model_path + ".zip"
+
+
+def materialize(model_path: str, cache_dir: str = DEFAULT_DIR) -> str:
+    """Folder holding the model's inference weights, written on first use."""
+    from rl_common.eval_cache import file_hash
+
+    zip_path = _zip_path(model_path)
+    target = os.path.join(cache_dir, file_hash(zip_path)[:32])
+    if os.path.exists(os.path.join(target, "meta.json")):
+        return target
+
+    from rl_common.numpy_policy import from_sb3
+    from rl_common.policies import load_sb3
+
+    policy = from_sb3(load_sb3(zip_path))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp-")
+    for i, (w, b) in enumerate(zip(policy.weights, policy.biases)):
+        np.save(os.path.join(tmp, f"w{i}.npy"), w)
+        np.save(os.path.join(tmp, f"b{i}.npy"), b)
+    if policy.low is not None:
+        np.save(os.path.join(tmp, "low.npy"), policy.low)
+        np.save(os.path.join(tmp, "high.npy"), policy.high)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"source": os.path.relpath(os.path.abspath(zip_path), REPO_ROOT), "n_layers": len(policy.weights),
+                   "activation": policy.activation, "action_type": policy.action_type,
+                   "obs_shape": list(policy.obs_shape)}, f)
+    try:
+        # Atomic, so processes racing to materialize the same model all end up with one copy
+        os.rename(tmp, target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def attach(folder: str) -> NumpyPolicy:
+    """A NumpyPolicy whose weights are read-only memory maps of the folder's files."""
+    with open(os.path.join(folder, "meta.json")) as f:
+        meta = json.load(f)
+
+    def load(name):
+        return np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r")
+
+    n = meta["n_layers"]
+    has_bounds = os.path.exists(os.path.join(folder, "low.npy"))
+    return NumpyPolicy(
+        weights=[load(f"w{i}") for i in range(n)],
+        biases=[load(f"b{i}") for i in range(n)],
+        activation=meta["activation"],
+        action_type=meta["action_type"],
+        low=load("low") if has_bounds else None,
+        high=load("high") if has_bounds else None,
+        obs_shape=tuple(meta["obs_shape"]),
+    )
+
+
+class PolicyLRU:
+    """The `capacity` most recently used shared policies of this process."""
+
+    def __init__(self, capacity: int = 4, cache_dir: str = DEFAULT_DIR):
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self._policies: "OrderedDict[str, NumpyPolicy]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_path: str) -> NumpyPolicy:
+        key = os.path.abspath(_zip_path(model_path))
+        policy = self._policies.get(key)
+        if policy is not None:
+            self.hits += 1
+            self._policies.move_to_end(key)
+            return policy
+        self.misses += 1
+        policy = self._policies[key] = attach(materialize(key, self.cache_dir))
+        while len(self._policies) > self.capacity:
+            # Dropping the last reference unmaps the files
+            self._policies.popitem(last=False)
+        return policy
+
+
+_lru: Optional[PolicyLRU] = None
+
+
+def load_shared(model_path: str) -> NumpyPolicy:
+    """Shared policy through this process's LRU (capacity from RL_POLICY_LRU, default 4)."""
+    global _lru
+    if _lru is None:
+        _lru = PolicyLRU(int(os.environ.get("RL_POLICY_LRU", "4")))
+    return _lru.get(model_path)
+
+
+def memory_usage() -> Dict[str, float]:
+    """This process's resident, proportional-share and private memory in MB (Linux)."""
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    usage[key] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        usage["Rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if "Private_Clean" in usage:
+        usage["Private"] = usage.pop("Private_Clean") + usage.pop("Private_Dirty")
+    return usage
+
+
+def _bench_worker(backend: str, model_paths: List[str], steps: int) -> dict:
+    from rl_common.policies import load_policy
+
+    start = time.perf_counter()
+    for _ in range(2):
+        for path in model_paths:
+            policy = load_shared(path) if backend == "mmap" else load_policy(path, backend)
+            obs_shape = tuple(getattr(policy, "obs_shape", None) or policy.observation_space.shape)
+            obs = np.zeros(obs_shape, dtype=np.float32)
+            for _ in range(steps):
+                policy.predict(obs, deterministic=True)
+    return {"seconds": time.perf_counter() - start, **memory_usage()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory-mapped inference weights shared between processes")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("materialize", help="Write the shared weights of each model (done on first use otherwise)")
+    p.add_argument("models", nargs="+", help="Model zips (with or without .zip)")
+
+    p = sub.add_parser("bench", help="Memory and time of N workers going through every model twice")
+    p.add_argument("models", nargs="+")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--backends", nargs="+", default=["mmap", "sb3"])
+    p.add_argument("--steps", type=int, default=200, help="predict calls per model visit")
+
+    args = parser.parse_args()
+    if args.command == "materialize":
+        for model_path in args.models:
+            print(f"{model_path} -> {materialize(model_path)}")
+        return
+
+    for model_path in args.models:
+        materialize(model_path)
+    print(f"{args.workers} workers, {len(args.models)} models, LRU of {os.environ.get('RL_POLICY_LRU', '4')}")
+    for backend in args.backends:
+        with mp.get_context("spawn").Pool(args.workers) as pool:
+            results = pool.starmap(_bench_worker, [(backend, args.models, args.steps)] * args.workers)
+        mean = {k: float(np.mean([r[k] for r in results if k in r])) for k in results[0]}
+        print(f"  {backend:6s} per worker: {mean['seconds']:6.2f} s, RSS {mean.get('Rss', 0):7.1f} MB, "
+              f"PSS {mean.get('Pss', 0):7.1f} MB, private {mean.get('Private', 0):7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""Subprocess vector env that passes step results through shared memory.
+
+SB3's `SubprocVecEnv` sends every action and every (obs, reward, done,
+info) tuple through a pipe, pickled. For the small observations here that
+pickling and the pipe round trip cost more than stepping the env. In
+`ShmVecEnv` the actions, observations, rewards and done flags live in one
+shared memory block that the main process and every worker map as numpy
+arrays:
+
+1. the main process writes the actions and releases each worker's semaphore
+2. each worker steps its env, writes its row of the results (and the final
+   observation when an episode ends, before resetting) and releases the
+   shared "done" semaphore
+3. the main process waits for all of them and copies the results out
+
+Info dicts are the only thing still pickled, and only when they are not
+empty: pass `info_keys` to keep just the keys the learner reads (SB3 needs
+Monitor's "episode"), and a worker then sends nothing on most steps.
+Everything that isn't a step (reset, get_attr, env_method, ...) goes
+through the pipe as in `SubprocVecEnv`.
+
+Every worker also adds up the time it spends stepping its env
+(`busy_time()`), so the share of wall time each worker was busy can be
+reported. `AsyncShmVecEnv` steps workers one at a time instead of all
+together; see `rl_common.async_rollouts`.
+
+Observation spaces must be a single `Box`.
+
+Usage:
+    env = ShmVecEnv([partial(make_env, seed=seed + i) for i in range(8)], info_keys=("episode",))
+    model = PPO("MlpPolicy", env)
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv, VecEnvIndices
+from stable_baselines3.common.vec_env.patch_gym import _patch_env
+
+_STEP, _PIPE, _CLOSE = 1, 2, 3
+
+
+def _layout(n: int, observation_space: spaces.Box, action_space: spaces.Space) -> Tuple[Dict[str, tuple], int]:
+    """Name -> (offset, shape, dtype) of each array in the shared block, and the block's size."""
+    arrays = {
+        "obs": ((n,) + observation_space.shape, observation_space.dtype),
+        "terminal_obs": ((n,) + observation_space.shape, observation_space.dtype),
+        "actions": ((n,) + (action_space.shape or ()), action_space.dtype),
+        "rewards": ((n,), np.float32),
+        "dones": ((n,), np.bool_),
+        "truncated": ((n,), np.bool_),
+        "has_info": ((n,), np.bool_),
+        "ready": ((n,), np.bool_),
+        "busy": ((n,), np.float64),
+        "command": ((n,), np.int8),
+    }
+    layout, offset = {}, 0
+    for name, (shape, dtype) in arrays.items():
+        dtype = np.dtype(dtype)
+        layout[name] = (offset, shape, dtype.str)
+        # Keep every array 8-byte aligned
+        offset += -(-int(np.prod(shape)) * dtype.itemsize // 8) * 8
+    return layout, offset
+
+
+def _views(shm: shared_memory.SharedMemory, layout: Dict[str, tuple]) -> Dict[str, np.ndarray]:
+    return {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            for name, (offset, shape, dtype) in layout.items()}
+
+
+def _filter(info: dict, keys: Optional[Sequence[str]]) -> dict:
+    if keys is None:
+        return info
+    return {key: info[key] for key in keys if key in info}
+
+
+def _worker(index: int, remote, parent_remote, env_fn_wrapper: CloudpickleWrapper, go, done,
+            info_keys: Optional[Sequence[str]]):
+    from stable_baselines3.common.env_util import is_wrapped
+
+    parent_remote.close()
+    env = _patch_env(env_fn_wrapper.var())
+    shm = None
+    try:
+        remote.send((env.observation_space, env.action_space))
+        name, layout = remote.recv()
+        shm = shared_memory.SharedMemory(name=name)
+        views = _views(shm, layout)
+        obs, command = views["obs"], views["command"]
+        while True:
+            go.acquire()
+            if command[index] == _STEP:
+                start = time.perf_counter()
+                observation, reward, terminated, truncated, info = env.step(views["actions"][index])
+                reset_info = {}
+                if terminated or truncated:
+                    views["terminal_obs"][index] = observation
+                    observation, reset_info = env.reset()
+                obs[index] = observation
+                views["rewards"][index] = reward
+                views["dones"][index] = terminated or truncated
+                views["truncated"][index] = truncated and not terminated
+                info, reset_info = _filter(info, info_keys), _filter(reset_info, info_keys)
+                views["has_info"][index] = bool(info or reset_info)
+                views["ready"][index] = True
+                views["busy"][index] += time.perf_counter() - start
+                done.release()
+                # Sent after releasing, so a large info can't fill the pipe while the main process still waits
+                if info or reset_info:
+                    remote.send((info, reset_info))
+                continue
+            if command[index] == _CLOSE:
+                break
+            cmd, data = remote.recv()
+            try:
+                if cmd == "reset":
+                    observation, result = env.reset(seed=data[0], **({"options": data[1]} if data[1] else {}))
+                    obs[index] = observation
+                elif cmd == "render":
+                    result = env.render()
+                elif cmd == "env_method":
+                    result = env.get_wrapper_attr(data[0])(*data[1], **data[2])
+                elif cmd == "get_attr":
+                    result = env.get_wrapper_attr(data)
+                elif cmd == "set_attr":
+                    result = setattr(env, data[0], data[1])
+                elif cmd == "is_wrapped":
+                    result = is_wrapped(env, data)
+                else:
+                    raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+            except Exception as e:
+                result = e
+            remote.send(result)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        env.close()
+        if shm is not None:
+            # The numpy views must go before the mapping can be closed
+            views = obs = command = None
+            shm.close()
+
+
+class ShmVecEnv(VecEnv):
+    """`SubprocVecEnv` replacement with the per-step data in shared memory (see the module docstring).
+
+    :param env_fns: Functions building the environments, one per worker process
+    :param start_method: multiprocessing start method (forkserver where available, like SubprocVecEnv)
+    :param info_keys: Info keys to pass back to the learner; None passes every key
+    """
+
+    def __init__(self, env_fns: List[Callable[[], gym.Env]], start_method: Optional[str] = None,
+                 info_keys: Optional[Sequence[str]] = None):
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self._go = [ctx.Semaphore(0) for _ in range(n_envs)]
+        self._done = ctx.Semaphore(0)
+        self.remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for i, (work_remote, remote, env_fn) in enumerate(zip(work_remotes, self.remotes, env_fns)):
+            args = (i, work_remote, remote, CloudpickleWrapper(env_fn), self._go[i], self._done, info_keys)
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        observation_space, action_space = [remote.recv() for remote in self.remotes][0]
+        self._shm = None
+        if not isinstance(observation_space, spaces.Box):
+            self.close()
+            raise ValueError(f"ShmVecEnv needs a Box observation space, not {observation_space}")
+        layout, size = _layout(n_envs, observation_space, action_space)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._views = _views(self._shm, layout)
+        for remote in self.remotes:
+            remote.send((self._shm.name, layout))
+
+        super().__init__(n_envs, observation_space, action_space)
+
+    def _call(self, indices: Sequence[int], cmd: str, data: Sequence[Any]) -> List[Any]:
+        """Send `(cmd, data[k])` through the pipe to worker `indices[k]` and collect the replies."""
+        command = self._views["command"]
+        for i, item in zip(indices, data):
+            command[i] = _PIPE
+            self.remotes[i].send((cmd, item))
+            self._go[i].release()
+        results = [self.remotes[i].recv() for i in indices]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def _call_all(self, indices: VecEnvIndices, cmd: str, data: Any = None) -> List[Any]:
+        indices = self._get_indices(indices)
+        return self._call(indices, cmd, [data] * len(indices))
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self._views["actions"][:] = actions
+        self._views["command"][:] = _STEP
+        for go in self._go:
+            go.release()
+        self.waiting = True
+
+    def step_wait(self):
+        for _ in range(self.num_envs):
+            self._done.acquire()
+        self.waiting = False
+        views = self._views
+        infos: List[Dict[str, Any]] = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(views["has_info"]):
+            infos[i], reset_info = self.remotes[i].recv()
+            if reset_info:
+                self.reset_infos[i] = reset_info
+        for i, info in enumerate(infos):
+            # Every step, as SB3's vec envs do
+            info["TimeLimit.truncated"] = bool(views["truncated"][i])
+            if views["dones"][i]:
+                info["terminal_observation"] = views["terminal_obs"][i].copy()
+        # Copies, since the workers overwrite the shared arrays on the next step
+        return views["obs"].copy(), views["rewards"].copy(), views["dones"].copy(), infos
+
+    def busy_time(self) -> np.ndarray:
+        """Seconds each worker has spent stepping its env so far."""
+        return self._views["busy"].copy()
+
+    def reset(self):
+        self.reset_infos = self._call(range(self.num_envs), "reset", list(zip(self._seeds, self._options)))
+        self._reset_seeds()
+        self._reset_options()
+        return self._views["obs"].copy()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.waiting:
+            self.step_wait()
+        if self._shm is not None:
+            self._views["command"][:] = _CLOSE
+            for go in self._go:
+                go.release()
+        else:
+            # Workers are still waiting for the shared block; closing the pipes stops them
+            for remote in self.remotes:
+                remote.close()
+        for process in self.processes:
+            process.join()
+        if self._shm is not None:
+            self._views = {}
+            self._shm.close()
+            self._shm.unlink()
+        self.closed = True
+
+    def get_images(self) -> Sequence[Optional[np.ndarray]]:
+        if self.render_mode != "rgb_array":
+            return [None for _ in range(self.num_envs)]
+        return self._call_all(None, "render")
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        return self._call_all(indices, "get_attr", attr_name)
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        self._call_all(indices, "set_attr", (attr_name, value))
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return self._call_all(indices, "env_method", (method_name, method_args, method_kwargs))
+
+    def env_is_wrapped(self, wrapper_class, indices: VecEnvIndices = None) -> List[bool]:
+        return self._call_all(indices, "is_wrapped", wrapper_class)
+
+
+class AsyncShmVecEnv(ShmVecEnv):
+    """`ShmVecEnv` whose workers step independently: `send` actions to some of them, then `poll` for
+    whichever have finished. `step`, `reset`, `env_method`, ... first wait for the steps still running.
+    """
+
+    def __init__(self, env_fns: List[Callable[[], gym.Env]], start_method: Optional[str] = None,
+                 info_keys: Optional[Sequence[str]] = None):
+        super().__init__(env_fns, start_method, info_keys)
+        self.in_flight = np.zeros(self.num_envs, dtype=bool)
+
+    def send(self, indices: Sequence[int], actions: np.ndarray) -> None:
+        """Start a step of each worker in `indices` with the matching row of `actions`."""
+        views = self._views
+        for i, action in zip(indices, actions):
+            views["actions"][i] = action
+            views["ready"][i] = False
+            views["command"][i] = _STEP
+            self.in_flight[i] = True
+            self._go[i].release()
+
+    def poll(self, min_ready: int = 1):
+        """Wait until at least `min_ready` running steps have finished (all of them if fewer are running).
+
+        :return: (indices, obs, rewards, dones, infos) of every finished step, in worker order
+        """
+        views = self._views
+        min_ready = min(min_ready, int(self.in_flight.sum()))
+        finished: List[int] = []
+        acquired = 0
+        while len(finished) < min_ready or acquired < len(finished):
+            self._done.acquire()
+            acquired += 1
+            if acquired > len(finished):
+                # A worker sets its ready flag before releasing, so at least one new one is set. Others may
+                # be set before their release; those releases are waited for on the next iterations
+                new = np.flatnonzero(self.in_flight & views["ready"])
+                self.in_flight[new] = False
+                finished.extend(new)
+        indices = np.sort(np.array(finished, dtype=int))
+        infos: List[Dict[str, Any]] = [{} for _ in indices]
+        for k, i in enumerate(indices):
+            if views["has_info"][i]:
+                infos[k], reset_info = self.remotes[i].recv()
+                if reset_info:
+                    self.reset_infos[i] = reset_info
+            infos[k]["TimeLimit.truncated"] = bool(views["truncated"][i])
+            if views["dones"][i]:
+                infos[k]["terminal_observation"] = views["terminal_obs"][i].copy()
+        # Fancy indexing copies, so the next step can't overwrite these
+        return indices, views["obs"][indices], views["rewards"][indices], views["dones"][indices], infos
+
+    def drain(self) -> None:
+        """Wait for every running step and discard the results."""
+        while self.in_flight.any():
+            self.poll(int(self.in_flight.sum()))
+
+    def _call(self, indices: Sequence[int], cmd: str, data: Sequence[Any]) -> List[Any]:
+        self.drain()
+        return super()._call(indices, cmd, data)
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self.drain()
+        super().step_async(actions)
+
+    def close(self) -> None:
+        if not self.closed and self._shm is not None:
+            self.drain()
+        super().close()
+
+
+VEC_ENVS = ("shm", "async", "subproc", "dummy")
+
+
+def make_vec_env(env_fns: List[Callable[[], gym.Env]], kind: str = "shm"):
+    """Vector env of the given kind for the training scripts' `--vec_env` option."""
+    if kind == "shm":
+        # Monitor's episode stats are the only info the training scripts use
+        return ShmVecEnv(env_fns, info_keys=("episode",))
+    if kind == "async":
+        # Only useful with rl_common.async_rollouts.use_async_rollouts(model)
+        return AsyncShmVecEnv(env_fns, info_keys=("episode",))
+    if kind == "subproc":
+        from stable_baselines3.common.vec_env import SubprocVecEnv
+        return SubprocVecEnv(env_fns)
+    from stable_baselines3.common.vec_env import DummyVecEnv
+    return DummyVecEnv(env_fns)
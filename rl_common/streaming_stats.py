@@ -0,0 +1,159 @@
+"""Constant-memory statistics for long or very large evaluations.
+
+Everything here is updated one value at a time and never keeps the values
+themselves, so an evaluation of a million episodes (or a single episode of
+millions of steps) uses the same memory as one of ten.
+"""
+from __future__ import annotations
+
+import bisect
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class RunningStats:
+    """Welford's online mean/variance; also works element-wise on numpy arrays."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self.total = 0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean = self.mean + delta / self.n
+        self._m2 = self._m2 + delta * (x - self.mean)
+        self.total = self.total + x
+        self.min = x if self.min is None else np.minimum(self.min, x)
+        self.max = x if self.max is None else np.maximum(self.max, x)
+
+    @property
+    def var(self):
+        """Population variance, like np.var."""
+        return self._m2 / self.n if self.n else 0.0
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+
+class QuantileSketch:
+    """Streaming histogram (Ben-Haim & Tom-Tov) for order statistics.
+
+    While there are at most `max_bins` distinct values it is exact, which is
+    always the case for step counts bounded by max_steps with the default size.
+    Past that, the two closest bins are merged, so memory stays fixed and
+    quantiles become approximate.
+    """
+
+    def __init__(self, max_bins: int = 8192):
+        self.max_bins = max_bins
+        self.n = 0
+        self._values: List[float] = []
+        self._counts: List[int] = []
+
+    def add(self, x: float):
+        self.n += 1
+        i = bisect.bisect_left(self._values, x)
+        if i < len(self._values) and self._values[i] == x:
+            self._counts[i] += 1
+            return
+        self._values.insert(i, x)
+        self._counts.insert(i, 1)
+        if len(self._values) > self.max_bins:
+            self._merge_closest()
+
+    def _merge_closest(self):
+        gaps = np.diff(self._values)
+        i = int(np.argmin(gaps))
+        c1, c2 = self._counts[i], self._counts[i + 1]
+        merged = (self._values[i] * c1 + self._values[i + 1] * c2) / (c1 + c2)
+        self._values[i:i + 2] = [merged]
+        self._counts[i:i + 2] = [c1 + c2]
+
+    def order_statistic(self, k: int) -> float:
+        """The k-th smallest value (0-based), i.e. sorted(values)[k]."""
+        seen = 0
+        for value, count in zip(self._values, self._counts):
+            seen += count
+            if k < seen:
+                return value
+        return self._values[-1]
+
+    def quantile(self, q: float) -> float:
+        """sorted(values)[int(q * n)], the indexing the eval scripts use for quartiles."""
+        return self.order_statistic(min(self.n - 1, int(q * self.n)))
+
+
+class ActionHistogram:
+    """Counts of discrete actions, buffered and folded in with np.bincount."""
+
+    def __init__(self, n_actions: int, buffer_size: int = 1024):
+        self.counts = np.zeros(n_actions, dtype=np.int64)
+        self._buffer = np.empty(buffer_size, dtype=np.int64)
+        self._filled = 0
+
+    def add(self, action: int):
+        self._buffer[self._filled] = action
+        self._filled += 1
+        if self._filled == len(self._buffer):
+            self._flush()
+
+    def _flush(self):
+        if self._filled:
+            self.counts += np.bincount(self._buffer[:self._filled], minlength=len(self.counts))
+            self._filled = 0
+
+    def result(self) -> np.ndarray:
+        self._flush()
+        return self.counts
+
+
+class EpisodeAggregator:
+    """Summary statistics over per-episode result rows, without keeping the rows.
+
+    `stats` fields get a RunningStats, `quantiles` fields also get a
+    QuantileSketch, and `counters` maps a name to a predicate counted over rows.
+    A stats field can be given as (name, predicate) to only include some rows.
+    """
+
+    def __init__(self, stats: Iterable, quantiles: Iterable[str] = (),
+                 counters: Optional[Dict[str, Callable[[dict], bool]]] = None):
+        self.n = 0
+        self._filters: Dict[str, Optional[Callable[[dict], bool]]] = {}
+        for field in stats:
+            name, predicate = field if isinstance(field, tuple) else (field, None)
+            self._filters[name] = predicate
+        self.stats = {name: RunningStats() for name in self._filters}
+        self.quantiles = {name: QuantileSketch() for name in quantiles}
+        self._counter_predicates = dict(counters or {})
+        self.counters = {name: 0 for name in self._counter_predicates}
+
+    def add(self, row: dict):
+        self.n += 1
+        for name, predicate in self._filters.items():
+            if predicate is None or predicate(row):
+                self.stats[name].add(row[name])
+        for name, sketch in self.quantiles.items():
+            sketch.add(row[name])
+        for name, predicate in self._counter_predicates.items():
+            if predicate(row):
+                self.counters[name] += 1
+
+    def mean(self, name: str) -> float:
+        return float(self.stats[name].mean)
+
+    def std(self, name: str) -> float:
+        return float(self.stats[name].std)
+
+    def total(self, name: str):
+        return self.stats[name].total
+
+    def max(self, name: str):
+        return self.stats[name].max
+
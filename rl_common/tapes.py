@@ -0,0 +1,460 @@
+"""Deterministic episode tapes: record an episode once, replay it without the model.
+
+Snake and aim trainer episodes are fully determined by the env's seed, its
+config and the actions taken, so that is all a tape stores:
+
+    b"RLTAPE1\\n", a 4 byte header length, the JSON header, then zlib blobs
+
+The header holds the game, env class and config, the seed, the episode's
+metrics and where each blob starts. Discrete actions are bit packed (2 bits
+each for snake), box actions are stored as raw float32 so replay is exact.
+Every `checkpoint_every` steps the env's state (positions, counters and RNG
+states, as JSON) is stored too, so a player can jump to any step by restoring
+the nearest checkpoint and re-simulating at most that many steps headless.
+
+Replaying needs the env only: no torch, no SB3 and no model file.
+
+Usage:
+    python src/snake_eval.py --model_path models/ppo_snake_survival --tapes best worst 3
+    python src/visualize_snake.py --tape logs/tapes/ppo_snake_survival_survival_ep3_seed123.tape
+    python -m rl_common.tapes verify snake/logs/tapes/*.tape
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import struct
+import sys
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"RLTAPE1\n"
+VERSION = 1
+DEFAULT_CHECKPOINT_EVERY = 500
+
+# Attributes that belong to the window rather than the game
+_RENDER_ATTRS = {"render_mode", "_pygame", "_screen", "_clock", "_renderer", "_frames"}
+_PLAIN = (bool, int, float, str, list, tuple, dict, type(None))
+
+
+def _encode(value):
+    if isinstance(value, random.Random):
+        version, internal, gauss = value.getstate()
+        return {"__random__": [version, list(internal), gauss]}
+    if isinstance(value, np.random.Generator):
+        return {"__generator__": value.bit_generator.state}
+    if isinstance(value, np.ndarray):
+        return {"__ndarray__": value.tolist(), "dtype": str(value.dtype)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "__random__" in value:
+        version, internal, gauss = value["__random__"]
+        rnd = random.Random()
+        rnd.setstate((version, tuple(internal), gauss))
+        return rnd
+    if "__generator__" in value:
+        state = value["__generator__"]
+        bit_generator = getattr(np.random, state["bit_generator"])()
+        bit_generator.state = state
+        return np.random.Generator(bit_generator)
+    if "__ndarray__" in value:
+        return np.asarray(value["__ndarray__"], dtype=value["dtype"])
+    if "__tuple__" in value:
+        return tuple(_decode(v) for v in value["__tuple__"])
+    return {k: _decode(v) for k, v in value.items()}
+
+
+def env_state(env) -> dict:
+    """JSON-able copy of everything that decides how the env plays on."""
+    state = {}
+    for key, value in vars(env).items():
+        if key in _RENDER_ATTRS:
+            continue
+        if isinstance(value, _PLAIN + (random.Random, np.random.Generator, np.ndarray, np.generic)):
+            state[key] = _encode(value)
+    return state
+
+
+def restore_state(env, state: dict):
+    for key, value in state.items():
+        setattr(env, key, _decode(value))
+
+
+def _describe_space(space) -> dict:
+    if hasattr(space, "n"):
+        return {"type": "discrete", "n": int(space.n)}
+    return {"type": "box", "shape": list(space.shape)}
+
+
+def pack_actions(actions: np.ndarray, space: dict) -> bytes:
+    if space["type"] == "box":
+        return zlib.compress(np.asarray(actions, dtype="<f4").tobytes())
+    bits = _bits(space["n"])
+    per_byte = 8 // bits
+    a = np.zeros(-(-len(actions) // per_byte) * per_byte, dtype=np.uint8)
+    a[:len(actions)] = actions
+    a = a.reshape(-1, per_byte)
+    packed = np.zeros(len(a), dtype=np.uint8)
+    for i in range(per_byte):
+        packed |= a[:, i] << (bits * i)
+    return zlib.compress(packed.tobytes())
+
+
+def unpack_actions(blob: bytes, space: dict, steps: int) -> np.ndarray:
+    raw = zlib.decompress(blob)
+    if space["type"] == "box":
+        return np.frombuffer(raw, dtype="<f4").reshape((steps,) + tuple(space["shape"]))
+    bits = _bits(space["n"])
+    packed = np.frombuffer(raw, dtype=np.uint8)
+    per_byte = 8 // bits
+    mask = (1 << bits) - 1
+    a = np.stack([(packed >> (bits * i)) & mask for i in range(per_byte)], axis=1)
+    return a.reshape(-1)[:steps]
+
+
+def _bits(n: int) -> int:
+    for bits in (1, 2, 4, 8):
+        if n <= 1 << bits:
+            return bits
+    raise ValueError(f"discrete action spaces above 256 actions aren't supported (got {n})")
+
+
+class Tape:
+    """One recorded episode: seed, env config, actions and sparse state checkpoints."""
+
+    def __init__(self, game: str, env_class: str, env_config: dict, seed: int, action_space: dict,
+                 actions: np.ndarray, checkpoints: Optional[Dict[int, dict]] = None,
+                 result: Optional[dict] = None, model: Optional[str] = None):
+        self.game = game
+        self.env_class = env_class
+        self.env_config = env_config
+        self.seed = seed
+        self.action_space = action_space
+        self.actions = actions
+        self.result = result or {}
+        self.model = model
+        self._checkpoints = dict(checkpoints or {})
+        self._blobs: Dict[int, bytes] = {}
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    @property
+    def checkpoint_steps(self) -> List[int]:
+        return sorted(set(self._checkpoints) | set(self._blobs))
+
+    def checkpoint(self, step: int) -> dict:
+        if step not in self._checkpoints:
+            self._checkpoints[step] = json.loads(zlib.decompress(self._blobs.pop(step)))
+        return self._checkpoints[step]
+
+    def save(self, path: str):
+        blobs = [pack_actions(self.actions, self.action_space)]
+        steps = self.checkpoint_steps
+        blobs += [zlib.compress(json.dumps(self.checkpoint(s)).encode()) for s in steps]
+        offsets = np.cumsum([0] + [len(b) for b in blobs]).tolist()
+        header = {
+            "version": VERSION, "game": self.game, "env_class": self.env_class, "env_config": self.env_config,
+            "seed": self.seed, "steps": len(self), "action_space": self.action_space, "model": self.model,
+            "result": self.result,
+            "actions": [offsets[0], len(blobs[0])],
+            "checkpoints": [[s, offsets[i + 1], len(blobs[i + 1])] for i, s in enumerate(steps)],
+        }
+        encoded = json.dumps(header).encode()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+            for blob in blobs:
+                f.write(blob)
+
+    @classmethod
+    def load(cls, path: str) -> "Tape":
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a tape")
+        (length,) = struct.unpack_from("<I", data, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(data[start:start + length])
+        if header["version"] > VERSION:
+            raise ValueError(f"{path} has tape version {header['version']}, this code reads up to {VERSION}")
+        body = data[start + length:]
+        offset, size = header["actions"]
+        tape = cls(header["game"], header["env_class"], header["env_config"], header["seed"],
+                   header["action_space"], unpack_actions(body[offset:offset + size], header["action_space"],
+                                                          header["steps"]),
+                   result=header["result"], model=header["model"])
+        tape._blobs = {step: body[offset:offset + size] for step, offset, size in header["checkpoints"]}
+        return tape
+
+
+def record(policy, env, game: str, env_config: dict, seed: int,
+           checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY, result: Optional[dict] = None,
+           model: Optional[str] = None) -> Tape:
+    """Play one episode with `policy` on `env` and return its tape.
+
+    `env` must be freshly made with `seed`, as `make_env(seed=...)` does; it is
+    reset once more, the same as the eval loops do.
+    """
+    obs, _ = env.reset()
+    actions, checkpoints = [], {}
+    total_reward = 0.0
+    done = trunc = False
+    while not (done or trunc):
+        if actions and len(actions) % checkpoint_every == 0:
+            checkpoints[len(actions)] = {"env": env_state(env), "reward": total_reward}
+        action, _ = policy.predict(obs, deterministic=True)
+        actions.append(action)
+        obs, reward, done, trunc, _ = env.step(action)
+        total_reward += reward
+    env.close()
+    return Tape(game, type(env).__name__, env_config, seed, _describe_space(env.action_space),
+                np.asarray(actions), checkpoints, result=result, model=model)
+
+
+class TapeSelector:
+    """Picks which evaluated episodes get a tape: "best", "worst", "all" or episode numbers."""
+
+    def __init__(self, spec: Iterable[str], metric: str = "score"):
+        spec = list(spec or [])
+        self.metric = metric
+        self.all = "all" in spec
+        self.wanted = {int(s) for s in spec if s.isdigit()}
+        self.best = "best" in spec
+        self.worst = "worst" in spec
+        unknown = [s for s in spec if not s.isdigit() and s not in ("best", "worst", "all")]
+        if unknown:
+            raise ValueError(f"unknown tape selection {unknown}, expected best, worst, all or episode numbers")
+        self._best: Optional[Tuple[int, dict]] = None
+        self._worst: Optional[Tuple[int, dict]] = None
+        self._picked: Dict[int, dict] = {}
+
+    def __bool__(self) -> bool:
+        return self.all or self.best or self.worst or bool(self.wanted)
+
+    def add(self, episode: int, metrics: dict):
+        if self.all or episode in self.wanted:
+            self._picked[episode] = dict(metrics)
+        value = metrics[self.metric]
+        if self.best and (self._best is None or value > self._best[1][self.metric]):
+            self._best = (episode, dict(metrics))
+        if self.worst and (self._worst is None or value < self._worst[1][self.metric]):
+            self._worst = (episode, dict(metrics))
+
+    def selected(self) -> Dict[int, dict]:
+        picked = dict(self._picked)
+        for choice in (self._best, self._worst):
+            if choice is not None:
+                picked[choice[0]] = choice[1]
+        return dict(sorted(picked.items()))
+
+
+def write_tapes(selector: TapeSelector, load: Callable[[], object], make_env: Callable[[int], object],
+                seeds: List[int], game: str, env_config: dict, tape_dir: str, model_path: str,
+                checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY) -> List[str]:
+    """Re-play the selected episodes with the policy and save their tapes."""
+    selected = selector.selected()
+    if not selected:
+        return []
+    policy = load()
+    name = os.path.basename(model_path)
+    suffix = "_".join(str(v) for v in env_config.values() if isinstance(v, str))
+    paths = []
+    for episode, metrics in selected.items():
+        seed = seeds[episode - 1]
+        tape = record(policy, make_env(seed), game, env_config, seed, checkpoint_every, result=metrics, model=name)
+        if "steps" in metrics and metrics["steps"] != len(tape):
+            print(f"Warning: episode {episode} took {len(tape)} steps when recorded, {metrics['steps']} in eval")
+        path = os.path.join(tape_dir, f"{name}_{suffix + '_' if suffix else ''}ep{episode}_seed{seed}.tape")
+        tape.save(path)
+        paths.append(path)
+    return paths
+
+
+class Replay:
+    """Steps an env through a tape and can jump to any step."""
+
+    def __init__(self, tape: Tape, make_env: Callable[[int], object]):
+        self.tape = tape
+        self.env = make_env(tape.seed)
+        if type(self.env).__name__ != tape.env_class:
+            raise ValueError(f"tape was recorded on {tape.env_class}, not {type(self.env).__name__}")
+        # Reseeding the env puts the game back to how the constructor left it, but not everything an env
+        # keeps across resets (aim trainer's reward breakdown), so later rewinds restore this state instead
+        self.env.reset(seed=self.tape.seed)
+        self.env.reset()
+        self._start = env_state(self.env)
+        self.rewind()
+
+    def rewind(self):
+        restore_state(self.env, self._start)
+        self.t = 0
+        self.total_reward = 0.0
+        self.done = self.trunc = False
+        self.info: dict = {}
+
+    @property
+    def finished(self) -> bool:
+        return self.done or self.trunc or self.t >= len(self.tape)
+
+    def step(self):
+        _, reward, self.done, self.trunc, self.info = self.env.step(self.tape.actions[self.t])
+        self.total_reward += reward
+        self.t += 1
+
+    def seek(self, step: int):
+        step = max(0, min(step, len(self.tape)))
+        usable = [s for s in self.tape.checkpoint_steps if s <= step]
+        start = usable[-1] if usable else 0
+        if step < self.t or start > self.t:
+            if start:
+                saved = self.tape.checkpoint(start)
+                restore_state(self.env, saved["env"])
+                self.t = start
+                self.total_reward = saved["reward"]
+                self.done = self.trunc = False
+            else:
+                self.rewind()
+        render_mode, self.env.render_mode = self.env.render_mode, None
+        while self.t < step and not self.finished:
+            self.step()
+        self.env.render_mode = render_mode
+
+
+def play(tape: Tape, make_env: Callable[[int], object], fps: float = 30, speed: int = 1, start_step: int = 0,
+         jump: int = 100):
+    """Watch a tape in the env's window.
+
+    `make_env(seed)` builds the env with render_mode="human"; `speed` is steps per frame.
+    """
+    import pygame
+
+    replay = Replay(tape, make_env)
+    env = replay.env
+    replay.seek(start_step)
+    print(f"Tape: {tape.game} {tape.env_class} {tape.env_config}, seed {tape.seed}, {len(tape)} steps"
+          + (f", model {tape.model}" if tape.model else ""))
+    if tape.result:
+        print("Recorded: " + ", ".join(f"{k}={v}" for k, v in tape.result.items() if k != "episode"))
+    print("\nControls:")
+    print("SPACE - Pause/Resume")
+    print("LEFT/RIGHT - Jump back/forward 100 steps")
+    print("HOME/R - Back to the start, END - Jump to the end")
+    print("+/- - Faster/slower frame rate, ]/[ - More/fewer steps per frame")
+    print("Q/ESC - Quit")
+
+    pygame.init()
+    clock = pygame.time.Clock()
+    paused = False
+    reported = False
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                env.close()
+                return
+            if event.type != pygame.KEYDOWN:
+                continue
+            if event.key in (pygame.K_q, pygame.K_ESCAPE):
+                env.close()
+                return
+            if event.key == pygame.K_SPACE:
+                paused = not paused
+            elif event.key == pygame.K_RIGHT:
+                replay.seek(replay.t + jump)
+            elif event.key == pygame.K_LEFT:
+                replay.seek(replay.t - jump)
+            elif event.key in (pygame.K_HOME, pygame.K_r):
+                replay.seek(0)
+            elif event.key == pygame.K_END:
+                replay.seek(len(tape))
+            elif event.key in (pygame.K_PLUS, pygame.K_EQUALS):
+                fps = min(240, fps + 5)
+            elif event.key == pygame.K_MINUS:
+                fps = max(1, fps - 5)
+            elif event.key == pygame.K_RIGHTBRACKET:
+                speed *= 2
+            elif event.key == pygame.K_LEFTBRACKET:
+                speed = max(1, speed // 2)
+            print(f"Step {replay.t}/{len(tape)}, {fps:g} FPS, {speed} steps per frame"
+                  + (" (paused)" if paused else ""))
+
+        if not paused and not replay.finished:
+            replay.seek(replay.t + speed)
+        if replay.finished and not reported:
+            print(f"End of tape at step {replay.t}: score {getattr(env, 'score', '?')}, "
+                  f"reward {replay.total_reward:.2f}, {'crashed' if replay.done else 'time limit'}")
+        reported = replay.finished
+
+        env.render()
+        pygame.display.set_caption(f"{tape.env_class} replay - step {replay.t}/{len(tape)}")
+        clock.tick(fps)
+
+
+def verify(tape: Tape) -> List[str]:
+    """Re-simulate the tape headless; returns what didn't match the recording."""
+    from rl_common.tournament import load_game
+
+    module = load_game(tape.game)
+    replay = Replay(tape, lambda seed: module.make_env(seed=seed, **tape.env_config))
+    problems = []
+    for step in tape.checkpoint_steps:
+        replay.seek(step)
+        if env_state(replay.env) != tape.checkpoint(step)["env"]:
+            problems.append(f"state differs from the checkpoint at step {step}")
+    replay.seek(len(tape))
+    if not (replay.done or replay.trunc):
+        problems.append("episode didn't end with the last action")
+    for key in ("score", "hits", "misses"):
+        if key in tape.result and getattr(replay.env, key, None) != tape.result[key]:
+            problems.append(f"{key} is {getattr(replay.env, key, None)}, recorded {tape.result[key]}")
+    # Lockstep eval sums rewards in float32, so allow for rounding
+    if "reward" in tape.result and not np.isclose(replay.total_reward, tape.result["reward"], rtol=1e-6):
+        problems.append(f"reward is {replay.total_reward:.6f}, recorded {tape.result['reward']:.6f}")
+    replay.env.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and check episode tapes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("info", help="Print what a tape holds")
+    p.add_argument("tapes", nargs="+")
+    p = sub.add_parser("verify", help="Re-simulate tapes headless and compare with what was recorded")
+    p.add_argument("tapes", nargs="+")
+    args = parser.parse_args()
+
+    failed = False
+    for path in args.tapes:
+        tape = Tape.load(path)
+        if args.command == "info":
+            print(f"{path} ({os.path.getsize(path)} bytes)")
+            print(f"  {tape.game} {tape.env_class} {tape.env_config}, seed {tape.seed}, model {tape.model}")
+            print(f"  {len(tape)} steps, checkpoints at {tape.checkpoint_steps}")
+            print("  " + ", ".join(f"{k}={v}" for k, v in tape.result.items()))
+            continue
+        problems = verify(tape)
+        print(f"{'OK' if not problems else 'MISMATCH':8s} {path}" + "".join(f"\n  {p}" for p in problems))
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
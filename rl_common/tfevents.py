@@ -0,0 +1,376 @@
+"""Streaming reader for the tensorboard event files written during training.
+
+Tensorboard's EventAccumulator decodes and keeps every event of every run in
+memory. For plotting learning curves we only need scalar values, so this module
+walks the TFRecord framing directly, decodes just enough of the Event protobuf
+to pull out (step, tag, value) and folds each value into a fixed-size
+min/max/mean downsampler. The downsampled curves are cached on disk next to
+nothing but a (size, mtime) stamp of the source file, so re-plotting is a
+handful of small .npz loads.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from rl_common import REPO_ROOT
+
+# Where each game keeps its tensorboard logs, relative to the repo root
+GAME_LOG_ROOTS = {
+    "FruitCatchers": "FruitCatchers/logs",
+    "snake": "snake/tf_logs",
+    "aim_trainer": "aim_trainer/tf_logs",
+}
+
+DEFAULT_CACHE_DIR = os.path.join(REPO_ROOT, ".curve_cache")
+DEFAULT_MAX_POINTS = 512
+_CACHE_VERSION = 1
+
+# TensorProto dtypes we know how to turn into a float
+_DT_FLOAT = 1
+_DT_DOUBLE = 2
+
+
+# Protobuf wire decoding
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _skip_field(buf: bytes, pos: int, wire_type: int) -> int:
+    if wire_type == 0:
+        _, pos = _read_varint(buf, pos)
+        return pos
+    if wire_type == 1:
+        return pos + 8
+    if wire_type == 2:
+        length, pos = _read_varint(buf, pos)
+        return pos + length
+    if wire_type == 5:
+        return pos + 4
+    raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+
+
+def _parse_tensor(buf: bytes, start: int, end: int) -> Optional[float]:
+    dtype = None
+    value = None
+    content = None
+    pos = start
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if field == 1 and wire_type == 0:
+            dtype, pos = _read_varint(buf, pos)
+        elif field == 4 and wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            content = buf[pos:pos + length]
+            pos += length
+        elif field == 5 and wire_type == 2:  # packed float_val
+            length, pos = _read_varint(buf, pos)
+            if length >= 4:
+                value = struct.unpack_from("<f", buf, pos)[0]
+            pos += length
+        elif field == 5 and wire_type == 5:
+            value = struct.unpack_from("<f", buf, pos)[0]
+            pos += 4
+        elif field == 6 and wire_type == 2:  # packed double_val
+            length, pos = _read_varint(buf, pos)
+            if length >= 8:
+                value = struct.unpack_from("<d", buf, pos)[0]
+            pos += length
+        elif field == 6 and wire_type == 1:
+            value = struct.unpack_from("<d", buf, pos)[0]
+            pos += 8
+        else:
+            pos = _skip_field(buf, pos, wire_type)
+
+    if value is None and content:
+        if dtype == _DT_FLOAT and len(content) >= 4:
+            value = struct.unpack_from("<f", content)[0]
+        elif dtype == _DT_DOUBLE and len(content) >= 8:
+            value = struct.unpack_from("<d", content)[0]
+    return value
+
+
+def _parse_value(buf: bytes, start: int, end: int) -> Tuple[Optional[str], Optional[float]]:
+    tag = None
+    value = None
+    pos = start
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if field == 1 and wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            tag = buf[pos:pos + length].decode("utf-8", "replace")
+            pos += length
+        elif field == 2 and wire_type == 5:  # simple_value
+            value = struct.unpack_from("<f", buf, pos)[0]
+            pos += 4
+        elif field == 8 and wire_type == 2:  # tensor
+            length, pos = _read_varint(buf, pos)
+            value = _parse_tensor(buf, pos, pos + length)
+            pos += length
+        else:
+            pos = _skip_field(buf, pos, wire_type)
+    return tag, value
+
+
+def _parse_event(buf: bytes) -> Iterator[Tuple[int, str, float]]:
+    step = 0
+    summary = None
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if field == 2 and wire_type == 0:
+            step, pos = _read_varint(buf, pos)
+        elif field == 5 and wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            summary = (pos, pos + length)
+            pos += length
+        else:
+            pos = _skip_field(buf, pos, wire_type)
+
+    if summary is None:
+        return
+
+    pos, end = summary
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if field == 1 and wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            tag, value = _parse_value(buf, pos, pos + length)
+            pos += length
+            if tag is not None and value is not None:
+                yield step, tag, value
+        else:
+            pos = _skip_field(buf, pos, wire_type)
+
+
+def iter_scalars(path: str) -> Iterator[Tuple[int, str, float]]:
+    """Yield (step, tag, value) for every scalar in an event file, one record at a time.
+
+    CRCs are not checked; a truncated trailing record (a run that is still
+    writing) simply ends the stream.
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(12)
+            if len(header) < 12:
+                return
+            length = struct.unpack("<Q", header[:8])[0]
+            data = f.read(length)
+            if len(f.read(4)) < 4 or len(data) < length:
+                return
+            yield from _parse_event(data)
+
+
+# Downsampling
+@dataclass
+class Curve:
+    step: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+    mean: np.ndarray
+    count: np.ndarray
+
+    @property
+    def last(self) -> float:
+        return float(self.mean[-1]) if len(self.mean) else float("nan")
+
+
+class CurveDownsampler:
+    """Constant-memory min/max/mean downsampler for a stream of (step, value).
+
+    Values are put into buckets of `width` steps. When there are more than
+    `max_points` buckets the width doubles and neighbouring buckets merge, so
+    memory stays bounded no matter how long the run was.
+    """
+
+    def __init__(self, max_points: int = DEFAULT_MAX_POINTS):
+        self.max_points = max_points
+        self.width = 1
+        self.origin: Optional[int] = None
+        # bucket index -> [step_sum, min, max, value_sum, count]
+        self._buckets: Dict[int, List[float]] = {}
+
+    def add(self, step: int, value: float):
+        if self.origin is None:
+            self.origin = step
+        idx = (step - self.origin) // self.width
+        bucket = self._buckets.get(idx)
+        if bucket is None:
+            self._buckets[idx] = [step, value, value, value, 1]
+            if len(self._buckets) > self.max_points:
+                self._coarsen()
+        else:
+            bucket[0] += step
+            if value < bucket[1]:
+                bucket[1] = value
+            if value > bucket[2]:
+                bucket[2] = value
+            bucket[3] += value
+            bucket[4] += 1
+
+    def _coarsen(self):
+        while len(self._buckets) > self.max_points:
+            self.width *= 2
+            merged: Dict[int, List[float]] = {}
+            for idx, b in self._buckets.items():
+                m = merged.get(idx // 2)
+                if m is None:
+                    merged[idx // 2] = list(b)
+                else:
+                    m[0] += b[0]
+                    m[1] = min(m[1], b[1])
+                    m[2] = max(m[2], b[2])
+                    m[3] += b[3]
+                    m[4] += b[4]
+            self._buckets = merged
+
+    def curve(self) -> Curve:
+        rows = [self._buckets[k] for k in sorted(self._buckets)]
+        if not rows:
+            empty = np.zeros(0)
+            return Curve(empty, empty, empty, empty, np.zeros(0, dtype=np.int64))
+        arr = np.array(rows, dtype=np.float64)
+        count = arr[:, 4]
+        return Curve(
+            step=arr[:, 0] / count,
+            min=arr[:, 1],
+            max=arr[:, 2],
+            mean=arr[:, 3] / count,
+            count=count.astype(np.int64),
+        )
+
+
+def downsample_file(path: str, max_points: int = DEFAULT_MAX_POINTS) -> Dict[str, Curve]:
+    samplers: Dict[str, CurveDownsampler] = {}
+    for step, tag, value in iter_scalars(path):
+        sampler = samplers.get(tag)
+        if sampler is None:
+            sampler = samplers[tag] = CurveDownsampler(max_points)
+        sampler.add(step, value)
+    return {tag: s.curve() for tag, s in samplers.items()}
+
+
+# On-disk cache
+class CurveCache:
+    """Caches downsampled curves per event file, keyed by the file's size and mtime."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_points: int = DEFAULT_MAX_POINTS):
+        self.cache_dir = cache_dir
+        self.max_points = max_points
+        self._memory: Dict[str, Tuple[Tuple[int, int], Dict[str, Curve]]] = {}
+
+    def _cache_path(self, path: str) -> str:
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{digest}_{self.max_points}.npz")
+
+    def load(self, path: str) -> Dict[str, Curve]:
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+
+        hit = self._memory.get(path)
+        if hit is not None and hit[0] == stamp:
+            return hit[1]
+
+        cache_path = self._cache_path(path)
+        curves = self._read(cache_path, stamp)
+        if curves is None:
+            curves = downsample_file(path, self.max_points)
+            self._write(cache_path, stamp, curves)
+
+        self._memory[path] = (stamp, curves)
+        return curves
+
+    def _read(self, cache_path: str, stamp: Tuple[int, int]) -> Optional[Dict[str, Curve]]:
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with np.load(cache_path) as data:
+                meta = json.loads(str(data["__meta__"]))
+                if meta["version"] != _CACHE_VERSION or tuple(meta["stamp"]) != stamp:
+                    return None
+                return {
+                    tag: Curve(*(data[f"{i}/{field}"] for field in ("step", "min", "max", "mean", "count")))
+                    for i, tag in enumerate(meta["tags"])
+                }
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write(self, cache_path: str, stamp: Tuple[int, int], curves: Dict[str, Curve]):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tags = sorted(curves)
+        arrays = {"__meta__": np.array(json.dumps({"version": _CACHE_VERSION, "stamp": list(stamp), "tags": tags}))}
+        for i, tag in enumerate(tags):
+            c = curves[tag]
+            arrays.update({
+                f"{i}/step": c.step, f"{i}/min": c.min, f"{i}/max": c.max,
+                f"{i}/mean": c.mean, f"{i}/count": c.count,
+            })
+        tmp_path = cache_path + ".tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, cache_path)
+
+
+# Run discovery
+@dataclass
+class Run:
+    game: str
+    name: str
+    files: List[str]
+
+
+def discover_runs(games: Optional[List[str]] = None, root: str = REPO_ROOT) -> List[Run]:
+    """Find every directory holding event files under each game's log folder.
+
+    A directory is one run; if it holds several event files (a resumed run)
+    they are read in filename order, which is creation-time order.
+    """
+    runs = []
+    for game, rel in GAME_LOG_ROOTS.items():
+        if games and game not in games:
+            continue
+        log_root = os.path.join(root, rel)
+        if not os.path.isdir(log_root):
+            continue
+        for dirpath, _, filenames in sorted(os.walk(log_root)):
+            files = sorted(f for f in filenames if f.startswith("events.out.tfevents"))
+            if not files:
+                continue
+            name = os.path.relpath(dirpath, log_root).replace(os.sep, "/")
+            runs.append(Run(game, name, [os.path.join(dirpath, f) for f in files]))
+    return runs
+
+
+def load_run(run: Run, cache: CurveCache) -> Dict[str, Curve]:
+    """Downsampled curves for a run, concatenating the curves of each of its files."""
+    if len(run.files) == 1:
+        return cache.load(run.files[0])
+
+    parts: Dict[str, List[Curve]] = {}
+    for path in run.files:
+        for tag, curve in cache.load(path).items():
+            parts.setdefault(tag, []).append(curve)
+
+    return {
+        tag: Curve(*(np.concatenate([getattr(c, field) for c in curves])
+                     for field in ("step", "min", "max", "mean", "count")))
+        for tag, curves in parts.items()
+    }
@@ -0,0 +1,135 @@
+"""TorchScript and torch.compile versions of a policy's deterministic action path.
+
+`model.predict` converts and checks the observation, builds an action
+distribution and converts back on every call. The modules here only keep
+what a deterministic action needs (actor MLP, then argmax for discrete
+actions or a clamp to the action bounds for boxes) and run it under
+`torch.inference_mode()`.
+
+Usage:
+    python -m rl_common.torch_policy export snake/models/*.zip
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+from typing import Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+
+class DeterministicActor(nn.Module):
+    def __init__(self, net: nn.Module, discrete: bool, low: Optional[torch.Tensor] = None,
+                 high: Optional[torch.Tensor] = None):
+        super().__init__()
+        self.net = net
+        self.discrete = discrete
+        if not discrete:
+            self.register_buffer("low", low)
+            self.register_buffer("high", high)
+
+    def forward(self, obs: torch.Tensor) -> torch.Tensor:
+        out = self.net(obs)
+        if self.discrete:
+            return out.argmax(dim=1)
+        return torch.max(torch.min(out, self.high), self.low)
+
+
+def actor_from_sb3(model) -> DeterministicActor:
+    from gymnasium import spaces
+
+    policy = model.policy
+    if getattr(policy, "squash_output", False):
+        raise ValueError("policies with squashed (tanh) outputs are not supported")
+    if type(policy.features_extractor).__name__ != "FlattenExtractor":
+        raise ValueError(f"only MLP policies can be exported, this one has a "
+                         f"{type(policy.features_extractor).__name__} (use the sb3 backend)")
+    net = nn.Sequential(*copy.deepcopy(list(policy.mlp_extractor.policy_net)), copy.deepcopy(policy.action_net))
+    net = net.cpu().eval()
+    if isinstance(model.action_space, spaces.Discrete):
+        actor = DeterministicActor(net, discrete=True)
+    elif isinstance(model.action_space, spaces.Box):
+        actor = DeterministicActor(net, discrete=False,
+                                   low=torch.as_tensor(model.action_space.low, dtype=torch.float32),
+                                   high=torch.as_tensor(model.action_space.high, dtype=torch.float32))
+    else:
+        raise ValueError(f"unsupported action space {model.action_space}")
+    actor.obs_shape = tuple(model.observation_space.shape)
+    return actor.eval()
+
+
+class TorchPolicy:
+    """SB3-style `predict(obs)` around a DeterministicActor, TorchScript or compiled module."""
+
+    def __init__(self, module, obs_shape):
+        self.module = module
+        self.obs_shape = tuple(obs_shape)
+
+    def predict(self, obs, state=None, episode_start=None, deterministic: bool = True):
+        obs = np.asarray(obs, dtype=np.float32)
+        single = obs.shape == self.obs_shape
+        batch = torch.from_numpy(obs.reshape(1 if single else obs.shape[0], -1))
+        with torch.inference_mode():
+            actions = self.module(batch).numpy()
+        return (actions[0] if single else actions), state
+
+
+def export(model_path: str, out_path: Optional[str] = None) -> str:
+    """Trace a model zip's actor into a TorchScript `.pt` next to it."""
+    from rl_common.eval_cache import file_hash
+    from rl_common.policies import load_sb3
+
+    zip_path = model_path if model_path.endswith(".zip") else model_path + ".zip"
+    out_path = out_path or zip_path[:-len(".zip")] + ".pt"
+    actor = actor_from_sb3(load_sb3(zip_path))
+    save_traced(actor, actor.obs_shape, out_path, file_hash(zip_path))
+    return out_path
+
+
+def save_traced(module: nn.Module, obs_shape, out_path: str, source_sha256: str):
+    """Trace, freeze and save a module that maps a batch of observations to actions.
+
+    `source_sha256` is the hash of the model zip it was made from, which
+    `rl_common.policies` checks to catch exports older than their model.
+    """
+    obs_shape = tuple(obs_shape)
+    with torch.inference_mode():
+        # check_inputs makes sure the trace doesn't bake in the batch size
+        traced = torch.jit.trace(module, torch.zeros((1,) + obs_shape),
+                                 check_inputs=[(torch.rand((7,) + obs_shape),)])
+    traced = torch.jit.freeze(traced.eval())
+    torch.jit.save(traced, out_path, _extra_files={"obs_shape": ",".join(map(str, obs_shape)),
+                                                   "source_sha256": source_sha256})
+
+
+def load_torchscript(model_path: str) -> TorchPolicy:
+    path = model_path if model_path.endswith(".pt") else model_path + ".pt"
+    extra = {"obs_shape": ""}
+    module = torch.jit.load(path, map_location="cpu", _extra_files=extra)
+    obs_shape = tuple(int(d) for d in extra["obs_shape"].decode().split(","))
+    return TorchPolicy(module, obs_shape)
+
+
+def load_compiled(model_path: str) -> TorchPolicy:
+    """torch.compile the actor of a model zip; the first calls pay for compilation."""
+    from rl_common.policies import load_sb3
+
+    actor = actor_from_sb3(load_sb3(model_path))
+    return TorchPolicy(torch.compile(actor, dynamic=True), actor.obs_shape)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export SB3 policies to TorchScript")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="Write a TorchScript .pt next to each model zip")
+    p.add_argument("models", nargs="+", help="Model zips (with or without .zip)")
+    args = parser.parse_args()
+
+    for model_path in args.models:
+        print(f"Exported {export(model_path)}")
+
+
+if __name__ == "__main__":
+    main()
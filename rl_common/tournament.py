@@ -0,0 +1,351 @@
+"""Compare several models on the same episode seeds and stop once the ranking is clear.
+
+Every model plays the same seed stream (common random numbers), so the
+difference between two models on one episode has the luck of the level
+mostly cancelled out and its variance is far smaller than that of either
+model's score on its own. Episodes are added in rounds; after each round
+every still-open pair gets a confidence interval on its mean paired
+difference, and a pair is settled once the interval excludes zero (or fits
+inside +-`tie_margin`). Models whose pairs are all settled stop playing, and
+the tournament ends when nothing is left open or `max_episodes` is reached.
+
+The intervals are Bonferroni-corrected over pairs and over every look at the
+data, so the chance of any wrong call stays below 1 - confidence despite
+checking after each round.
+
+Each model plays with the env options it was trained with (action repeat,
+observation mode, ...) from its registry config, and episode results are
+keyed the same way as in the eval scripts, so the two share their cache.
+FruitCatchers is played with `fast_forward=True`, which times power-ups in
+frames instead of on the wall clock, so a seed fixes the whole episode.
+
+Usage:
+    python -m rl_common.tournament --game snake ppo_snake_survival ppo_snake_survival_lower_learning_rate
+    python -m rl_common.tournament --game FruitCatchers ppo_fruit_10 a2c_fruit --metric reward
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import math
+import os
+import sys
+import time
+from dataclasses import dataclass
+from functools import partial
+from itertools import combinations
+from statistics import NormalDist
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rl_common import REPO_ROOT
+from rl_common.batched_eval import ScalarEnvBatch, run_lockstep, sb3_predictor
+from rl_common.eval_cache import EvalCache, code_version, episode_seeds
+from rl_common.policies import BACKENDS, load_policy, policy_hash
+from rl_common.registry import RunRegistry, model_file, read_model_config
+from rl_common.streaming_stats import RunningStats
+
+
+@dataclass
+class GameSpec:
+    src_dir: str
+    module: str
+    env_file: str
+    env_class: str
+    models_dir: str
+    reward_modes: Tuple[Optional[str], ...]
+    lockstep: bool = True
+    # Env options the eval script keys its cache on besides reward_mode and max_steps, with their defaults
+    env_options: Tuple[Tuple[str, object], ...] = ()
+    # Env options the tournament always sets
+    tournament_kwargs: Tuple[Tuple[str, object], ...] = ()
+
+
+GAMES = {
+    "snake": GameSpec("snake/src", "snake_eval", "snake_env.py", "SnakeEnv", "snake/models",
+                      ("survival", "length"),
+                      env_options=(("action_repeat", 1), ("reachable_space", False), ("obs_mode", "features"))),
+    "aim_trainer": GameSpec("aim_trainer/src", "eval_aim_trainer", "aim_trainer_env.py", "AimTrainerEnv",
+                            "aim_trainer/models", ("accuracy", "survival"),
+                            env_options=(("action_repeat", 1), ("obs_mode", "features"), ("pixel_size", [64, 36]))),
+    # The fruit game seeds the global `random` module, so its episodes can't be interleaved. Its power-ups run
+    # on the wall clock unless fast-forwarded, and only then does a seed fix the episode
+    "FruitCatchers": GameSpec("FruitCatchers", "eval_agent", "fruit_env_full.py", "FruitCatchFullEnv",
+                              "FruitCatchers/models", (None,), lockstep=False,
+                              env_options=(("action_repeat", 1),), tournament_kwargs=(("fast_forward", True),)),
+}
+
+
+def load_game(game: str):
+    spec = GAMES[game]
+    src_dir = os.path.join(REPO_ROOT, spec.src_dir)
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    # FruitCatchers opens a window as soon as its game module is imported
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    return importlib.import_module(spec.module)
+
+
+def game_of(zip_path: str) -> Optional[str]:
+    """Game whose models folder the file is in, or None."""
+    for game, spec in GAMES.items():
+        if os.path.abspath(zip_path).startswith(os.path.join(REPO_ROOT, spec.models_dir) + os.sep):
+            return game
+    return None
+
+
+def resolve_models(registry: RunRegistry, game: str, queries: List[str]) -> List[Tuple[str, str, str]]:
+    """(label, zip path, algo) for each model given as a path, a file name or a registry query."""
+    models_dir = os.path.join(REPO_ROOT, GAMES[game].models_dir)
+    resolved = []
+    for query in queries:
+        path = query if query.endswith(".zip") else query + ".zip"
+        if not os.path.exists(path):
+            path = os.path.join(models_dir, os.path.basename(path))
+        if os.path.exists(path):
+            run = registry.model_run(os.path.abspath(path))
+            algo = run["algo"] if run is not None else read_model_config(path).get("algo", "PPO")
+            resolved.append((os.path.basename(path)[:-len(".zip")], os.path.abspath(path), algo))
+        else:
+            run = registry.resolve_run(f"game={game} {query}")
+            resolved.append((run["name"], model_file(run), run["algo"]))
+    return resolved
+
+
+def model_env_kwargs(registry: RunRegistry, game: str, zip_path: str, env_kwargs: dict) -> dict:
+    """`env_kwargs` plus the env options the model was trained with (the defaults if it wasn't recorded)."""
+    run = registry.model_run(zip_path)
+    config = json.loads(run["config"] or "{}") if run is not None else {}
+    kwargs = dict(env_kwargs)
+    for key, default in GAMES[game].env_options:
+        kwargs[key] = config.get(key, default)
+    kwargs.update(GAMES[game].tournament_kwargs)
+    return kwargs
+
+
+def load_sb3(zip_path: str, algo: str):
+    from stable_baselines3 import A2C, PPO
+    return (A2C if algo == "A2C" else PPO).load(zip_path)
+
+
+def episode_metrics(game: str, policy, seeds: List[int], env_kwargs: dict, metric: str, batch_size: int) -> np.ndarray:
+    """`metric` of every episode, one per seed, in seed order."""
+    module = load_game(game)
+    if GAMES[game].lockstep and batch_size > 1:
+        envs = ScalarEnvBatch(partial(module.make_env, **env_kwargs), batch_size)
+        results = run_lockstep(envs, sb3_predictor(policy), seeds, module.EpisodeTracker)
+    else:
+        results = ((ep, module.run_episode(policy, seed=seed, **env_kwargs)) for ep, seed in enumerate(seeds, 1))
+    return np.array([metrics[metric] for _, metrics in results], dtype=np.float64)
+
+
+@dataclass
+class PairResult:
+    a: int
+    b: int
+    n: int = 0
+    mean: float = 0.0
+    half_width: float = math.inf
+    var_ratio: float = 1.0
+    verdict: str = "?"
+
+    @property
+    def settled(self) -> bool:
+        return self.verdict != "?"
+
+
+def compare(x: np.ndarray, y: np.ndarray, z: float, tie_margin: float) -> Tuple[float, float, float, str]:
+    """Mean paired difference, CI half-width, unpaired/paired variance ratio and verdict."""
+    d = x - y
+    n = len(d)
+    mean = float(d.mean())
+    var_d = float(d.var(ddof=1))
+    half_width = z * math.sqrt(var_d / n)
+    var_ratio = float(x.var(ddof=1) + y.var(ddof=1)) / var_d if var_d > 0 else math.inf
+    if mean - half_width > 0:
+        verdict = ">"
+    elif mean + half_width < 0:
+        verdict = "<"
+    elif -tie_margin <= mean - half_width and mean + half_width <= tie_margin:
+        verdict = "="
+    else:
+        verdict = "?"
+    return mean, half_width, var_ratio, verdict
+
+
+class Tournament:
+    def __init__(self, game: str, models: List[Tuple[str, str, str]], env_kwargs: List[dict], metric: str,
+                 seeds: List[int], batch_size: int = 1, cache: Optional[EvalCache] = None,
+                 backend: str = "sb3"):
+        self.spec = GAMES[game]
+        self.module = load_game(game)
+        self.models = models
+        # One per model
+        self.env_kwargs = env_kwargs
+        self.metric = metric
+        self.seeds = seeds
+        self.batch_size = batch_size if self.spec.lockstep else 1
+        self.cache = cache
+        self.backend = backend
+        self.values: List[List[float]] = [[] for _ in models]
+        self.rows: List[Dict[str, RunningStats]] = [{} for _ in models]
+        self._loaded: Dict[int, object] = {}
+
+        src_dir = os.path.dirname(os.path.abspath(self.module.__file__))
+        self.version = code_version(os.path.join(src_dir, self.spec.env_file), os.path.abspath(self.module.__file__))
+
+    def _model(self, i: int):
+        _, path, algo = self.models[i]
+        if self.backend == "mmap":
+            # The shared-policy LRU decides what stays mapped, however many models play
+            return load_policy(path, self.backend)
+        if i not in self._loaded:
+            self._loaded[i] = load_sb3(path, algo) if self.backend == "sb3" else load_policy(path, self.backend)
+        return self._loaded[i]
+
+    def _compute(self, i: int, seeds: List[int]):
+        if self.batch_size > 1:
+            envs = ScalarEnvBatch(partial(self.module.make_env, **self.env_kwargs[i]), self.batch_size)
+            return run_lockstep(envs, sb3_predictor(self._model(i)), seeds, self.module.EpisodeTracker)
+        return ((ep, self.module.run_episode(self._model(i), seed=seed, **self.env_kwargs[i]))
+                for ep, seed in enumerate(seeds, start=1))
+
+    def play(self, i: int, upto: int):
+        """Extend model i's results to the first `upto` seeds."""
+        start = len(self.values[i])
+        seeds = self.seeds[start:upto]
+        if not seeds:
+            return
+        if self.cache is not None:
+            model_hash = policy_hash(self.models[i][1], self.backend)
+            keys = [EvalCache.key(model_hash, self.spec.env_class, self.env_kwargs[i], seed, self.version)
+                    for seed in seeds]
+            results = self.cache.run(keys, lambda indices: self._compute(i, [seeds[j] for j in indices]))
+        else:
+            results = self._compute(i, seeds)
+
+        for _, metrics in results:
+            self.values[i].append(float(metrics[self.metric]))
+            for key, value in metrics.items():
+                if isinstance(value, (int, float)):
+                    self.rows[i].setdefault(key, RunningStats()).add(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank models on common seeds with sequential stopping")
+    parser.add_argument("models", nargs="+",
+                        help="Model paths, model file names or registry queries (quote multi-word queries)")
+    parser.add_argument("--game", type=str, required=True, choices=sorted(GAMES))
+    parser.add_argument("--reward_mode", type=str, default=None,
+                        help="Env reward mode (snake/aim_trainer only; defaults to the game's first mode)")
+    parser.add_argument("--metric", type=str, default="score",
+                        help="Per-episode metric to rank by, higher is better")
+    parser.add_argument("--max_steps", type=int, default=5000, help="Maximum steps per episode")
+    parser.add_argument("--seed", type=int, default=None, help="Base seed of the shared seed stream")
+    parser.add_argument("--min_episodes", type=int, default=20, help="Episodes per model before the first check")
+    parser.add_argument("--round", type=int, default=10, help="Episodes added per model between checks")
+    parser.add_argument("--max_episodes", type=int, default=500, help="Fixed per-model budget to stop at")
+    parser.add_argument("--confidence", type=float, default=0.95,
+                        help="Probability that every reported ordering is right")
+    parser.add_argument("--tie_margin", type=float, default=0.0,
+                        help="Call a pair tied once its interval lies within +-this much")
+    parser.add_argument("--batch_size", type=int, default=1,
+                        help="Run this many episodes in lockstep with one batched model call per step")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Recompute every episode instead of reusing cached results")
+    parser.add_argument("--backend", type=str, default="sb3", choices=BACKENDS,
+                        help="Inference backend to run the policies with")
+    args = parser.parse_args()
+
+    spec = GAMES[args.game]
+    if args.reward_mode is None:
+        args.reward_mode = spec.reward_modes[0]
+    elif args.reward_mode not in spec.reward_modes:
+        parser.error(f"--reward_mode for {args.game} must be one of {spec.reward_modes}")
+    if len(args.models) < 2:
+        parser.error("need at least two models to compare")
+    args.min_episodes = max(2, min(args.min_episodes, args.max_episodes))
+
+    registry = RunRegistry()
+    models = resolve_models(registry, args.game, args.models)
+    env_kwargs = {"max_steps": args.max_steps}
+    if args.reward_mode is not None:
+        env_kwargs["reward_mode"] = args.reward_mode
+    env_kwargs = [model_env_kwargs(registry, args.game, path, env_kwargs) for _, path, _ in models]
+
+    args.seed, seeds = episode_seeds(args.seed, args.max_episodes)
+    cache = None if args.no_cache else EvalCache()
+    tour = Tournament(args.game, models, env_kwargs, args.metric, seeds, args.batch_size, cache, args.backend)
+
+    pairs = [PairResult(a, b) for a, b in combinations(range(len(models)), 2)]
+    looks = 1 + math.ceil((args.max_episodes - args.min_episodes) / args.round)
+    alpha = (1 - args.confidence) / (len(pairs) * looks)
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+
+    print(f"Game: {args.game}  Reward Mode: {args.reward_mode}  Metric: {args.metric}")
+    print(f"Base Seed: {args.seed}")
+    for label, path, algo in models:
+        print(f"  {label} ({algo})")
+    print(f"Up to {looks} checks, z = {z:.2f} per interval")
+    print("=" * 60)
+
+    start_time = time.time()
+    n = args.min_episodes
+    while True:
+        open_models = sorted({m for p in pairs if not p.settled for m in (p.a, p.b)})
+        for i in open_models:
+            tour.play(i, n)
+
+        for p in pairs:
+            if p.settled:
+                continue
+            p.n = n
+            p.mean, p.half_width, p.var_ratio, p.verdict = compare(
+                np.asarray(tour.values[p.a][:n]), np.asarray(tour.values[p.b][:n]), z, args.tie_margin)
+
+        settled = sum(p.settled for p in pairs)
+        print(f"{n:5d} episodes: {settled}/{len(pairs)} pairs settled, "
+              f"{len(open_models)} models played this round")
+        if settled == len(pairs) or n >= args.max_episodes:
+            break
+        n = min(n + args.round, args.max_episodes)
+
+    duration = time.time() - start_time
+    if cache:
+        cache.close()
+
+    print(f"\nLeaderboard ({args.metric}):")
+    print("-" * 60)
+    order = sorted(range(len(models)), key=lambda i: -np.mean(tour.values[i]))
+    for rank, i in enumerate(order, start=1):
+        v = np.asarray(tour.values[i])
+        print(f"{rank}. {models[i][0]:45s} {v.mean():9.2f} ± {v.std(ddof=1):.2f}  ({len(v)} episodes)")
+
+    print("\nPaired differences:")
+    print("-" * 60)
+    for p in pairs:
+        a, b = (p.a, p.b) if p.mean >= 0 else (p.b, p.a)
+        verdict = {"=": "≈", "?": "?"}.get(p.verdict, ">")
+        print(f"{models[a][0]} {verdict} {models[b][0]}: {abs(p.mean):.2f} ± {p.half_width:.2f} "
+              f"after {p.n} episodes (unpaired would need {p.var_ratio:.1f}x the episodes)")
+
+    used = sum(len(v) for v in tour.values)
+    budget = args.max_episodes * len(models)
+    print(f"\nEpisodes played: {used} of a fixed budget of {budget} "
+          f"(saved {budget - used}, {(budget - used) / budget * 100:.1f}%)")
+    print(f"Time: {duration:.1f}s")
+
+    for i, (label, path, _) in enumerate(models):
+        registry.record_eval(
+            args.game,
+            path[:-len(".zip")],
+            config={**vars(args), "models": [m[0] for m in models], "episodes": len(tour.values[i])},
+            metrics={f"mean_{key}": float(stats.mean) for key, stats in tour.rows[i].items()},
+        )
+    registry.close()
+
+
+if __name__ == "__main__":
+    main()
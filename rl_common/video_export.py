@@ -0,0 +1,239 @@
+"""Render evaluation episodes to MP4 or GIF offscreen, spread over worker processes.
+
+Each episode is one job: a worker builds the game's env with
+`render_mode="rgb_array"` (pygame drawing on an offscreen surface, with
+`SDL_VIDEODRIVER=dummy` so no window opens), plays it with the model or
+replays a tape, and encodes every frame with OpenCV. Nothing waits on a
+frame clock, so a worker renders as fast as the game draws and N workers
+export about N episodes at a time.
+
+Model episodes use the same seeds as the eval scripts for the same `--seed`,
+so `ep7` here is episode 7 of `snake_eval.py --seed ...`.
+
+Usage:
+    python -m rl_common.video_export snake/models/ppo_snake_survival --episodes 50 --workers 8
+    python -m rl_common.video_export FruitCatchers/models/ppo_fruit_10 --game FruitCatchers --format gif
+    python -m rl_common.video_export --tapes snake/logs/tapes/*.tape --reel
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from rl_common.eval_cache import episode_seeds
+from rl_common.policies import BACKENDS
+
+_policies: Dict[str, object] = {}
+
+
+def _make_env(game: str, seed: int, env_kwargs: dict):
+    from rl_common.tournament import GAMES, load_game
+
+    spec = GAMES[game]
+    env_class = getattr(load_game(game), spec.env_class)
+    if spec.lockstep:
+        return env_class(render_mode="rgb_array", seed=seed, **env_kwargs)
+    # FruitCatchers draws from the global `random`, the same as its eval script seeds it
+    random.seed(seed)
+    return env_class(render_mode="rgb_array", **{k: v for k, v in env_kwargs.items() if k != "max_steps"})
+
+
+class _Writer:
+    """Collects RGB frames into an MP4 (streamed) or a GIF (written at the end)."""
+
+    def __init__(self, path: str, fps: float, scale: float):
+        self.path = path
+        self.fps = fps
+        self.scale = scale
+        self.gif = path.endswith(".gif")
+        self.frames: List[np.ndarray] = []
+        self.video = None
+        self.count = 0
+
+    def add(self, frame: np.ndarray):
+        import cv2
+
+        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        self.count += 1
+        if self.gif:
+            self.frames.append(frame)
+            return
+        if self.video is None:
+            height, width = frame.shape[:2]
+            self.video = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, (width, height))
+            if not self.video.isOpened():
+                raise RuntimeError(f"OpenCV can't write {self.path}")
+        self.video.write(frame)
+
+    def close(self):
+        import cv2
+
+        if self.video is not None:
+            self.video.release()
+        elif self.gif and self.frames:
+            animation = cv2.Animation()
+            animation.frames = self.frames
+            animation.durations = [int(round(1000 / self.fps))] * len(self.frames)
+            if not cv2.imwriteanimation(self.path, animation):
+                raise RuntimeError(f"OpenCV can't write {self.path}")
+            self.frames = []
+
+
+def render_episode(job: dict) -> dict:
+    """Play one episode (model or tape) and encode its frames; runs in a worker."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    start = time.perf_counter()
+    writer = _Writer(job["out"], job["fps"], job["scale"])
+    every = job["every"]
+
+    if "tape" in job:
+        from rl_common.tapes import Replay, Tape
+
+        tape = Tape.load(job["tape"])
+        replay = Replay(tape, lambda seed: _make_env(tape.game, seed, tape.env_config))
+        env = replay.env
+        writer.add(env.render())
+        while not replay.finished:
+            replay.step()
+            if replay.t % every == 0 or replay.finished:
+                writer.add(env.render())
+        score = getattr(env, "score", None)
+    else:
+        from rl_common.policies import load_policy
+
+        key = f"{job['model']}:{job['backend']}"
+        if key not in _policies:
+            _policies[key] = load_policy(job["model"], job["backend"])
+        policy = _policies[key]
+        env = _make_env(job["game"], job["seed"], job["env_kwargs"])
+        obs, _ = env.reset()
+        writer.add(env.render())
+        done = trunc = False
+        steps = 0
+        while not (done or trunc):
+            action, _ = policy.predict(obs, deterministic=True)
+            obs, _, done, trunc, _ = env.step(action)
+            steps += 1
+            trunc = trunc or steps >= job["max_steps"]
+            if steps % every == 0 or done or trunc:
+                writer.add(env.render())
+        score = getattr(env, "score", None)
+
+    writer.close()
+    env.close()
+    return {"out": job["out"], "frames": writer.count, "score": score, "seconds": time.perf_counter() - start}
+
+
+def concat(paths: List[str], out_path: str, fps: float):
+    """Join MP4s into one, resizing to the first one's frame size."""
+    import cv2
+
+    video = None
+    size = None
+    for path in paths:
+        capture = cv2.VideoCapture(path)
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if video is None:
+                size = (frame.shape[1], frame.shape[0])
+                video = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+            if (frame.shape[1], frame.shape[0]) != size:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            video.write(frame)
+        capture.release()
+    if video is not None:
+        video.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export evaluation episodes to video files, rendered offscreen")
+    parser.add_argument("models", nargs="*", help="Model paths or registry names to play")
+    parser.add_argument("--tapes", nargs="+", default=[],
+                        help="Episode tapes to render instead of (or as well as) models")
+    parser.add_argument("--game", type=str, default=None,
+                        help="Game the models play (worked out from the models folder if not given)")
+    parser.add_argument("--reward_mode", type=str, default=None,
+                        help="Env reward mode (defaults to the one the model was trained with)")
+    parser.add_argument("--episodes", type=int, default=5, help="Episodes per model")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed, the same derivation as the eval scripts")
+    parser.add_argument("--max_steps", type=int, default=5000, help="Maximum steps per episode")
+    parser.add_argument("--backend", type=str, default="sb3", choices=BACKENDS,
+                        help="Inference backend to run the models with")
+    parser.add_argument("--format", type=str, default="mp4", choices=["mp4", "gif"])
+    parser.add_argument("--fps", type=float, default=30, help="Frame rate of the videos")
+    parser.add_argument("--every", type=int, default=1, help="Keep every Nth step as a frame")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Resize frames by this factor (GIFs keep every frame in memory until written)")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (0 for one per core)")
+    parser.add_argument("--out", type=str, default="videos", help="Folder the videos are written to")
+    parser.add_argument("--reel", action="store_true", help="Also join all the MP4s into one reel.mp4")
+    args = parser.parse_args()
+    if not args.models and not args.tapes:
+        parser.error("give models to play and/or --tapes to render")
+    if args.reel and args.format != "mp4":
+        parser.error("--reel needs --format mp4")
+
+    from rl_common.parallel_eval import default_workers
+    from rl_common.registry import RunRegistry
+    from rl_common.tournament import GAMES, game_of, model_env_kwargs, resolve_models
+
+    os.makedirs(args.out, exist_ok=True)
+    frame_args = {"fps": args.fps, "scale": args.scale, "every": max(1, args.every)}
+    jobs = []
+    if args.models:
+        registry = RunRegistry()
+        registry.ensure_populated()
+        game = args.game or game_of(args.models[0] if args.models[0].endswith(".zip") else args.models[0] + ".zip")
+        if game is None:
+            parser.error("can't tell which game the models belong to, pass --game")
+        _, seeds = episode_seeds(args.seed, args.episodes)
+        for label, zip_path, _ in resolve_models(registry, game, args.models):
+            run = registry.model_run(os.path.abspath(zip_path))
+            env_kwargs = {"max_steps": args.max_steps}
+            if GAMES[game].reward_modes[0] is not None:
+                env_kwargs["reward_mode"] = (args.reward_mode or (run["reward_mode"] if run is not None else None)
+                                             or GAMES[game].reward_modes[0])
+            env_kwargs = model_env_kwargs(registry, game, os.path.abspath(zip_path), env_kwargs)
+            # Fast-forwarding would skip the frames the video is made of
+            env_kwargs.pop("fast_forward", None)
+            for episode, seed in enumerate(seeds, 1):
+                out = os.path.join(args.out, f"{label}_ep{episode}_seed{seed}.{args.format}")
+                jobs.append(dict(game=game, model=zip_path, backend=args.backend, seed=seed, env_kwargs=env_kwargs,
+                                 max_steps=args.max_steps, out=out, **frame_args))
+        registry.close()
+    for path in args.tapes:
+        out = os.path.join(args.out, os.path.splitext(os.path.basename(path))[0] + f".{args.format}")
+        jobs.append(dict(tape=path, out=out, **frame_args))
+
+    workers = min(default_workers(args.workers), len(jobs))
+    print(f"Rendering {len(jobs)} episodes with {workers} workers to {args.out}")
+    start = time.time()
+    results = {}
+    with mp.get_context("spawn").Pool(workers) as pool:
+        for result in pool.imap_unordered(render_episode, jobs):
+            results[result["out"]] = result
+            print(f"  {os.path.basename(result['out'])}: {result['frames']} frames, score {result['score']}, "
+                  f"{result['seconds']:.1f}s")
+    duration = time.time() - start
+
+    frames = sum(r["frames"] for r in results.values())
+    print(f"{frames} frames in {duration:.1f}s ({frames / duration:.0f} frames/s, "
+          f"{frames / args.fps / duration:.1f}x realtime at {args.fps:g} FPS)")
+    if args.reel:
+        reel = os.path.join(args.out, "reel.mp4")
+        concat([job["out"] for job in jobs], reel, args.fps)
+        print(f"Wrote {reel}")
+
+
+if __name__ == "__main__":
+    main()
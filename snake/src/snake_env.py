@@ -1,15 +1,16 @@
 from __future__ import annotations
 import random
-from typing import Optional, Tuple, List
+from collections import deque
+from typing import Dict, Optional, Tuple, List
 
 import gymnasium as gym
 import numpy as np
-import pygame
 from gymnasium import spaces
 
 
 class SnakeEnv(gym.Env):
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 30}
+    OBS_MODES = ("features", "rays")
 
     def __init__(
             self,
@@ -19,13 +20,22 @@ class SnakeEnv(gym.Env):
             max_steps: int = 5000,
             frame_size_x: int = 720,
             frame_size_y: int = 480,
+            action_repeat: int = 1,
+            reachable_space: bool = False,
+            obs_mode: str = "features",
     ):
         super().__init__()
+        if action_repeat < 1:
+            raise ValueError(f"action_repeat must be at least 1, got {action_repeat}")
+        if obs_mode not in self.OBS_MODES:
+            raise ValueError(f"obs_mode must be one of {self.OBS_MODES}, got {obs_mode!r}")
         self.render_mode = render_mode
         self._rnd = random.Random(seed)
         self._np_rng = np.random.default_rng(seed)
         self.reward_mode = reward_mode
         self.max_steps = max_steps
+        # Moves made per step() with the same action; max_steps still counts moves
+        self.action_repeat = action_repeat
 
         self.frame_size_x = frame_size_x
         self.frame_size_y = frame_size_y
@@ -33,14 +43,25 @@ class SnakeEnv(gym.Env):
         self.grid_width = frame_size_x // self.grid_size
         self.grid_height = frame_size_y // self.grid_size
 
-        # Observation space:
+        # Free cells reachable after going straight, turning left and turning right, kept up to date move by move
+        self.reachable_space = reachable_space
+        self._space = _FreeSpace(self.grid_width, self.grid_height, self.grid_size) if reachable_space else None
+        # Body cells for casting rays, kept up to date move by move
+        self.obs_mode = obs_mode
+        self._occupancy = _Occupancy(self.grid_width, self.grid_height, self.grid_size) if obs_mode == "rays" else None
+
+        # Observation space, obs_mode="features":
         # [head_x, head_y, food_x, food_y, food_dist_x, food_dist_y,
         #  danger_up, danger_down, danger_left, danger_right,
         #  snake_length, direction_up, direction_down, direction_left, direction_right]
+        # obs_mode="rays", with the 8 directions clockwise from up:
+        # [wall_distance x8, body_distance x8, food_distance x8,
+        #  direction_up, direction_down, direction_left, direction_right, food_dist_x, food_dist_y]
+        # followed by [reachable_straight, reachable_left, reachable_right] with reachable_space
         self.observation_space = spaces.Box(
             low=0.0,
             high=1.0,
-            shape=(15,),
+            shape=((30 if obs_mode == "rays" else 15) + (3 if reachable_space else 0),),
             dtype=np.float32
         )
 
@@ -52,7 +73,8 @@ class SnakeEnv(gym.Env):
         # Pygame for rendering
         self._pygame = None
         self._screen = None
-        self._clock = None
+        self._renderer = None
+        self._frames = None
 
         # Colors
         self.black = (0, 0, 0)
@@ -80,6 +102,10 @@ class SnakeEnv(gym.Env):
         self.direction = 3  # Start moving RIGHT
 
         self.food_pos = self._spawn_food()
+        if self._space is not None:
+            self._space.rebuild(self.snake_body)
+        if self._occupancy is not None:
+            self._occupancy.rebuild(self.snake_body)
 
         self.steps = 0
         self.score = 0
@@ -92,6 +118,29 @@ class SnakeEnv(gym.Env):
         return obs, info
 
     def step(self, action: int):
+        reward, terminated, truncated = self._play(action)
+        obs = self._get_obs()
+        return obs, reward, terminated, truncated, self._info()
+
+    def _play(self, action: int) -> Tuple[float, bool, bool]:
+        # The action is repeated for action_repeat moves, stopping early when the episode ends
+        reward = 0.0
+        for _ in range(self.action_repeat):
+            move_reward, terminated, truncated = self._move(action)
+            reward += move_reward
+            if terminated or truncated:
+                break
+        return float(reward), bool(terminated), bool(truncated)
+
+    def _info(self) -> dict:
+        return {
+            "score": self.score,
+            "length": len(self.snake_body),
+            "steps_since_food": self.steps_since_food
+        }
+
+    def _move(self, action: int) -> Tuple[float, bool, bool]:
+        """One move of the snake: (reward, terminated, truncated)."""
         self.steps += 1
         self.steps_since_food += 1
 
@@ -126,6 +175,11 @@ class SnakeEnv(gym.Env):
         else:
             self.snake_body.pop()
 
+        if self._space is not None:
+            self._space.move(self.snake_body, ate_food)
+        if self._occupancy is not None:
+            self._occupancy.move(self.snake_body, ate_food)
+
         terminated = self._check_collision()
 
         truncated = False
@@ -134,30 +188,26 @@ class SnakeEnv(gym.Env):
 
         reward = self._calculate_reward(ate_food, terminated)
 
-        obs = self._get_obs()
-        info = {
-            "score": self.score,
-            "length": len(self.snake_body),
-            "steps_since_food": self.steps_since_food
-        }
-
         if self.render_mode == "human":
-            self._render_human()
+            self._render_human(force=terminated or truncated)
 
-        return obs, float(reward), bool(terminated), bool(truncated), info
+        return reward, terminated, truncated
 
     def render(self):
         if self.render_mode == "human":
             self._render_human()
+        elif self.render_mode == "rgb_array":
+            return self._render_rgb_array()
         else:
             return None
 
     def close(self):
         if self._pygame:
-            pygame.quit()
+            self._pygame.quit()
             self._pygame = None
             self._screen = None
-            self._clock = None
+            self._renderer = None
+            self._frames = None
 
     def _spawn_food(self) -> List[int]:
         while True:
@@ -228,6 +278,9 @@ class SnakeEnv(gym.Env):
         return reward
 
     def _get_obs(self) -> np.ndarray:
+        if self._occupancy is not None:
+            return self._ray_obs()
+
         head_x = self.snake_pos[0] / self.frame_size_x
         head_y = self.snake_pos[1] / self.frame_size_y
         food_x = self.food_pos[0] / self.frame_size_x
@@ -249,58 +302,528 @@ class SnakeEnv(gym.Env):
         dir_left = float(self.direction == 2)
         dir_right = float(self.direction == 3)
 
-        obs = np.array([
+        features = [
             head_x, head_y, food_x, food_y,
             food_dist_x + 0.5, food_dist_y + 0.5,
             danger_up, danger_down, danger_left, danger_right,
             snake_length,
             dir_up, dir_down, dir_left, dir_right
-        ], dtype=np.float32)
+        ]
+        if self._space is not None:
+            features += self._reachable()
+
+        obs = np.array(features, dtype=np.float32)
 
         return obs
 
+    def _ray_obs(self) -> np.ndarray:
+        # SnakeEnvBatch builds the same observation for many envs at once
+        self._occupancy.sync(self.snake_body)
+        length = max(self.grid_width, self.grid_height)
+        walls, body, food = self._occupancy.rays(self.snake_pos, self.food_pos)
+        features = [d / length for d in walls]
+        features += [d / length if d else 1.0 for d in body + food]
+        features += [float(self.direction == k) for k in range(4)]
+        features += [(self.food_pos[0] - self.snake_pos[0]) / self.frame_size_x + 0.5,
+                     (self.food_pos[1] - self.snake_pos[1]) / self.frame_size_y + 0.5]
+        if self._space is not None:
+            features += self._reachable()
+        return np.array(features, dtype=np.float32)
+
+    def _reachable(self) -> List[float]:
+        # Same scale as snake_length, so the policy can compare the space left with its own length
+        return [area / (self.grid_width * self.grid_height)
+                for area in self._space.areas(self.snake_body, self.direction, self.food_pos)]
+
     def _lazy_pygame(self):
         if self._pygame is None:
             import pygame
             self._pygame = pygame
             pygame.init()
             self._screen = pygame.display.set_mode((self.frame_size_x, self.frame_size_y))
-            self._clock = pygame.time.Clock()
             pygame.display.set_caption("Snake RL")
+            from rl_common.render import DirtyRenderer, FrameLimiter
+            self._renderer = DirtyRenderer(self._screen, self.black)
+            self._frames = FrameLimiter(self.metadata["render_fps"])
 
-    def _render_human(self):
+    def _render_rgb_array(self) -> np.ndarray:
+        # Draws on an offscreen surface, so no window or display is needed
+        import pygame
+
+        if self._screen is None:
+            from rl_common.render import DirtyRenderer
+            self._pygame = pygame
+            self._screen = pygame.Surface((self.frame_size_x, self.frame_size_y))
+            self._renderer = DirtyRenderer(self._screen, self.black)
+        self._renderer.draw(self._scene())
+        width, height = self._screen.get_size()
+        return np.frombuffer(pygame.image.tobytes(self._screen, "RGB"), dtype=np.uint8).reshape(height, width, 3)
+
+    def _render_human(self, force: bool = False):
         self._lazy_pygame()
         pygame = self._pygame
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.close()
+                return
+
+        # Steps faster than the display rate only draw every few steps; the final frame is always drawn
+        if self._frames.due(force):
+            pygame.display.update(self._renderer.draw(self._scene()))
+
+    def _scene(self) -> list:
+        from rl_common.render import font_key
+
+        size = self.grid_size
+        items = [("rect", self.green, x, y, size, size) for x, y in self.snake_body]
+        items.append(("rect", self.white, self.food_pos[0], self.food_pos[1], size, size))
+        items.append(("text", font_key(20, "consolas", sysfont=True), f"Score: {self.score}", self.white,
+                      self.frame_size_x // 10, 15, "midtop"))
+        return items
+
+
+class SnakeEnvBatch:
+    """SnakeEnvs stepped together, the `EnvBatch` interface of rl_common.batched_eval.
+
+    With obs_mode="rays" the body cells of every slot are rows of one array, so the rays of all the slots
+    that stepped are cast by one numpy call instead of one per env.
+    """
+
+    def __init__(self, make_env, num_envs: int):
+        self.envs = [make_env() for _ in range(num_envs)]
+        self.num_envs = num_envs
+        first = self.envs[0]
+        self._occupied = None
+        if first.obs_mode == "rays":
+            self._occupied = np.zeros((num_envs, first.grid_width * first.grid_height + 1), dtype=np.uint8)
+            for env, row in zip(self.envs, self._occupied):
+                env._occupancy.attach(row)
+        self._obs = np.zeros((num_envs,) + first.observation_space.shape, dtype=np.float32)
+        self._rewards = np.zeros(num_envs, dtype=np.float64)
+        self._terminated = np.zeros(num_envs, dtype=bool)
+        self._truncated = np.zeros(num_envs, dtype=bool)
+        self._infos: List[dict] = [{} for _ in range(num_envs)]
+
+    def reset_slot(self, index: int, seed: Optional[int]):
+        env = self.envs[index]
+        # Same RNG state as building a fresh SnakeEnv(seed=seed) and calling reset()
+        if seed is not None:
+            env.reset(seed=seed)
+        obs, info = env.reset()
+        self._obs[index] = obs
+        return obs, info
 
-        self._draw_scene()
-        pygame.display.flip()
-        self._clock.tick(self.metadata["render_fps"])
-
-    def _draw_scene(self):
-        pygame = self._pygame
-
-        self._screen.fill(self.black)
-
-        for pos in self.snake_body:
-            pygame.draw.rect(
-                self._screen,
-                self.green,
-                pygame.Rect(pos[0], pos[1], self.grid_size, self.grid_size)
-            )
-
-        # Draw food
-        pygame.draw.rect(
-            self._screen,
-            self.white,
-            pygame.Rect(self.food_pos[0], self.food_pos[1], self.grid_size, self.grid_size)
-        )
+    def step(self, actions: np.ndarray, active: np.ndarray):
+        slots = np.flatnonzero(active)
+        for i in slots:
+            env = self.envs[i]
+            self._rewards[i], self._terminated[i], self._truncated[i] = env._play(actions[i])
+            self._infos[i] = env._info()
+        if self._occupied is None:
+            for i in slots:
+                self._obs[i] = self.envs[i]._get_obs()
+        elif len(slots):
+            self._obs[slots] = _ray_obs([self.envs[i] for i in slots], self._occupied, slots)
+        return self._obs, self._rewards, self._terminated, self._truncated, self._infos
 
-        font = pygame.font.SysFont('consolas', 20)
-        score_surface = font.render(f'Score: {self.score}', True, self.white)
-        score_rect = score_surface.get_rect()
-        score_rect.midtop = (self.frame_size_x / 10, 15)
-        self._screen.blit(score_surface, score_rect)
\ No newline at end of file
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+# Clockwise from up, as (dx, dy) in cells
+_RAY_STEPS = ((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1))
+_RAY_TABLES: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def _ray_table(grid_width: int, grid_height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Cells along each of the 8 rays from every cell, (8, cells + 1, longest ray), and the steps to the wall.
+
+    Steps past the wall are the extra cell index, which also stands for a head off the board.
+    """
+    key = (grid_width, grid_height)
+    if key not in _RAY_TABLES:
+        n = grid_width * grid_height
+        length = max(grid_width, grid_height)
+        x = np.arange(n) % grid_width
+        y = np.arange(n) // grid_width
+        k = np.arange(1, length + 1)
+        table = np.full((8, n + 1, length), n, dtype=np.int16 if n < 2 ** 15 else np.int32)
+        for d, (dx, dy) in enumerate(_RAY_STEPS):
+            rx = x[:, None] + dx * k
+            ry = y[:, None] + dy * k
+            inside = (rx >= 0) & (rx < grid_width) & (ry >= 0) & (ry < grid_height)
+            table[d, :n] = np.where(inside, ry * grid_width + rx, n)
+        _RAY_TABLES[key] = table, (table == n).argmax(axis=2) + 1
+    return _RAY_TABLES[key]
+
+
+def _ray_obs(envs: List[SnakeEnv], occupied: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """The obs_mode="rays" observations of `envs` (what SnakeEnv._ray_obs gives), cast in one go from
+    their body cells in `rows` of `occupied`."""
+    first = envs[0]
+    table, walls = _ray_table(first.grid_width, first.grid_height)
+    length = table.shape[2]
+    n = len(envs)
+    heads = np.empty(n, dtype=np.intp)
+    foods = np.empty(n, dtype=np.intp)
+    directions = np.empty(n, dtype=np.intp)
+    offsets = np.empty((n, 2))
+    for i, env in enumerate(envs):
+        occupancy = env._occupancy
+        occupancy.sync(env.snake_body)
+        heads[i] = occupancy.cell(env.snake_pos)
+        foods[i] = occupancy.cell(env.food_pos)
+        directions[i] = env.direction
+        offsets[i] = ((env.food_pos[0] - env.snake_pos[0]) / env.frame_size_x + 0.5,
+                      (env.food_pos[1] - env.snake_pos[1]) / env.frame_size_y + 0.5)
+
+    cells = table[:, heads].swapaxes(0, 1)  # (envs, 8, length)
+    wall = walls[:, heads].T
+    # The first body segment, or past the wall the extra cell, which is always set
+    hit = occupied[rows[:, None, None], cells].argmax(axis=2) + 1
+    body = np.where(hit < wall, hit, 0)
+    at_food = cells == foods[:, None, None]
+    food = np.where(at_food.any(axis=2), at_food.argmax(axis=2) + 1, 0)
+
+    obs = np.empty((n,) + first.observation_space.shape, dtype=np.float32)
+    obs[:, 0:8] = wall / length
+    obs[:, 8:16] = np.where(body > 0, body / length, 1.0)
+    obs[:, 16:24] = np.where(food > 0, food / length, 1.0)
+    obs[:, 24:28] = np.eye(4)[directions]
+    obs[:, 28:30] = offsets
+    if first._space is not None:
+        obs[:, 30:33] = [env._reachable() for env in envs]
+    return obs
+
+
+class _Occupancy:
+    """The body cells on every row, column and diagonal of the board as bit masks, kept up to date as the
+    head and tail move, so the nearest segment along a ray is a couple of integer operations.
+
+    SnakeEnvBatch also gives it a row of a shared array to keep the cells in (`occupied`, with one extra
+    always set cell standing for off the board), from which the rays of a whole batch are cast with numpy.
+    If the body stops matching the last move (a reset, or state restored from a tape), it is rebuilt.
+    """
+
+    def __init__(self, grid_width: int, grid_height: int, grid_size: int):
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.grid_size = grid_size
+        self.occupied: Optional[np.ndarray] = None
+        self.rows: List[int] = []
+        self.columns: List[int] = []
+        self.diagonals: List[int] = []
+        self.antidiagonals: List[int] = []
+        self.head = self.tail = self.length = None
+
+    def attach(self, occupied: np.ndarray):
+        self.occupied = occupied
+        self.head = None
+
+    def cell(self, pos) -> int:
+        x, y = pos[0] // self.grid_size, pos[1] // self.grid_size
+        if 0 <= x < self.grid_width and 0 <= y < self.grid_height:
+            return y * self.grid_width + x
+        return self.grid_width * self.grid_height
+
+    def _set(self, pos, value: int):
+        x, y = pos[0] // self.grid_size, pos[1] // self.grid_size
+        if not (0 <= x < self.grid_width and 0 <= y < self.grid_height):
+            return
+        # Rows and both diagonals are indexed by x, columns by y
+        lines = ((self.rows, y, x), (self.columns, x, y), (self.diagonals, x - y + self.grid_height - 1, x),
+                 (self.antidiagonals, x + y, x))
+        for line, i, bit in lines:
+            line[i] = line[i] | 1 << bit if value else line[i] & ~(1 << bit)
+        if self.occupied is not None:
+            self.occupied[y * self.grid_width + x] = value
+
+    def rebuild(self, body: List[List[int]]):
+        self.rows = [0] * self.grid_height
+        self.columns = [0] * self.grid_width
+        self.diagonals = [0] * (self.grid_width + self.grid_height - 1)
+        self.antidiagonals = [0] * (self.grid_width + self.grid_height - 1)
+        if self.occupied is not None:
+            self.occupied[:] = 0
+            self.occupied[-1] = 1
+        for pos in body:
+            self._set(pos, 1)
+        self.head, self.tail, self.length = tuple(body[0]), tuple(body[-1]), len(body)
+
+    def move(self, body: List[List[int]], grew: bool):
+        """Follow one move: `body` already has its new head, and its tail is gone unless it grew."""
+        if self.head is None or tuple(body[1]) != self.head or len(body) != self.length + grew:
+            self.head = None  # out of step, rebuilt when next asked
+            return
+        if not grew:
+            self._set(self.tail, 0)
+        self._set(body[0], 1)
+        self.head, self.tail, self.length = tuple(body[0]), tuple(body[-1]), len(body)
+
+    def sync(self, body: List[List[int]]):
+        if self.head is None or (tuple(body[0]), tuple(body[-1]), len(body)) != (self.head, self.tail, self.length):
+            self.rebuild(body)
+
+    def rays(self, head, food) -> Tuple[List[int], List[int], List[int]]:
+        """Steps from `head` along the 8 rays (clockwise from up) to leaving the board, to the nearest body
+        segment and to the food, 0 for none."""
+        width, height = self.grid_width, self.grid_height
+        x, y = head[0] // self.grid_size, head[1] // self.grid_size
+        if not (0 <= x < width and 0 <= y < height):
+            return [1] * 8, [0] * 8, [0] * 8
+        row, column = self.rows[y], self.columns[x]
+        diagonal, antidiagonal = self.diagonals[x - y + height - 1], self.antidiagonals[x + y]
+        walls = [y + 1, min(width - x, y + 1), width - x, min(width - x, height - y), height - y,
+                 min(x + 1, height - y), x + 1, min(x + 1, y + 1)]
+        body = [_before(column, y), _after(antidiagonal, x), _after(row, x), _after(diagonal, x),
+                _after(column, y), _before(antidiagonal, x), _before(row, x), _before(diagonal, x)]
+        food_steps = [0] * 8
+        dx, dy = food[0] // self.grid_size - x, food[1] // self.grid_size - y
+        if dx == 0 or dy == 0 or abs(dx) == abs(dy):
+            step = ((dx > 0) - (dx < 0), (dy > 0) - (dy < 0))
+            if step != (0, 0):
+                food_steps[_RAY_STEPS.index(step)] = max(abs(dx), abs(dy))
+        return walls, body, food_steps
+
+
+def _after(line: int, i: int) -> int:
+    """Steps from bit `i` to the next set bit above it, 0 if none."""
+    above = line >> (i + 1)
+    return (above & -above).bit_length()
+
+
+def _before(line: int, i: int) -> int:
+    """Steps from bit `i` to the next set bit below it, 0 if none."""
+    below = line & ((1 << i) - 1)
+    return i + 1 - below.bit_length() if below else 0
+
+
+def _ring_stretches(mask: int) -> Tuple[Tuple[int, ...], ...]:
+    """Blocked stretches around a cell whose 8 neighbours (clockwise from straight up) are free where
+    `mask` has a bit set: runs of blocked cells between free runs that touch the cell's side neighbours.
+    Each is given by the positions of its blocked cells."""
+    ring = [mask >> i & 1 for i in range(8)]
+    if all(ring):
+        return ()
+    # Free cells in a run with a side neighbour, the others sit inside blocked stretches
+    joined = [False] * 8
+    first = ring.index(0)
+    run = []
+    for i in range(first + 1, first + 9):
+        if ring[i % 8]:
+            run.append(i % 8)
+            continue
+        if any(k % 2 == 0 for k in run):
+            for k in run:
+                joined[k] = True
+        run = []
+    if not any(joined):
+        return ()
+    stretches, current = [], None
+    first = joined.index(True)
+    for i in range(first, first + 8):
+        if joined[i % 8]:
+            current = None
+            continue
+        if current is None:
+            current = []
+            stretches.append(current)
+        if not ring[i % 8]:
+            current.append(i % 8)
+    return tuple(tuple(stretch) for stretch in stretches)
+
+
+_STRETCHES = [_ring_stretches(mask) for mask in range(256)]
+
+
+class _FreeSpace:
+    """Connected regions of the free cells, updated as the snake moves instead of flood filled every step.
+
+    Cells are indexed on a grid with a one-cell border that is never free, so neighbours need no bounds
+    checks. Each move frees the old tail, which can join regions (the smaller one is relabelled), and
+    fills the new head, which can split its region. Blocked cells touching at a corner count as joined,
+    so the body is one piece and the border another (one, if the body lies along an edge): filling the
+    head splits its region only when two of the blocked stretches around it are the same piece, closing a
+    loop. That is read off the 8 cells around the head; only then are the head's free neighbours searched,
+    in turns, until all but one search run out of cells, so the work is bounded by the pieces cut off.
+    If the body stops matching the last move (a reset, or state restored from a tape), it is rebuilt.
+    """
+
+    # Straight, left, right for each direction (0=UP, 1=DOWN, 2=LEFT, 3=RIGHT)
+    TURNS = ((0, 2, 3), (1, 3, 2), (2, 1, 0), (3, 0, 1))
+
+    def __init__(self, grid_width: int, grid_height: int, grid_size: int):
+        self.grid_size = grid_size
+        self.stride = grid_width + 2
+        s = self.stride
+        self.steps = (-s, s, -1, 1)
+        # Around a cell, in order, starting straight up
+        self.ring = (-s, -s + 1, 1, s + 1, s, s - 1, -1, -s - 1)
+        self.empty = bytearray(s * (grid_height + 2))
+        for y in range(1, grid_height + 1):
+            self.empty[y * s + 1:y * s + 1 + grid_width] = b"\x01" * grid_width
+        # Board cells along the border
+        self.edge = bytearray(bool(self.empty[c]) and not all(self.empty[c + d] for d in self.ring)
+                              for c in range(len(self.empty)))
+        self.free = bytearray(self.empty)
+        self.label = [0] * len(self.free)
+        self.sizes = {}
+        self.next_label = 1
+        self.on_edge = 0
+        self.head = self.tail = self.length = None
+
+    def cell(self, pos) -> int:
+        return (pos[1] // self.grid_size + 1) * self.stride + pos[0] // self.grid_size + 1
+
+    def rebuild(self, body: List[List[int]]):
+        self.free = bytearray(self.empty)
+        for pos in body:
+            self.free[self.cell(pos)] = 0
+        self.on_edge = sum(self.edge[self.cell(pos)] for pos in body)
+        self.label = [0] * len(self.free)
+        self.sizes = {}
+        for c in range(len(self.free)):
+            if self.free[c] and not self.label[c]:
+                self.sizes[self.next_label] = len(self._flood(c, self.next_label))
+                self.next_label += 1
+        self.head, self.tail, self.length = self.cell(body[0]), self.cell(body[-1]), len(body)
+
+    def _flood(self, start: int, label: int) -> List[int]:
+        """Gives `label` to every free cell connected to `start` that doesn't have it yet; returns them."""
+        free, labels, steps = self.free, self.label, self.steps
+        labels[start] = label
+        cells = [start]
+        for c in cells:
+            for d in steps:
+                n = c + d
+                if free[n] and labels[n] != label:
+                    labels[n] = label
+                    cells.append(n)
+        return cells
+
+    def move(self, body: List[List[int]], grew: bool):
+        """Follow one move: `body` already has its new head, and its tail is gone unless it grew."""
+        if self.head is None or self.cell(body[1]) != self.head or len(body) != self.length + grew:
+            self.head = None  # out of step, rebuilt when next asked
+            return
+        if not grew:
+            self._release(self.tail)
+        head = self.cell(body[0])
+        if self.free[head]:  # not when the move ran into a wall or the body
+            self._occupy(head)
+        self.head, self.tail, self.length = head, self.cell(body[-1]), len(body)
+
+    def _release(self, c: int):
+        self.free[c] = 1
+        self.on_edge -= self.edge[c]
+        labels, sizes = self.label, self.sizes
+        around = {labels[c + d] for d in self.steps if self.free[c + d]}
+        if not around:
+            labels[c] = self.next_label
+            sizes[self.next_label] = 1
+            self.next_label += 1
+            return
+        keep = max(around, key=sizes.__getitem__)
+        # Labelled first so a flood doesn't cross it into the other regions
+        labels[c] = keep
+        sizes[keep] += 1
+        for other in around - {keep}:
+            start = next(c + d for d in self.steps if labels[c + d] == other)
+            self._flood(start, keep)
+            sizes[keep] += sizes.pop(other)
+
+    def _occupy(self, c: int):
+        free, labels, sizes = self.free, self.label, self.sizes
+        free[c] = 0
+        region = labels[c]
+        labels[c] = 0
+        sizes[region] -= 1
+        starts = [c + d for d in self.steps if free[c + d]]
+        if len(starts) > 1 and self._closes_loop(c):
+            self._split(region, starts)
+        elif not sizes[region]:
+            del sizes[region]
+        self.on_edge += self.edge[c]
+
+    def _closes_loop(self, c: int) -> bool:
+        """Whether two of the blocked stretches around `c` (between its free neighbours) are one piece."""
+        free, empty = self.free, self.empty
+        mask = 0
+        for bit, d in enumerate(self.ring):
+            mask |= free[c + d] << bit
+        stretches = _STRETCHES[mask]
+        if len(stretches) < 2:
+            return False
+        if self.on_edge:  # the body touches the border, so every blocked cell is one piece
+            return True
+        kinds = [{empty[c + self.ring[i]] for i in stretch} for stretch in stretches]
+        # 1 for body, 0 for the border
+        return sum(1 in k for k in kinds) > 1 or sum(0 in k for k in kinds) > 1
+
+    def _split(self, region: int, starts: List[int]):
+        """Searches from each start in turns; a search that runs out while others go on is a new region."""
+        free, labels, steps = self.free, self.label, self.steps
+        owner = {start: i for i, start in enumerate(starts)}
+        queues = [deque([start]) for start in starts]
+        cells = [[start] for start in starts]
+        group = list(range(len(starts)))
+        live = set(group)
+        while len(live) > 1:
+            for i in range(len(starts)):
+                if not queues[i] or group[i] not in live:
+                    continue
+                c = queues[i].popleft()
+                for d in steps:
+                    n = c + d
+                    if not free[n]:
+                        continue
+                    j = owner.get(n)
+                    if j is None:
+                        owner[n] = i
+                        queues[i].append(n)
+                        cells[i].append(n)
+                    elif group[j] != group[i]:
+                        # Met another search: one region so far
+                        old, new = group[j], group[i]
+                        group = [new if g == old else g for g in group]
+                        live.discard(old)
+            for g in list(live):
+                members = [i for i in range(len(starts)) if group[i] == g]
+                if len(live) > 1 and not any(queues[i] for i in members):
+                    piece = [c for i in members for c in cells[i]]
+                    for c in piece:
+                        labels[c] = self.next_label
+                    self.sizes[self.next_label] = len(piece)
+                    self.sizes[region] -= len(piece)
+                    self.next_label += 1
+                    live.discard(g)
+
+    def areas(self, body: List[List[int]], direction: int, food: List[int]) -> List[int]:
+        """Free cells reachable from the cell the head moves to, for straight, left and right.
+
+        The tail cell counts as free (it moves out of the way) unless the move eats the food.
+        """
+        if self.head is None or (self.cell(body[0]), self.cell(body[-1]), len(body)) != \
+                (self.head, self.tail, self.length):
+            self.rebuild(body)
+        if not self.empty[self.head]:
+            return [0, 0, 0]  # the head left the board
+        free, labels, sizes, steps = self.free, self.label, self.sizes, self.steps
+        food_cell = self.cell(food)
+        tail = self.tail
+        around_tail = {labels[tail + d] for d in steps if free[tail + d]}
+        freed = 1 + sum(sizes[r] for r in around_tail)
+        result = []
+        for turn in self.TURNS[direction]:
+            c = self.head + steps[turn]
+            if c == tail:
+                result.append(freed)
+            elif not free[c]:
+                result.append(0)
+            elif c != food_cell and labels[c] in around_tail:
+                result.append(freed)
+            else:
+                result.append(sizes[labels[c]])
+        return result
@@ -1,74 +1,113 @@
 import argparse
 import os
+import sys
 import csv
-import numpy as np
-from stable_baselines3 import PPO
-from snake_env import SnakeEnv
-
-
-def run_episode(model, reward_mode="survival", render=False, max_steps=5000, seed=None):
-
-    env = SnakeEnv(
+import time
+from functools import partial
+from snake_env import SnakeEnv, SnakeEnvBatch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from rl_common.batched_eval import run_lockstep, sb3_predictor
+from rl_common.eval_cache import EvalCache, code_version, episode_seeds
+from rl_common.parallel_eval import default_workers, run_episodes
+from rl_common.policies import BACKENDS, backend_file, load_policy, policy_hash
+from rl_common.registry import RunRegistry
+from rl_common.streaming_stats import ActionHistogram, EpisodeAggregator
+from rl_common.tapes import TapeSelector, write_tapes
+
+FIELDNAMES = [
+    "episode", "reward", "score", "length", "steps", "food_eaten",
+    "avg_steps_per_food", "crashed", "truncated",
+    "action_up", "action_down", "action_left", "action_right"
+]
+
+
+class EpisodeTracker:
+    """Per-episode metrics, fed one step at a time by either evaluation loop."""
+
+    def __init__(self):
+        self.ep_reward = 0.0
+        self.steps = 0
+        self.actions = ActionHistogram(4)
+        self.food_eaten = 0
+        self.steps_to_food_total = 0
+        self.steps_since_last_food = 0
+        self.prev_score = 0
+
+    def step(self, action, reward, info):
+        self.actions.add(int(action))
+        self.ep_reward += reward
+        self.steps += 1
+        self.steps_since_last_food += 1
+
+        if info.get('score', 0) > self.prev_score:
+            self.food_eaten += 1
+            self.steps_to_food_total += self.steps_since_last_food
+            self.steps_since_last_food = 0
+        self.prev_score = info.get('score', 0)
+
+    def finish(self, done, trunc, info):
+        score = int(info.get("score", 0))
+        length = int(info.get("length", 3))
+
+        action_counts = [int(c) for c in self.actions.result()]
+
+        avg_steps_per_food = self.steps_to_food_total / self.food_eaten if self.food_eaten else 0
+
+        return {
+            "reward": float(self.ep_reward),
+            "score": score,
+            "length": length,
+            "steps": self.steps,
+            "food_eaten": self.food_eaten,
+            "avg_steps_per_food": float(avg_steps_per_food),
+            "crashed": int(done and not trunc),
+            "truncated": int(trunc),
+            "action_up": action_counts[0],
+            "action_down": action_counts[1],
+            "action_left": action_counts[2],
+            "action_right": action_counts[3],
+        }
+
+
+def make_env(reward_mode="survival", render=False, max_steps=5000, seed=None, action_repeat=1,
+             reachable_space=False, obs_mode="features"):
+    return SnakeEnv(
         render_mode="human" if render else None,
         reward_mode=reward_mode,
         max_steps=max_steps,
-        seed=seed
+        seed=seed,
+        action_repeat=action_repeat,
+        reachable_space=reachable_space,
+        obs_mode=obs_mode
     )
+
+
+def run_episode(model, reward_mode="survival", render=False, max_steps=5000, seed=None, action_repeat=1,
+                reachable_space=False, obs_mode="features"):
+
+    env = make_env(reward_mode, render, max_steps, seed, action_repeat, reachable_space, obs_mode)
     obs, info = env.reset()
     done = trunc = False
-
-    ep_reward = 0.0
-    steps = 0
-    actions = []
-    food_eaten = 0
-    steps_per_food = []
-    steps_since_last_food = 0
+    tracker = EpisodeTracker()
 
     while not (done or trunc):
         action, _ = model.predict(obs, deterministic=True)
-        actions.append(int(action))
-
-        prev_score = info.get('score', 0)
         obs, r, done, trunc, info = env.step(action)
-
-        ep_reward += r
-        steps += 1
-        steps_since_last_food += 1
-
-        if info.get('score', 0) > prev_score:
-            food_eaten += 1
-            steps_per_food.append(steps_since_last_food)
-            steps_since_last_food = 0
-
-    score = int(info.get("score", 0))
-    length = int(info.get("length", 3))
-
-    action_counts = [actions.count(i) for i in range(4)]
-
-    avg_steps_per_food = np.mean(steps_per_food) if steps_per_food else 0
+        tracker.step(action, r, info)
 
     env.close()
 
-    return {
-        "reward": float(ep_reward),
-        "score": score,
-        "length": length,
-        "steps": steps,
-        "food_eaten": food_eaten,
-        "avg_steps_per_food": float(avg_steps_per_food),
-        "crashed": int(done and not trunc),
-        "truncated": int(trunc),
-        "action_up": action_counts[0],
-        "action_down": action_counts[1],
-        "action_left": action_counts[2],
-        "action_right": action_counts[3],
-    }
+    return tracker.finish(done, trunc, info)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Evaluate trained Snake agent")
-    parser.add_argument("--model_path", type=str, required=True,
+    parser.add_argument("--model_path", type=str, default=None,
                         help="Path to trained model (without .zip extension)")
+    parser.add_argument("--model_query", type=str, default=None,
+                        help="Pick the model from the run registry instead, e.g. "
+                             "\"reward_mode=survival learning_rate<1e-4 best=mean_score\"")
     parser.add_argument("--episodes", type=int, default=20,
                         help="Number of evaluation episodes")
     parser.add_argument("--render", type=int, default=0,
@@ -76,64 +115,156 @@ def main():
     parser.add_argument("--reward_mode", type=str, default="survival",
                         choices=["survival", "length"],
                         help="Reward mode to use")
-    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Base seed that every episode's seed is derived from (random if not given)")
 
     parser.add_argument("--max_steps", type=int, default=5000,
                         help="Maximum steps per episode")
+    parser.add_argument("--action_repeat", type=int, default=1,
+                        help="Moves the snake makes per policy step (must match training)")
+    parser.add_argument("--reachable_space", action="store_true",
+                        help="Add the reachable free space to the observation (must match training)")
+    parser.add_argument("--obs_mode", type=str, default="features", choices=SnakeEnv.OBS_MODES,
+                        help="Observation the model was trained on")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes to run episodes in (0 for one per core)")
+    parser.add_argument("--batch_size", type=int, default=1,
+                        help="Run this many episodes in lockstep with one batched model call per step")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Recompute every episode instead of reusing cached results")
+    parser.add_argument("--backend", type=str, default="sb3", choices=BACKENDS,
+                        help="Inference backend to run the policy with")
+    parser.add_argument("--tapes", nargs="+", default=[],
+                        help="Save replay tapes of these episodes: best, worst, all and/or episode numbers")
+    parser.add_argument("--tape_dir", type=str, default="logs/tapes",
+                        help="Folder the tapes are written to")
     args = parser.parse_args()
-
-    if not os.path.exists(args.model_path + ".zip"):
-        raise FileNotFoundError(f"Model not found: {args.model_path}.zip")
+    try:
+        tapes = TapeSelector(args.tapes)
+    except ValueError as e:
+        parser.error(str(e))
+    args.workers = default_workers(args.workers)
+    if args.render and (args.workers > 1 or args.batch_size > 1):
+        parser.error("--render only works with a single worker and a batch size of 1")
+    if args.workers > 1 and args.batch_size > 1:
+        parser.error("use either --workers or --batch_size, not both")
+
+    registry = RunRegistry()
+    if args.model_path is None:
+        if args.model_query is None:
+            parser.error("one of --model_path or --model_query is required")
+        try:
+            args.model_path = registry.resolve_model(f"game=snake {args.model_query}")
+        except LookupError as e:
+            parser.error(str(e))
+
+    model_file = backend_file(args.model_path, args.backend)
+    if not os.path.exists(model_file):
+        raise FileNotFoundError(f"Model not found: {model_file}")
 
     os.makedirs(os.path.dirname(f"logs/snake_eval_{args.reward_mode}.csv"), exist_ok=True)
 
     print(f"Loading model from {args.model_path}")
-    model = PPO.load(args.model_path)
 
     print(f"Episodes: {args.episodes}")
     print(f"Reward Mode: {args.reward_mode}")
     print(f"Max Steps: {args.max_steps}")
     print(f"Rendering: {'Yes' if args.render else 'No'}")
+    print(f"Workers: {args.workers}")
+    print(f"Batch Size: {args.batch_size}")
+    print(f"Backend: {args.backend}")
     print("=" * 60)
 
-    rows = []
-    for ep in range(1, args.episodes + 1):
-        print(f"Running episode {ep}/{args.episodes}...", end=" ")
+    args.seed, seeds = episode_seeds(args.seed, args.episodes)
+    print(f"Base Seed: {args.seed}")
+
+    load_model = partial(load_policy, backend=args.backend)
+
+    def compute(indices):
+        todo = [seeds[i] for i in indices]
+        # With several workers each one loads its own copy instead
+        model = load_model(args.model_path) if args.workers == 1 else None
+        if args.batch_size > 1:
+            envs = SnakeEnvBatch(partial(make_env, args.reward_mode, False, args.max_steps,
+                                         action_repeat=args.action_repeat, reachable_space=args.reachable_space,
+                                         obs_mode=args.obs_mode), args.batch_size)
+            return run_lockstep(envs, sb3_predictor(model), todo, EpisodeTracker)
+        episode_kwargs = [
+            dict(reward_mode=args.reward_mode, render=bool(args.render), max_steps=args.max_steps, seed=seed,
+                 action_repeat=args.action_repeat, reachable_space=args.reachable_space, obs_mode=args.obs_mode)
+            for seed in todo
+        ]
+        return run_episodes(run_episode, load_model, args.model_path, episode_kwargs,
+                            workers=args.workers, model=model)
+
+    cache = None
+    if not (args.no_cache or args.render):
+        cache = EvalCache()
+        src_dir = os.path.dirname(os.path.abspath(__file__))
+        version = code_version(os.path.join(src_dir, "snake_env.py"), os.path.abspath(__file__))
+        model_hash = policy_hash(args.model_path, args.backend)
+        env_config = {"reward_mode": args.reward_mode, "max_steps": args.max_steps,
+                      "action_repeat": args.action_repeat, "reachable_space": args.reachable_space,
+                      "obs_mode": args.obs_mode}
+        keys = [EvalCache.key(model_hash, "SnakeEnv", env_config, seed, version) for seed in seeds]
+
+    agg = EpisodeAggregator(
+        stats=["reward", "score", "length", "steps", "food_eaten", "crashed", "truncated",
+               ("avg_steps_per_food", lambda r: r["avg_steps_per_food"] > 0),
+               "action_up", "action_down", "action_left", "action_right"],
+        quantiles=["steps"],
+        counters={
+            "expert": lambda r: r["score"] >= 20,
+            "good": lambda r: 10 <= r["score"] < 20,
+            "moderate": lambda r: 5 <= r["score"] < 10,
+            "beginner": lambda r: r["score"] < 5,
+        },
+    )
+    start_time = time.time()
+    with open(f"logs/snake_eval_{args.reward_mode}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+
+        results = cache.run(keys, compute) if cache else compute(range(args.episodes))
+
+        for ep, metrics in results:
+            metrics["episode"] = ep
+            agg.add(metrics)
+            tapes.add(ep, metrics)
+            writer.writerow(metrics)
+            f.flush()
 
-        metrics = run_episode(
-            model,
-            reward_mode=args.reward_mode,
-            render=bool(args.render),
-            max_steps=args.max_steps,
-            seed=args.seed
-        )
-        metrics["episode"] = ep
-        rows.append(metrics)
+            print(f"Running episode {ep}/{args.episodes}... "
+                  f"Score: {metrics['score']}, Length: {metrics['length']}, Steps: {metrics['steps']}")
 
-        print(f"Score: {metrics['score']}, Length: {metrics['length']}, Steps: {metrics['steps']}")
+    duration = time.time() - start_time
+    if cache:
+        cache.close()
+
+    for path in write_tapes(tapes, partial(load_model, args.model_path),
+                            lambda seed: make_env(args.reward_mode, False, args.max_steps, seed, args.action_repeat,
+                                                  args.reachable_space, args.obs_mode),
+                            seeds, "snake", {"reward_mode": args.reward_mode, "max_steps": args.max_steps,
+                                          "action_repeat": args.action_repeat,
+                                          "reachable_space": args.reachable_space, "obs_mode": args.obs_mode},
+                            args.tape_dir, args.model_path):
+        print(f"Saved tape {path}")
 
     print("\nEvaluation:")
 
-    rewards = [r["reward"] for r in rows]
-    scores = [r["score"] for r in rows]
-    lengths = [r["length"] for r in rows]
-    steps = [r["steps"] for r in rows]
-    food_eaten = [r["food_eaten"] for r in rows]
-    avg_steps_per_food = [r["avg_steps_per_food"] for r in rows if r["avg_steps_per_food"] > 0]
-
-    mean_reward = float(np.mean(rewards))
-    std_reward = float(np.std(rewards))
-    mean_score = float(np.mean(scores))
-    max_score = max(scores)
-    mean_length = float(np.mean(lengths))
-    max_length = max(lengths)
-    mean_steps = float(np.mean(steps))
-    mean_food = float(np.mean(food_eaten))
-    crash_rate = float(np.mean([r["crashed"] for r in rows]))
-    timeout_rate = float(np.mean([r["truncated"] for r in rows]))
-    mean_efficiency = float(np.mean(avg_steps_per_food)) if avg_steps_per_food else 0
-
-    print(f"Episodes: {len(rows)}")
+    mean_reward = agg.mean("reward")
+    std_reward = agg.std("reward")
+    mean_score = agg.mean("score")
+    max_score = agg.max("score")
+    mean_length = agg.mean("length")
+    max_length = agg.max("length")
+    mean_steps = agg.mean("steps")
+    mean_food = agg.mean("food_eaten")
+    crash_rate = agg.mean("crashed")
+    timeout_rate = agg.mean("truncated")
+    mean_efficiency = agg.mean("avg_steps_per_food")
+
+    print(f"Episodes: {agg.n}")
     print(f"Mean Reward: {mean_reward:.2f} ± {std_reward:.2f}")
     print(f"Mean Score: {mean_score:.2f} (Best: {max_score})")
     print(f"Mean Snake Length: {mean_length:.1f} (Best: {max_length})")
@@ -145,20 +276,20 @@ def main():
 
     print("\nPerformance: ")
     print("-" * 40)
-    expert = sum(1 for r in rows if r["score"] >= 20)
-    good = sum(1 for r in rows if 10 <= r["score"] < 20)
-    moderate = sum(1 for r in rows if 5 <= r["score"] < 10)
-    beginner = sum(1 for r in rows if r["score"] < 5)
-
-    print(f"Expert (≥20 food): {expert} episodes ({expert / len(rows) * 100:.1f}%)")
-    print(f"Good (10-19 food): {good} episodes ({good / len(rows) * 100:.1f}%)")
-    print(f"Moderate (5-9 food): {moderate} episodes ({moderate / len(rows) * 100:.1f}%)")
-    print(f"Beginner (<5 food): {beginner} episodes ({beginner / len(rows) * 100:.1f}%)")
-
-    total_up = sum(r["action_up"] for r in rows)
-    total_down = sum(r["action_down"] for r in rows)
-    total_left = sum(r["action_left"] for r in rows)
-    total_right = sum(r["action_right"] for r in rows)
+    expert = agg.counters["expert"]
+    good = agg.counters["good"]
+    moderate = agg.counters["moderate"]
+    beginner = agg.counters["beginner"]
+
+    print(f"Expert (≥20 food): {expert} episodes ({expert / agg.n * 100:.1f}%)")
+    print(f"Good (10-19 food): {good} episodes ({good / agg.n * 100:.1f}%)")
+    print(f"Moderate (5-9 food): {moderate} episodes ({moderate / agg.n * 100:.1f}%)")
+    print(f"Beginner (<5 food): {beginner} episodes ({beginner / agg.n * 100:.1f}%)")
+
+    total_up = agg.total("action_up")
+    total_down = agg.total("action_down")
+    total_left = agg.total("action_left")
+    total_right = agg.total("action_right")
     total_actions = total_up + total_down + total_left + total_right
 
     print("\n Actions:")
@@ -169,27 +300,35 @@ def main():
 
     print("\n Survival Time")
     print("-" * 40)
-    survival_times = sorted(steps)
-    median_survival = survival_times[len(survival_times) // 2]
-    q1_survival = survival_times[len(survival_times) // 4]
-    q3_survival = survival_times[3 * len(survival_times) // 4]
+    survival_times = agg.quantiles["steps"]
+    median_survival = survival_times.quantile(0.5)
+    q1_survival = survival_times.quantile(0.25)
+    q3_survival = survival_times.quantile(0.75)
 
     print(f"Median Survival: {median_survival} steps")
     print(f"25th Percentile: {q1_survival} steps")
     print(f"75th Percentile: {q3_survival} steps")
-    print(f"Longest Survival: {max(steps)} steps")
-
-    fieldnames = [
-        "episode", "reward", "score", "length", "steps", "food_eaten",
-        "avg_steps_per_food", "crashed", "truncated",
-        "action_up", "action_down", "action_left", "action_right"
-    ]
-
-    with open(f"logs/snake_eval_{args.reward_mode}.csv", "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
+    print(f"Longest Survival: {agg.max('steps')} steps")
+
+    registry.record_eval(
+        "snake",
+        args.model_path,
+        config=vars(args),
+        metrics={
+            "mean_reward": mean_reward,
+            "std_reward": std_reward,
+            "mean_score": mean_score,
+            "max_score": max_score,
+            "mean_length": mean_length,
+            "mean_steps": mean_steps,
+            "crash_rate": crash_rate,
+            "timeout_rate": timeout_rate,
+            "median_survival": median_survival,
+        },
+        duration=duration,
+        steps_per_sec=agg.total("steps") / duration if duration > 0 else None,
+    )
+    registry.close()
 
 
 if __name__ == "__main__":
@@ -1,19 +1,27 @@
 import argparse
 import os
-
-from stable_baselines3 import PPO
-from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.logger import configure
+import sys
+import time
+from functools import partial
 
 from snake_env import SnakeEnv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from rl_common.registry import record_sb3_training
+
+
+def make_env(render_mode=None, reward_mode="survival", seed=42, max_steps=5000, action_repeat=1,
+             reachable_space=False, obs_mode="features"):
+    from stable_baselines3.common.monitor import Monitor
 
-def make_env(render_mode=None, reward_mode="survival", seed=42, max_steps=5000):
     env = SnakeEnv(
         render_mode=render_mode,
         reward_mode=reward_mode,
         seed=seed,
-        max_steps=max_steps
+        max_steps=max_steps,
+        action_repeat=action_repeat,
+        reachable_space=reachable_space,
+        obs_mode=obs_mode
     )
     env = Monitor(env)
     return env
@@ -34,6 +42,12 @@ def main():
                         help="Directory to save models")
     parser.add_argument("--max_steps", type=int, default=5000,
                         help="Maximum steps per episode")
+    parser.add_argument("--action_repeat", type=int, default=1,
+                        help="Moves the snake makes per policy step (rewards are summed)")
+    parser.add_argument("--reachable_space", action="store_true",
+                        help="Add the free space reachable after each move to the observation")
+    parser.add_argument("--obs_mode", type=str, default="features", choices=SnakeEnv.OBS_MODES,
+                        help="features (position, food and danger flags) or rays (distances along 8 directions)")
 
     parser.add_argument("--learning_rate", type=float, default=2.5e-4,
                         help="Learning rate")
@@ -48,8 +62,17 @@ def main():
     parser.add_argument("--gae_lambda", type=float, default=0.95,
                         help="Factor for trade-off of bias vs variance for GAE")
 
+    parser.add_argument("--n_envs", type=int, default=1,
+                        help="Environments stepped in parallel worker processes (n_steps is per environment)")
+    parser.add_argument("--vec_env", type=str, default="shm", choices=["shm", "async", "subproc", "dummy"],
+                        help="Vector env used when n_envs > 1")
+
     args = parser.parse_args()
 
+    # Imported after parsing so --help doesn't wait for torch
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.logger import configure
+
     os.makedirs(args.logdir, exist_ok=True)
     os.makedirs(args.modeldir, exist_ok=True)
 
@@ -61,12 +84,23 @@ def main():
     env = make_env(
         reward_mode=args.reward_mode,
         seed=args.seed,
-        max_steps=args.max_steps
+        max_steps=args.max_steps,
+        action_repeat=args.action_repeat,
+        reachable_space=args.reachable_space,
+        obs_mode=args.obs_mode
     )
 
+    train_env = env
+    if args.n_envs > 1:
+        from rl_common.shm_vec_env import make_vec_env
+        train_env = make_vec_env([partial(make_env, reward_mode=args.reward_mode, seed=args.seed + i,
+                                          max_steps=args.max_steps, action_repeat=args.action_repeat,
+                                          reachable_space=args.reachable_space, obs_mode=args.obs_mode)
+                                  for i in range(args.n_envs)], args.vec_env)
+
     model = PPO(
         policy="MlpPolicy",
-        env=env,
+        env=train_env,
         verbose=1,
         tensorboard_log=args.logdir,
         seed=args.seed,
@@ -88,11 +122,16 @@ def main():
         )
     )
 
+    if args.n_envs > 1 and args.vec_env == "async":
+        from rl_common.async_rollouts import use_async_rollouts
+        use_async_rollouts(model)
+
     new_logger = configure(args.logdir, ["stdout", "tensorboard"])
     model.set_logger(new_logger)
 
     print("Starting training:")
 
+    start_time = time.time()
     model.learn(
         total_timesteps=args.timesteps,
         progress_bar=True
@@ -101,6 +140,7 @@ def main():
     save_name = f"ppo_snake_{args.reward_mode}"
     save_path = os.path.join(args.modeldir, save_name)
     model.save(save_path)
+    duration = time.time() - start_time
 
     print(f"Model saved to: {save_path}")
 
@@ -126,7 +166,18 @@ def main():
     print(f"\nAverage Score: {avg_score:.1f}")
     print(f"Best Score: {max(test_scores)}")
 
+    record_sb3_training(
+        "snake", save_name, model, save_path, duration,
+        config=vars(args),
+        metrics={
+            "test_mean_score": avg_score,
+            "test_best_score": max(test_scores),
+        },
+    )
+
     env.close()
+    if train_env is not env:
+        train_env.close()
 
 
 if __name__ == "__main__":
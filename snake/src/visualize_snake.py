@@ -1,24 +1,53 @@
 import argparse
-import pygame
-from stable_baselines3 import PPO
+import os
+import sys
+
 from snake_env import SnakeEnv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from rl_common.inference_server import load_model
+from rl_common.policies import BACKENDS
+from rl_common.tapes import Tape, play
+
 
 def main():
     parser = argparse.ArgumentParser(description="Watch trained Snake agent play")
-    parser.add_argument("--model_path", type=str, required=True,
+    parser.add_argument("--model_path", type=str, default=None,
                        help="Path to trained model (without .zip extension)")
     parser.add_argument("--reward_mode", type=str, default="survival",
                         choices=["survival", "length"],
                         help="Reward function to use")
     parser.add_argument("--max_steps", type=int, default=5000,
                         help="Maximum steps per episode")
+    parser.add_argument("--reachable_space", action="store_true",
+                        help="Add the reachable free space to the observation (must match training)")
+    parser.add_argument("--obs_mode", type=str, default="features", choices=SnakeEnv.OBS_MODES,
+                        help="Observation the model was trained on")
     parser.add_argument("--episodes", type=int, default=5,
                         help="Number of episodes to run")
     parser.add_argument("--fps", type=int, default=60,
                         help="Frames per second for rendering")
+    parser.add_argument("--backend", type=str, default="sb3", choices=BACKENDS,
+                        help="Inference backend to run the policy with")
+    parser.add_argument("--server", type=str, default=None,
+                        help="Get actions from a running inference server at this address "
+                             "(\"default\", a Unix socket path or host:port) instead of loading the model")
+    parser.add_argument("--tape", type=str, default=None,
+                        help="Replay a tape saved by the eval script instead of running a model")
+    parser.add_argument("--speed", type=int, default=1,
+                        help="Tape steps shown per frame")
+    parser.add_argument("--start_step", type=int, default=0,
+                        help="Step of the tape to start from")
     args = parser.parse_args()
 
+    if args.tape:
+        tape = Tape.load(args.tape)
+        play(tape, lambda seed: SnakeEnv(render_mode="human", seed=seed, **tape.env_config),
+             fps=args.fps, speed=args.speed, start_step=args.start_step)
+        return
+    if args.model_path is None:
+        parser.error("--model_path is required unless --tape is given")
+
     print(f"Model: {args.model_path}")
     print(f"Reward Mode: {args.reward_mode}")
     print(f"Episodes: {args.episodes}")
@@ -31,8 +60,10 @@ def main():
     print("Q - Quit")
     print("ESC - Quit")
 
+    import pygame
+
     # Load the model
-    model = PPO.load(args.model_path)
+    model = load_model(args.model_path, args.server, args.backend)
 
     for episode in range(1, args.episodes + 1):
         print(f"\nEpisode {episode}/{args.episodes}")
@@ -41,6 +72,8 @@ def main():
             render_mode="human",
             reward_mode=args.reward_mode,
             max_steps=args.max_steps,
+            reachable_space=args.reachable_space,
+            obs_mode=args.obs_mode,
         )
 
         obs, info = env.reset()
@@ -0,0 +1,82 @@
+"""fill_buffer's returns and advantages against SB3's on the same trajectories."""
+import numpy as np
+import pytest
+import torch as th
+from gymnasium import spaces
+from stable_baselines3.common.buffers import RolloutBuffer
+
+from rl_common.async_rollouts import fill_buffer
+
+OBS_SPACE = spaces.Box(-1.0, 1.0, shape=(2,), dtype=np.float32)
+ACTION_SPACE = spaces.Discrete(3)
+GAMMA, GAE_LAMBDA = 0.9, 0.95
+
+
+def _buffer(n_steps, n_envs):
+    return RolloutBuffer(n_steps, OBS_SPACE, ACTION_SPACE, device="cpu", gamma=GAMMA, gae_lambda=GAE_LAMBDA,
+                         n_envs=n_envs)
+
+
+def _trajectory(rng, length, first_start=False, terminal_at=(), timeout_at=()):
+    """Transitions with random rewards and values; the step after a terminal or time limit starts an episode."""
+    rows = []
+    start = first_start
+    for j in range(length):
+        timeout_obs = rng.uniform(-1, 1, 2).astype(np.float32) if j in timeout_at else None
+        rows.append((rng.uniform(-1, 1, 2).astype(np.float32), np.array(rng.integers(3)), float(rng.normal()),
+                     float(rng.normal()), float(rng.normal()), start, j in terminal_at, timeout_obs))
+        start = j in terminal_at or j in timeout_at
+    return rows
+
+
+def _bootstrapped(rows, terminal_values):
+    # collect_rollouts adds gamma * V(final observation) to time-limit rewards before fill_buffer
+    return [t[:2] + (t[2] + GAMMA * terminal_values[j],) + t[3:] if t[7] is not None else t
+            for j, t in enumerate(rows)]
+
+
+def _sb3(segment, last_value, done):
+    """Returns and advantages of one env's steps collected in a row, as SB3 computes them at a rollout end."""
+    buffer = _buffer(len(segment), 1)
+    for obs, action, reward, value, log_prob, start, _, _ in segment:
+        buffer.add(obs[None], action.reshape(1, 1), np.array([reward]), np.array([start]), th.tensor([value]),
+                   th.tensor([log_prob]))
+    buffer.compute_returns_and_advantage(last_values=th.tensor([last_value]), dones=np.array([done]))
+    return buffer.returns[:, 0], buffer.advantages[:, 0]
+
+
+def _ended(row):
+    return row[6] or row[7] is not None
+
+
+def test_timeout_on_the_last_row():
+    # 4 rewards of 1, the last at a time limit with V(final observation) = 5 and V(reset observation) = 100
+    rows = [(np.zeros(2, np.float32), np.array(0), 1.0, 0.0, 0.0, j == 0, False, None) for j in range(4)]
+    rows[3] = rows[3][:7] + (np.zeros(2, np.float32),)
+    buffer = RolloutBuffer(4, OBS_SPACE, ACTION_SPACE, device="cpu", gamma=GAMMA, gae_lambda=1.0, n_envs=1)
+    fill_buffer(buffer, [_bootstrapped(rows, {3: 5.0})], [100.0], GAMMA)
+    np.testing.assert_allclose(buffer.returns[:, 0], [6.7195, 6.355, 5.95, 5.5], rtol=1e-5)
+
+
+@pytest.mark.parametrize("timeout_at", [3, 5], ids=["column_end", "trajectory_end"])
+def test_matches_sb3(timeout_at):
+    # Buffer of 4 steps x 2 columns; worker 0 plays 6 steps (across the column end), worker 1 plays 2
+    rng = np.random.default_rng(timeout_at)
+    n_steps = 4
+    worker0 = _bootstrapped(_trajectory(rng, 6, first_start=True, timeout_at=(timeout_at,)), {timeout_at: 2.5})
+    worker1 = _trajectory(rng, 2)
+    next_values = [-3.0, 0.7]
+    buffer = _buffer(n_steps, 2)
+    fill_buffer(buffer, [worker0, worker1], next_values, GAMMA)
+
+    # The same cuts SB3 would make if each piece had been a rollout of its own
+    pieces = [(worker0[:n_steps], worker0[n_steps][3]), (worker0[n_steps:], next_values[0]),
+              (worker1, next_values[1])]
+    returns, advantages = [], []
+    for segment, last_value in pieces:
+        r, a = _sb3(segment, last_value, _ended(segment[-1]))
+        returns.append(r)
+        advantages.append(a)
+    expected_returns, expected_advantages = np.concatenate(returns), np.concatenate(advantages)
+    np.testing.assert_allclose(buffer.returns.T.reshape(-1), expected_returns, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(buffer.advantages.T.reshape(-1), expected_advantages, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,32 @@
+"""A short env_bench run over every game and case, the way `run` is used by default."""
+import json
+import os
+import subprocess
+import sys
+
+from rl_common import REPO_ROOT
+from rl_common.tournament import GAMES
+
+
+def test_run_covers_every_game(tmp_path):
+    out = os.path.join(str(tmp_path), "bench.json")
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    # Its own interpreter: the cases run envs back to back, and a pygame crash takes the process with it
+    proc = subprocess.run([sys.executable, "-m", "rl_common.env_bench", "run", "--steps", "200", "--warmup", "10",
+                           "--repeats", "1", "--vec_envs", "2", "--out", out],
+                          cwd=REPO_ROOT, env=env, capture_output=True, text=True, timeout=600)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    with open(out) as f:
+        results = json.load(f)["results"]
+    for game in GAMES:
+        assert f"{game}/render_rgb_array_us" in results
+        assert f"{game}/policy/steps_per_sec" in results
+    assert "aim_trainer/render_human_us" in results
+
+
+def test_two_models_for_one_game_are_rejected():
+    models = [os.path.join("snake", "models", name) for name in ("ppo_snake_survival", "ppo_snake_length_base")]
+    proc = subprocess.run([sys.executable, "-m", "rl_common.env_bench", "run", "--models", *models],
+                          cwd=REPO_ROOT, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 2
+    assert "one model per game" in proc.stderr
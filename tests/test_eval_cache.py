@@ -0,0 +1,60 @@
+"""Seed schedules and incremental evaluation with the eval cache."""
+import pytest
+
+from rl_common.eval_cache import EvalCache, episode_seeds
+
+
+def test_seeds_are_prefix_stable():
+    _, short = episode_seeds(123, 10)
+    _, long = episode_seeds(123, 50)
+    assert long[:10] == short
+    assert len(set(long)) == 50
+    assert episode_seeds(124, 10)[1] != short
+
+
+def test_random_base_seed_is_returned():
+    base, seeds = episode_seeds(None, 5)
+    assert episode_seeds(base, 5) == (base, seeds)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EvalCache(str(tmp_path / "eval_cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+def test_only_missing_episodes_are_computed(cache):
+    calls = []
+
+    def run(episodes):
+        _, seeds = episode_seeds(7, episodes)
+        keys = [EvalCache.key("model", "SnakeEnv", {"reward_mode": "survival"}, seed, "v1") for seed in seeds]
+
+        def compute(indices):
+            calls.append(list(indices))
+            for i in indices:
+                yield i + 1, {"seed": seeds[i], "score": seeds[i] % 100}
+        return [(ep, result) for ep, result in cache.run(keys, compute)], seeds
+
+    first, seeds = run(10)
+    assert calls == [list(range(10))]
+    # A larger N reuses the first 10 episodes and only plays the new ones
+    second, more_seeds = run(25)
+    assert calls[1] == list(range(10, 25))
+    assert second[:10] == first
+    assert [ep for ep, _ in second] == list(range(1, 26))
+    assert [result["seed"] for _, result in second] == more_seeds
+    # Everything is cached now
+    run(25)
+    assert len(calls) == 2
+
+
+def test_key_changes_with_what_decides_the_episode():
+    base = EvalCache.key("model", "SnakeEnv", {"reward_mode": "survival", "max_steps": 100}, 1, "v1")
+    assert base == EvalCache.key("model", "SnakeEnv", {"max_steps": 100, "reward_mode": "survival"}, 1, "v1")
+    for other in (EvalCache.key("other", "SnakeEnv", {"reward_mode": "survival", "max_steps": 100}, 1, "v1"),
+                  EvalCache.key("model", "SnakeEnv", {"reward_mode": "length", "max_steps": 100}, 1, "v1"),
+                  EvalCache.key("model", "SnakeEnv", {"reward_mode": "survival", "max_steps": 100}, 2, "v1"),
+                  EvalCache.key("model", "SnakeEnv", {"reward_mode": "survival", "max_steps": 100}, 1, "v2")):
+        assert other != base
@@ -0,0 +1,55 @@
+"""FruitCatchers fast-forwarding against playing the same episode frame by frame."""
+import random
+
+import numpy as np
+import pytest
+
+from rl_common.tournament import load_game
+
+load_game("FruitCatchers")
+from fruit_env_full import FruitCatchFullEnv  # noqa: E402
+
+FPS = FruitCatchFullEnv.metadata["render_fps"]
+
+
+def _fast_forwarded(seed, n=300):
+    """(action, frames, reward, obs, score, total frames) of each step of a seeded fast-forwarded episode."""
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    env = FruitCatchFullEnv(fast_forward=True)
+    obs = env._get_obs()
+    steps = []
+    for _ in range(n):
+        # Move under the second fruit (the one that can be caught), then wait there with the power-up, idle
+        # while it recharges
+        offset = obs[2] - obs[4] - 0.03
+        if rng.random() < 0.2 or abs(offset) < 0.04:
+            action = 4
+        else:
+            action = 0 if offset < 0 else 1
+        obs, reward, done, _, info = env.step(action)
+        steps.append((action, info["frames"], reward, obs, env.score, env.frames))
+        if done:
+            break
+    return steps
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_fast_forward_matches_frame_by_frame(seed):
+    steps = _fast_forwarded(seed)
+    assert max(frames for _, frames, *_ in steps) > 1, "nothing was fast-forwarded"
+    assert any(reward > 20 for _, _, reward, *_ in steps), "no fruit was caught"
+
+    random.seed(seed)
+    env = FruitCatchFullEnv(fast_forward=False)
+    # The same frame clock as fast-forwarding, without skipping
+    env._now = lambda: env.frames / FPS
+    for action, frames, reward, obs, score, total_frames in steps:
+        replayed = 0.0
+        for _ in range(frames):
+            replay_obs, r, done, _, _ = env.step(action)
+            replayed += r
+        assert replayed == reward
+        assert env.score == score
+        assert env.frames == total_frames
+        np.testing.assert_array_equal(replay_obs, obs)
@@ -0,0 +1,14 @@
+"""Import time of every env module and script against its budget (see rl_common.import_budget)."""
+import pytest
+
+from rl_common.import_budget import BUDGETS, SCALE, check
+
+
+@pytest.mark.parametrize("folder, module, budget_ms, forbidden", BUDGETS,
+                         ids=[f"{folder}/{module}" for folder, module, _, _ in BUDGETS])
+def test_import_budget(folder, module, budget_ms, forbidden):
+    result = check(folder, module, budget_ms * SCALE, forbidden, repeats=3)
+    assert not result["forbidden"], f"{module} imports {', '.join(result['forbidden'])} at import time"
+    assert result["ms"] <= result["budget"], (
+        f"{module} took {result['ms']:.0f} ms (budget {result['budget']:.0f} ms), heaviest imports: "
+        + ", ".join(f"{name} {us / 1000:.1f} ms" for us, name in result["heaviest"]))
@@ -0,0 +1,56 @@
+"""The inference server's batching thread against malformed requests."""
+import glob
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from rl_common import REPO_ROOT
+from rl_common.inference_server import ModelWorker, _Request
+
+SNAKE_MODEL = sorted(glob.glob(os.path.join(REPO_ROOT, "snake", "models", "*.zip")))[0][:-len(".zip")]
+
+
+@pytest.fixture(scope="module")
+def worker():
+    # A long wait so requests sent together end up in one batch
+    worker = ModelWorker(SNAKE_MODEL, "numpy", max_batch=64, max_wait=0.2)
+    worker.start()
+    return worker
+
+
+def _call(worker, obs, results, key):
+    try:
+        results[key] = worker.predict(obs)
+    except Exception as e:
+        results[key] = e
+
+
+def test_malformed_request_alongside_a_valid_one(worker):
+    good = np.zeros((3,) + worker.obs_shape, dtype=np.float32)
+    bad = np.zeros((2, worker.obs_shape[0] + 1), dtype=np.float32)
+    results = {}
+    threads = [threading.Thread(target=_call, args=(worker, obs, results, key), daemon=True)
+               for key, obs in (("good", good), ("bad", bad))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert isinstance(results["bad"], ValueError)
+    assert np.asarray(results["good"]).shape == (3,)
+    assert worker.is_alive()
+
+
+def test_failed_batch_is_reported_to_every_request(worker):
+    # Requests that got past `predict`'s check but can't be stacked together
+    requests = [_Request(np.zeros((1,) + worker.obs_shape, dtype=np.float32), True),
+                _Request(np.zeros((1, 1), dtype=np.float32), True)]
+    for request in requests:
+        worker.requests.put(request)
+    for request in requests:
+        assert request.done.wait(timeout=10)
+        assert request.error is not None
+    # The thread keeps serving
+    assert worker.predict(np.zeros(worker.obs_shape, dtype=np.float32)).shape == ()
+    assert worker.is_alive()
@@ -0,0 +1,69 @@
+"""Exported policy backends against `model.predict` on every model in the repo."""
+import glob
+import os
+import shutil
+
+import pytest
+
+from rl_common import REPO_ROOT
+from rl_common.eval_cache import file_hash
+from rl_common.policies import backend_file, export_source, load_policy, parity, policy_hash
+
+MODELS = sorted(glob.glob(os.path.join(REPO_ROOT, "*", "models", "*.zip")))
+
+
+def _copy(zip_path, folder):
+    path = os.path.join(str(folder), os.path.basename(zip_path))
+    shutil.copy(zip_path, path)
+    return path[:-len(".zip")]
+
+
+@pytest.mark.parametrize("backend", ["numpy", "torchscript"])
+@pytest.mark.parametrize("zip_path", MODELS, ids=lambda p: os.path.basename(p)[:-len(".zip")])
+def test_export_parity(zip_path, backend, tmp_path):
+    from rl_common import numpy_policy, torch_policy
+
+    model_path = _copy(zip_path, tmp_path)
+    {"numpy": numpy_policy, "torchscript": torch_policy}[backend].export(model_path)
+    assert export_source(backend_file(model_path, backend)) == file_hash(zip_path)
+    mismatches, max_diff = parity(model_path, backend, samples=2000)
+    assert mismatches == 0, f"max difference {max_diff:.2e}"
+
+
+def test_stale_export_is_exported_again(tmp_path):
+    from rl_common import numpy_policy
+
+    snake = [p for p in MODELS if os.sep + "snake" + os.sep in p]
+    model_path = _copy(snake[0], tmp_path)
+    numpy_policy.export(model_path)
+    stale_hash = policy_hash(model_path, "numpy")
+    # Retrain: a different model with the same spaces replaces the zip
+    shutil.copy(snake[1], model_path + ".zip")
+    assert policy_hash(model_path, "numpy") != stale_hash
+    assert export_source(backend_file(model_path, "numpy")) == file_hash(snake[1])
+    assert parity(model_path, "numpy", samples=2000)[0] == 0
+
+
+def test_stale_int8_raises(tmp_path):
+    from rl_common.policies import load_sb3
+    from rl_common.torch_policy import actor_from_sb3, save_traced
+
+    model_path = _copy(MODELS[0], tmp_path)
+    actor = actor_from_sb3(load_sb3(model_path))
+    save_traced(actor, actor.obs_shape, backend_file(model_path, "int8"), "0" * 64)
+    with pytest.raises(ValueError, match="quantize"):
+        load_policy(model_path, "int8")
+
+
+def test_cnn_policy_is_not_exported():
+    from stable_baselines3 import PPO
+
+    from rl_common.numpy_policy import from_sb3
+    from rl_common.torch_policy import actor_from_sb3
+    from rl_common.tournament import load_game
+
+    env = load_game("aim_trainer").make_env(obs_mode="pixels")
+    model = PPO("CnnPolicy", env, n_steps=8, batch_size=8)
+    for export in (from_sb3, actor_from_sb3):
+        with pytest.raises(ValueError, match="NatureCNN"):
+            export(model)
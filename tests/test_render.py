@@ -0,0 +1,26 @@
+"""Cached text rendering across pygame restarts."""
+import os
+import subprocess
+import sys
+
+from rl_common import REPO_ROOT
+
+# Envs run back to back in one process (video export workers, env_bench) each init and quit pygame
+RESTARTS = """
+import pygame
+from rl_common.render import font_key, text_surface
+
+key = font_key(36)
+for text in ("ab", "xyz", "Score: 12"):
+    pygame.init()
+    text_surface(key, text, (255, 255, 255))
+    pygame.quit()
+"""
+
+
+def test_text_after_pygame_restart():
+    # A stale font segfaults, so this runs in its own interpreter
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    proc = subprocess.run([sys.executable, "-c", RESTARTS], cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+                          timeout=60)
+    assert proc.returncode == 0, proc.stderr
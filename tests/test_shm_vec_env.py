@@ -0,0 +1,99 @@
+"""ShmVecEnv and AsyncShmVecEnv against SB3's DummyVecEnv on the same seeded envs."""
+import random
+from functools import partial
+
+import numpy as np
+import pytest
+from gymnasium.wrappers import TimeLimit
+from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.vec_env import DummyVecEnv
+
+from rl_common.shm_vec_env import AsyncShmVecEnv, ShmVecEnv
+from rl_common.tournament import load_game
+
+N_ENVS = 3
+STEPS = 60
+
+
+def make_env(game: str, seed: int):
+    # Short episodes, so every worker ends a few and resets on its own
+    if game == "snake":
+        load_game(game)
+        from snake_env import SnakeEnv
+        env = SnakeEnv(seed=seed, max_steps=15)
+    elif game == "aim_trainer":
+        load_game(game)
+        from aim_trainer_env import AimTrainerEnv
+        env = AimTrainerEnv(seed=seed, max_steps=15)
+    else:
+        load_game(game)
+        from fruit_env_full import FruitCatchFullEnv
+        # Seeded through the global `random`, and timed in frames so the wall clock doesn't matter
+        random.seed(seed)
+        env = TimeLimit(FruitCatchFullEnv(fast_forward=True), max_episode_steps=15)
+    return Monitor(env)
+
+
+def _comparable(info: dict) -> dict:
+    # Monitor's episode time is wall clock
+    info = dict(info)
+    if "episode" in info:
+        info["episode"] = {k: v for k, v in info["episode"].items() if k != "t"}
+    return info
+
+
+def _assert_infos_equal(infos, expected):
+    for info, want in zip(infos, expected):
+        info, want = _comparable(info), _comparable(want)
+        assert info.keys() == want.keys()
+        for key in want:
+            np.testing.assert_equal(info[key], want[key])
+
+
+def _filtered(info: dict, keys) -> dict:
+    kept = {k: info[k] for k in keys if k in info}
+    for key in ("terminal_observation", "TimeLimit.truncated"):
+        if key in info:
+            kept[key] = info[key]
+    return kept
+
+
+@pytest.mark.parametrize("info_keys", [None, ("episode",)], ids=["all_infos", "episode_only"])
+@pytest.mark.parametrize("kind", ["shm", "async"])
+@pytest.mark.parametrize("game", ["snake", "aim_trainer", "FruitCatchers"])
+def test_matches_dummy_vec_env(game, kind, info_keys):
+    # FruitCatchers envs share the global `random` when DummyVecEnv runs them in one process
+    n_envs = 1 if game == "FruitCatchers" else N_ENVS
+    env_fns = [partial(make_env, game, 1000 + i) for i in range(n_envs)]
+    reference = DummyVecEnv(env_fns)
+    vec_env = (ShmVecEnv if kind == "shm" else AsyncShmVecEnv)(env_fns, info_keys=info_keys)
+    try:
+        np.testing.assert_array_equal(vec_env.reset(), reference.reset())
+        rng = np.random.default_rng(0)
+        dones = 0
+        for _ in range(STEPS):
+            actions = np.array([reference.action_space.sample() for _ in range(n_envs)])
+            obs, rewards, done, infos = reference.step(actions)
+            if kind == "shm":
+                got = vec_env.step(actions)
+            else:
+                # Workers started in a random order still come back in worker order
+                order = rng.permutation(n_envs)
+                vec_env.send(order, actions[order])
+                indices, *got = vec_env.poll(n_envs)
+                np.testing.assert_array_equal(indices, np.arange(n_envs))
+            np.testing.assert_array_equal(got[0], obs)
+            np.testing.assert_array_equal(got[1], rewards.astype(np.float32))
+            np.testing.assert_array_equal(got[2], done)
+            expected = infos if info_keys is None else [_filtered(info, info_keys) for info in infos]
+            _assert_infos_equal(got[3], expected)
+            # Only steps with something left to send went through the pipe
+            np.testing.assert_array_equal(vec_env._views["has_info"],
+                                          [bool({k: v for k, v in e.items() if k not in
+                                                 ("terminal_observation", "TimeLimit.truncated")})
+                                           for e in expected])
+            dones += done.sum()
+        assert dones >= n_envs, "no episodes ended"
+    finally:
+        vec_env.close()
+        reference.close()
@@ -0,0 +1,176 @@
+"""SnakeEnv's incrementally kept observations against working them out from scratch."""
+import random
+from collections import deque
+
+import numpy as np
+import pytest
+
+from rl_common.batched_eval import ScalarEnvBatch
+from rl_common.tournament import load_game
+
+load_game("snake")
+from snake_env import SnakeEnv, SnakeEnvBatch  # noqa: E402
+
+MOVES = ((0, -1), (0, 1), (-1, 0), (1, 0))  # 0=UP, 1=DOWN, 2=LEFT, 3=RIGHT
+TURNS = ((0, 2, 3), (1, 3, 2), (2, 1, 0), (3, 0, 1))  # straight, left, right
+RAYS = ((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1))  # clockwise from up
+
+
+def _cells(env, positions):
+    return [(x // env.grid_size, y // env.grid_size) for x, y in positions]
+
+
+def _on_board(env, x, y):
+    return 0 <= x < env.grid_width and 0 <= y < env.grid_height
+
+
+def _safe_actions(env):
+    head = _cells(env, [env.snake_pos])[0]
+    body = set(_cells(env, env.snake_body[:-1]))
+    actions = []
+    for action in range(4):
+        if action == (1, 0, 3, 2)[env.direction]:
+            continue
+        x, y = head[0] + MOVES[action][0], head[1] + MOVES[action][1]
+        if _on_board(env, x, y) and (x, y) not in body:
+            actions.append(action)
+    return actions
+
+
+def _cycle_action(env):
+    """Follows a cycle through every cell of the board, so the snake can fill it.
+
+    Down column 0, then up the board a row at a time: rows of the height's parity go right, the others
+    left (from column 1), and the top row left all the way back to column 0.
+    """
+    x, y = _cells(env, [env.snake_pos])[0]
+    width, height = env.grid_width, env.grid_height
+    if y == 0:
+        return 2 if x > 0 else 1
+    if x == 0:
+        return 1 if y < height - 1 else 3
+    if (height - 1 - y) % 2 == 0:
+        return 3 if x < width - 1 else 0
+    return 2 if x > 1 else 0
+
+
+def _episodes(env, seed, steps, follow_cycle):
+    """Yields whether the episode ended after every move of random episodes; the snake follows the cycle with probability
+    `follow_cycle` and otherwise takes a random move that doesn't end the episode."""
+    rng = random.Random(seed)
+    env.reset(seed=seed)
+    # Eating the food with every spawn cell covered would never find a free one
+    longest = (env.grid_width - 1) * (env.grid_height - 1) - 2
+    for _ in range(steps):
+        action = _cycle_action(env)
+        safe = _safe_actions(env)
+        if safe and (rng.random() >= follow_cycle or action not in safe):
+            action = rng.choice(safe)
+        _, _, terminated, truncated, _ = env.step(action)
+        yield terminated
+        if terminated or truncated or len(env.snake_body) >= longest:
+            env.reset(seed=rng.randrange(2 ** 31))
+
+
+def _bfs_areas(env):
+    """Free cells reachable from the cell the head moves to, straight, left and right, by flood fill."""
+    body = _cells(env, env.snake_body)
+    head, tail, food = body[0], body[-1], _cells(env, [env.food_pos])[0]
+    areas = []
+    for turn in TURNS[env.direction]:
+        start = head[0] + MOVES[turn][0], head[1] + MOVES[turn][1]
+        # The tail moves out of the way unless the move eats the food
+        blocked = set(body) if start == food else set(body[:-1])
+        if not _on_board(env, *start) or start in blocked:
+            areas.append(0)
+            continue
+        seen, queue = {start}, deque([start])
+        while queue:
+            x, y = queue.popleft()
+            for dx, dy in MOVES:
+                n = (x + dx, y + dy)
+                if _on_board(env, *n) and n not in blocked and n not in seen:
+                    seen.add(n)
+                    queue.append(n)
+        areas.append(len(seen))
+    return areas
+
+
+@pytest.mark.parametrize("frame_size,follow_cycle,steps", [
+    ((240, 160), 0.0, 4000),   # random moves
+    ((120, 80), 0.7, 20000),   # a small board, where the body cuts it up often
+    ((120, 80), 1.0, 12000),   # the small board filled up to full length
+], ids=["random", "small_board", "full_length"])
+def test_reachable_space_matches_flood_fill(frame_size, follow_cycle, steps):
+    env = SnakeEnv(frame_size_x=frame_size[0], frame_size_y=frame_size[1], reachable_space=True,
+                   max_steps=100_000)
+    longest = 0
+    for terminated in _episodes(env, 0, steps, follow_cycle):
+        if terminated:
+            continue
+        area = env.grid_width * env.grid_height
+        assert [round(r * area) for r in env._reachable()] == _bfs_areas(env)
+        longest = max(longest, len(env.snake_body))
+    if follow_cycle == 1.0:
+        assert longest >= (env.grid_width - 1) * (env.grid_height - 1) - 2
+
+
+def _walked_rays(env):
+    """The obs_mode="rays" observation, walking each ray cell by cell."""
+    body = set(_cells(env, env.snake_body))
+    (x, y), food = _cells(env, [env.snake_pos])[0], _cells(env, [env.food_pos])[0]
+    length = max(env.grid_width, env.grid_height)
+    walls, hits, foods = [], [], []
+    for dx, dy in RAYS:
+        k, hit, at_food = 1, 0, 0
+        while _on_board(env, x + k * dx, y + k * dy):
+            cell = (x + k * dx, y + k * dy)
+            hit = hit or (k if cell in body else 0)
+            at_food = at_food or (k if cell == food else 0)
+            k += 1
+        walls.append(k)
+        hits.append(hit)
+        foods.append(at_food)
+    features = [d / length for d in walls]
+    features += [d / length if d else 1.0 for d in hits + foods]
+    features += [float(env.direction == k) for k in range(4)]
+    features += [(env.food_pos[0] - env.snake_pos[0]) / env.frame_size_x + 0.5,
+                 (env.food_pos[1] - env.snake_pos[1]) / env.frame_size_y + 0.5]
+    return np.array(features, dtype=np.float32)
+
+
+@pytest.mark.parametrize("frame_size,follow_cycle", [((720, 480), 0.0), ((120, 80), 0.7)],
+                         ids=["default_board", "small_board"])
+def test_rays_match_walking_them(frame_size, follow_cycle):
+    env = SnakeEnv(frame_size_x=frame_size[0], frame_size_y=frame_size[1], obs_mode="rays", max_steps=100_000)
+    for _ in _episodes(env, 1, 10000, follow_cycle):
+        if not _on_board(env, *_cells(env, [env.snake_pos])[0]):
+            continue  # off the board there are no rays to walk
+        np.testing.assert_array_equal(env._get_obs(), _walked_rays(env))
+
+
+@pytest.mark.parametrize("reachable_space", [False, True])
+def test_snake_env_batch_matches_scalar_batch(reachable_space):
+    def make_env():
+        return SnakeEnv(frame_size_x=240, frame_size_y=160, obs_mode="rays", reachable_space=reachable_space,
+                        max_steps=300)
+
+    n = 6
+    batches = [SnakeEnvBatch(make_env, n), ScalarEnvBatch(make_env, n)]
+    rng = np.random.default_rng(0)
+    for batch in batches:
+        for i in range(n):
+            batch.reset_slot(i, 100 + i)
+    next_seed = 100 + n
+    for _ in range(2000):
+        actions = rng.integers(4, size=n)
+        # Some slots sit a step out, as finished episodes do in run_lockstep
+        active = rng.random(n) < 0.9
+        out = [[np.copy(x) for x in batch.step(actions, active)[:4]] for batch in batches]
+        for a, b in zip(*out):
+            np.testing.assert_array_equal(a, b)
+        for i in np.flatnonzero(active & (out[0][2] | out[0][3])):
+            for batch in batches:
+                batch.reset_slot(i, next_seed)
+            next_seed += 1
+    np.testing.assert_array_equal(batches[0]._obs, batches[1]._obs)
@@ -0,0 +1,100 @@
+"""Episode tapes: action packing, save/load, seeking through checkpoints and verify."""
+import numpy as np
+import pytest
+
+from rl_common.tapes import Replay, Tape, env_state, pack_actions, record, unpack_actions, verify
+from rl_common.tournament import load_game
+
+CHECKPOINT_EVERY = 16
+
+
+class RandomPolicy:
+    """Seeded random actions; for snake, away from danger when there is a safe move."""
+
+    def __init__(self, env, seed: int):
+        self.env = env
+        self.rng = np.random.default_rng(seed)
+
+    def predict(self, obs, deterministic=True):
+        space = self.env.action_space
+        if not hasattr(space, "n"):
+            return self.rng.uniform(space.low, space.high).astype(np.float32), None
+        safe = [a for a in range(space.n) if not self.env._is_danger(a)]
+        return int(self.rng.choice(safe or range(space.n))), None
+
+
+def _play(game, env_config, seed, policy_seed):
+    """Actions, env state after every step, total reward and score of an episode, played without a tape."""
+    env = load_game(game).make_env(seed=seed, **env_config)
+    policy = RandomPolicy(env, policy_seed)
+    obs, _ = env.reset()
+    states, total = [env_state(env)], 0.0
+    done = trunc = False
+    while not (done or trunc):
+        action, _ = policy.predict(obs)
+        obs, reward, done, trunc, _ = env.step(action)
+        total += reward
+        states.append(env_state(env))
+    return states, total, env.score
+
+
+@pytest.mark.parametrize("game,env_config", [
+    ("snake", {"reward_mode": "survival", "max_steps": 300, "obs_mode": "features"}),
+    ("snake", {"reward_mode": "length", "max_steps": 300, "obs_mode": "rays", "reachable_space": True}),
+    ("aim_trainer", {"reward_mode": "accuracy", "max_steps": 120}),
+], ids=["snake_features", "snake_rays", "aim_trainer"])
+def test_round_trip(game, env_config, tmp_path):
+    seed = 1234
+    states, total, score = _play(game, env_config, seed, policy_seed=7)
+    assert len(states) > 3 * CHECKPOINT_EVERY, "episode too short to have checkpoints"
+
+    env = load_game(game).make_env(seed=seed, **env_config)
+    tape = record(RandomPolicy(env, 7), env, game, env_config, seed, CHECKPOINT_EVERY,
+                  result={"score": score, "reward": total}, model="random")
+    assert len(tape) == len(states) - 1
+    path = str(tmp_path / "episode.tape")
+    tape.save(path)
+    loaded = Tape.load(path)
+
+    assert (loaded.game, loaded.env_class, loaded.env_config, loaded.seed, loaded.model, loaded.result) == \
+        (game, tape.env_class, env_config, seed, "random", tape.result)
+    np.testing.assert_array_equal(loaded.actions, tape.actions)
+    if game == "aim_trainer":
+        assert loaded.actions.dtype == np.float32
+    assert loaded.checkpoint_steps == list(range(CHECKPOINT_EVERY, len(tape), CHECKPOINT_EVERY))
+    assert verify(loaded) == []
+
+    replay = Replay(loaded, lambda s: load_game(game).make_env(seed=s, **env_config))
+    # Forwards from a checkpoint, backwards to the start, backwards past one, and the end
+    for step in (CHECKPOINT_EVERY + 5, 3, 2 * CHECKPOINT_EVERY, CHECKPOINT_EVERY + 1, len(tape) - 1, 0,
+                 len(tape)):
+        replay.seek(step)
+        assert replay.t == step
+        assert env_state(replay.env) == states[step]
+    assert replay.done or replay.trunc
+    assert np.isclose(replay.total_reward, total)
+
+
+def test_tampered_tape_fails_verify(tmp_path):
+    env_config = {"reward_mode": "survival", "max_steps": 300, "obs_mode": "features"}
+    states, total, score = _play("snake", env_config, 99, policy_seed=3)
+    env = load_game("snake").make_env(seed=99, **env_config)
+    tape = record(RandomPolicy(env, 3), env, "snake", env_config, 99, CHECKPOINT_EVERY,
+                  result={"score": score + 1, "reward": total})
+    assert any("score" in problem for problem in verify(tape))
+
+
+@pytest.mark.parametrize("n", [2, 3, 4, 5, 16, 256])
+@pytest.mark.parametrize("steps", [0, 1, 3, 4, 5, 1001])
+def test_discrete_packing(n, steps):
+    space = {"type": "discrete", "n": n}
+    actions = np.random.default_rng(n + steps).integers(n, size=steps)
+    np.testing.assert_array_equal(unpack_actions(pack_actions(actions, space), space, steps), actions)
+
+
+def test_snake_actions_take_two_bits():
+    import zlib
+
+    space = {"type": "discrete", "n": 4}
+    actions = np.random.default_rng(0).integers(4, size=1000)
+    assert len(zlib.decompress(pack_actions(actions, space))) == 250